@@ -3,17 +3,28 @@ import pandas as pd
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime, timedelta
+import io
+import os
 import time
-import re
-import yfinance as yf
+import random
+import threading
 import KIS_API_Manager as kis
+import Portfolio_Engine as engine
+import Portfolio_Metrics as metrics_engine
+import Portfolio_History as history_engine
+import Portfolio_Returns as returns_engine
+import Portfolio_TaxLots as tax_engine
+import Sheet_DB_Manager as db
+import Kakao_Parser as kakao
+import Market_Data_Manager as market
+import KIS_Stream_Manager as kis_stream
+import Perf_Monitor as perf
 
 # -------------------------------------------------------------------
 # [1] 설정 & 스타일
 # -------------------------------------------------------------------
 st.set_page_config(page_title="Investment Command", layout="wide", page_icon="🏦")
 
-if 'price_cache' not in st.session_state: st.session_state['price_cache'] = {}
 if 'last_update' not in st.session_state: st.session_state['last_update'] = None
 
 THEME_BG = "#131314"
@@ -92,371 +103,803 @@ def safe_float(val):
     try: return float(str(val).replace(',', '').strip())
     except: return 0.0
 
-@st.cache_data
-def load_data():
-    client = get_gsheet_client()
-    sh = client.open("Investment_Dashboard_DB")
+@st.cache_resource
+def get_spreadsheet():
+    # 스프레드시트 핸들은 프로세스 전체에서 재사용 (open 은 Drive 검색 + 메타데이터 조회)
+    return get_gsheet_client().open("Investment_Dashboard_DB")
+
+LOG_COLUMNS = {
+    "Trade_Log": ['Date', 'Order_ID', 'Ticker', 'Name', 'Type', 'Qty', 'Price_USD', 'Ex_Avg_Rate', 'Note', 'Source'],
+    "Money_Log": ['Date', 'Order_ID', 'Type', 'Ticker', 'KRW_Amount', 'USD_Amount', 'Ex_Rate', 'Avg_Rate', 'Balance', 'Note', 'Source'],
+    "Domestic_Log": ['Date', 'Type', 'Ticker', 'Name', 'Qty', 'Price_KRW', 'Amount_KRW', 'Note'],
+}
+LOG_NUMERIC_COLUMNS = {
+    "Trade_Log": ['Qty', 'Price_USD', 'Ex_Avg_Rate'],
+    "Money_Log": ['KRW_Amount', 'USD_Amount', 'Ex_Rate', 'Avg_Rate', 'Balance'],
+    "Domestic_Log": ['Qty', 'Price_KRW', 'Amount_KRW'],
+}
+
+def _clean_log_frame(df, sheet_name):
+    df.columns = df.columns.astype(str).str.strip()
+    for c in LOG_NUMERIC_COLUMNS[sheet_name]:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c].astype(str).str.replace(',', ''), errors='coerce').fillna(0)
+    return df
+
+def _download_data():
+    sh = get_spreadsheet()
+    # 로컬 스냅샷과 증분 동기화 (변경 없으면 디스크만 읽음)
+    with perf.timed("sheets.sync"):
+        snapshot = db.sync_snapshot(sh, list(LOG_COLUMNS))
     
-    def get_safe_df(sheet_name, default_columns):
+    def get_safe_df(sheet_name):
         try:
-            ws = sh.worksheet(sheet_name)
-            records = ws.get_all_records()
-            if not records:
-                return pd.DataFrame(columns=default_columns)
-            df = pd.DataFrame(records)
-            df.columns = df.columns.astype(str).str.strip()
-            return df
+            df = db.snapshot_frame(*snapshot[sheet_name])
+            if df is None:
+                return pd.DataFrame(columns=LOG_COLUMNS[sheet_name])
+            return _clean_log_frame(df, sheet_name)
         except Exception:
-            return pd.DataFrame(columns=default_columns)
-
-    df_trade = get_safe_df("Trade_Log", ['Date', 'Order_ID', 'Ticker', 'Name', 'Type', 'Qty', 'Price_USD', 'Ex_Avg_Rate', 'Note', 'Source'])
-    df_money = get_safe_df("Money_Log", ['Date', 'Order_ID', 'Type', 'Ticker', 'KRW_Amount', 'USD_Amount', 'Ex_Rate', 'Avg_Rate', 'Balance', 'Note', 'Source'])
-    df_domestic = get_safe_df("Domestic_Log", ['Date', 'Type', 'Ticker', 'Name', 'Qty', 'Price_KRW', 'Amount_KRW', 'Note'])
-
-    cols_money = ['KRW_Amount', 'USD_Amount', 'Ex_Rate', 'Avg_Rate', 'Balance']
-    for c in cols_money:
-        if c in df_money.columns: 
-            df_money[c] = pd.to_numeric(df_money[c].astype(str).str.replace(',', ''), errors='coerce').fillna(0)
-            
-    cols_trade = ['Qty', 'Price_USD', 'Ex_Avg_Rate']
-    for c in cols_trade:
-        if c in df_trade.columns: 
-            df_trade[c] = pd.to_numeric(df_trade[c].astype(str).str.replace(',', ''), errors='coerce').fillna(0)
-
-    cols_dom = ['Qty', 'Price_KRW', 'Amount_KRW']
-    for c in cols_dom:
-        if c in df_domestic.columns: 
-            df_domestic[c] = pd.to_numeric(df_domestic[c].astype(str).str.replace(',', ''), errors='coerce').fillna(0)
-
-    return df_trade, df_money, df_domestic
-
-def get_realtime_rate():
-    try:
-        if 'fx_rate' not in st.session_state:
-            data = yf.Ticker("KRW=X").history(period="1d")
-            st.session_state['fx_rate'] = data['Close'].iloc[-1] if not data.empty else 1450.0
-        return st.session_state['fx_rate']
-    except: return 1450.0
+            return pd.DataFrame(columns=LOG_COLUMNS[sheet_name])
+
+    with perf.timed("sheets.frames"):
+        return tuple(get_safe_df(name) for name in LOG_COLUMNS)
+
+@st.cache_resource
+def _ledger():
+    # 프로세스 공용 원장. 저장 시 새 행만 덧붙이고 version 을 올림 (파생 값은 version 기준으로 다시 계산)
+    # * frames 는 여러 세션이 공유하므로 읽기 전용 (컬럼 추가/수정은 복사본에서)
+    return {'frames': None, 'version': 0, 'derived': {}, 'lock': threading.Lock()}
+
+def load_data():
+    ledger = _ledger()
+    with ledger['lock']:
+        if ledger['frames'] is None:
+            ledger['frames'] = _download_data()
+            ledger['version'] += 1
+            ledger['derived'] = {}
+        return ledger['frames']
+
+def reset_ledger():
+    # 새로고침 버튼: 다음 load_data 에서 시트 동기화부터 다시
+    ledger = _ledger()
+    with ledger['lock']:
+        ledger['frames'], ledger['derived'] = None, {}
+
+def append_ledger_rows(sheet_name, rows):
+    # 시트에 추가한 행을 캐시된 DataFrame 끝에 그대로 덧붙임 (시트 재다운로드 없음)
+    ledger = _ledger()
+    with ledger['lock']:
+        if ledger['frames'] is None or not rows: return
+        frames = list(ledger['frames'])
+        i = list(LOG_COLUMNS).index(sheet_name)
+        cols = list(frames[i].columns)
+        # 시트에서 다시 읽을 때와 같은 값이 되도록 문자열 -> numericise 경로를 그대로 탐
+        raw = db._pad([["" if v is None else str(v) for v in row] for row in rows], len(cols))
+        new_df = _clean_log_frame(db.snapshot_frame(cols, raw), sheet_name)
+        frames[i] = new_df if frames[i].empty else pd.concat([frames[i], new_df], ignore_index=True)
+        ledger['frames'] = tuple(frames)
+        ledger['version'] += 1
+        ledger['derived'] = {}
+
+def ledger_cached(key, fn):
+    # 원장이 바뀌기 전까지 재사용하는 파생 값 (저장 시 이것만 무효화, 시세/환율 캐시는 그대로)
+    ledger = _ledger()
+    version = ledger['version']
+    hit = ledger['derived'].get(key)
+    if hit is not None and hit[0] == version:
+        perf.count("ledger_cache.hit")
+        return hit[1]
+    perf.count("ledger_cache.miss")
+    # fn 은 락 밖에서 실행: 캐시된 프레임은 읽기 전용이고 저장은 새 튜플로 교체하므로 다른 세션과 겹쳐도 안전
+    value = fn()
+    with ledger['lock']:
+        if ledger['version'] == version: ledger['derived'][key] = (version, value)
+    return value
+
+def compute_timeline(df_trade, df_money, df_domestic):
+    # 시트를 전체로 다시 받은 뒤(앞쪽 행 수정/삭제 가능)에는 체크포인트 앞부분 전체를 한 번 대조, 그 외에는 끝 행 확인 + 새 행만 처리
+    return engine.process_timeline(df_trade, df_money, df_domestic, DOMESTIC_TICKER_MAP,
+                                   checkpoint_path=engine.CHECKPOINT_PATH, verify_since=db.last_full_sync(list(LOG_COLUMNS)))
+
+def get_realtime_rate(fallback_rate=None):
+    # 프로세스 공용 환율 캐시 (TTL 경과 시 백그라운드 갱신, 실패 시 마지막 정상값)
+    rate = market.get_fx_rate()
+    return rate if rate else fallback_rate
 
 # -------------------------------------------------------------------
-# [4] 엔진: 달러 저수지 & 원화 자산 통합 프로세싱
+# [4] 시트 일괄 저장 (시트별 append_rows 1회 + 할당량 초과 시 재시도)
 # -------------------------------------------------------------------
-def process_timeline(df_trade, df_money, df_domestic):
-    # 1. 달러 저수지 처리
-    df_money['Source'] = 'Money'
-    df_trade['Source'] = 'Trade'
-    
+SHEET_WRITE_MAX_RETRIES = 5
+SHEET_WRITE_BATCH_ROWS = 5000   # 대량 가져오기 시 append_rows 1회당 최대 행 수
+RETRYABLE_STATUS = (429, 500, 502, 503)
+
+def append_rows_with_retry(ws, rows):
+    for attempt in range(SHEET_WRITE_MAX_RETRIES + 1):
+        try:
+            return ws.append_rows(rows)
+        except gspread.exceptions.APIError as e:
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            if status not in RETRYABLE_STATUS or attempt == SHEET_WRITE_MAX_RETRIES: raise
+            time.sleep(min(2 ** attempt, 32) + random.random())
+
+def log_indexes(df_trade, df_money, df_domestic):
+    # 시트별 내용 해시 색인 {시트명: {해시: 건수}} (로컬 색인에서 새로 늘어난 행만 해시)
+    with perf.timed("hash_index.sync"):
+        return db.sync_hash_index({"Trade_Log": df_trade, "Money_Log": df_money, "Domestic_Log": df_domestic})
+
+def _drop_indexed(sheet_name, rows, index):
+    # 색인에 남은 건수만큼 같은 내용의 행을 제외
+    remaining = dict(index)
+    kept = []
+    for row, h in zip(rows, map(str, db.row_hashes(sheet_name, rows))):
+        if remaining.get(h, 0) > 0:
+            remaining[h] -= 1
+            continue
+        kept.append(row)
+    return kept
+
+def build_sheet_rows(parsed_items, next_id, indexes=None):
+    # 파싱 결과 -> {시트명: [행, ...]} (Order_ID 는 기존과 같은 순서로 부여)
+    # indexes({시트명: {해시: 건수}}) 가 있으면 이미 있는 행은 제외 (Order_ID 도 소비하지 않음)
+    rows = {"Trade_Log": [], "Money_Log": [], "Domestic_Log": []}
+    id_rows = []
+    for item in parsed_items:
+        if item["Category"] == "Trade":
+            rows["Trade_Log"].append([ item["Date"], None, str(item["Ticker"]), str(item["Ticker"]), str(item["Type"]), int(item["Qty"]), float(item["Price"]), "", item["Memo"] ])
+            id_rows.append(rows["Trade_Log"][-1])
+        elif item["Category"] == "Domestic_Trade":
+            rows["Domestic_Log"].append([ item["Date"], str(item["Type"]), str(item["Ticker"]), "-", int(item["Qty"]), float(item["Price"]), float(item["Qty"]*item["Price"]), item["Memo"] ])
+        elif item["Category"] == "Dividend":
+            rows["Money_Log"].append([ item["Date"], None, "Dividend", str(item["Ticker"]), 0, float(item["Price"]), 0, "", "", item["Memo"] ])
+            id_rows.append(rows["Money_Log"][-1])
+        elif item["Category"] == "Domestic_Dividend":
+            rows["Domestic_Log"].append([ item["Date"], "Dividend", str(item["Ticker"]), "-", 0, 0, float(item["Amount"]), item["Memo"] ])
+        elif item["Category"] == "Exchange":
+            rows["Money_Log"].append([ item["Date"], None, "KRW_to_USD", "-", float(item["Amount"]), float(item["Price"]), float(item["Amount"]/item["Price"] if item["Price"]>0 else 0), "", "", item["Memo"] ])
+            id_rows.append(rows["Money_Log"][-1])
+
+    for name, index in (indexes or {}).items():
+        if rows.get(name): rows[name] = _drop_indexed(name, rows[name], index)
+
+    kept = {id(row) for name in ("Trade_Log", "Money_Log") for row in rows[name]}
+    for row in id_rows:
+        if id(row) in kept:
+            row[1] = int(next_id)
+            next_id += 1
+    return rows
+
+def write_sheet_rows(sheet_instance, rows_by_sheet):
+    # 워크시트 목록 1회 조회 후 시트별로 SHEET_WRITE_BATCH_ROWS 단위 추가. (성공 {시트: 건수}, 실패 {시트: 에러}) 반환
+    rows_by_sheet = {name: rows for name, rows in rows_by_sheet.items() if rows}
+    written, failed = {}, {}
+    if not rows_by_sheet: return written, failed
+    ws_map = {ws.title: ws for ws in sheet_instance.worksheets()}
+    for name, rows in rows_by_sheet.items():
+        try:
+            if name not in ws_map: raise KeyError(f"워크시트 없음: {name}")
+            for i in range(0, len(rows), SHEET_WRITE_BATCH_ROWS):
+                batch = rows[i:i + SHEET_WRITE_BATCH_ROWS]
+                with perf.timed("sheets.append"):
+                    append_rows_with_retry(ws_map[name], batch)
+                perf.count("rows.written", len(batch))
+                db.add_to_hash_index(name, batch)
+                append_ledger_rows(name, batch)
+                written[name] = written.get(name, 0) + len(batch)
+        except Exception as e:
+            failed[name] = e
+    return written, failed
+
+def next_order_id(df_trade, df_money):
+    max_id = max(pd.to_numeric(df_trade['Order_ID']).max(), pd.to_numeric(df_money['Order_ID']).max())
+    return int(max_id) + 1 if not pd.isna(max_id) else 1
+
+# -------------------------------------------------------------------
+# [4.5] KIS 체결내역 동기화 (백그라운드 조회 -> 기존 기록과 정확한 키로 대조 -> 새 체결은 자동 추가, 애매한 것만 확인)
+# -------------------------------------------------------------------
+KIS_SYNC_MEMO = "KIS동기화"
+KIS_SYNC_OVERLAP_DAYS = 7      # 결제 지연분 대비 마지막 동기화일 이전부터 다시 조회
+KIS_SYNC_DEFAULT_DAYS = 90     # Trade_Log 가 비어 있을 때 조회 시작 범위
+KIS_SYNC_INTERVAL_SEC = 600    # 자동 조회 최소 간격
+KIS_SYNC_REVIEW_DAYS = 5       # 키가 맞지 않는 같은 종목/방향 기록이 이 일수 안에 있으면 자동 추가하지 않고 확인 대상으로
+KIS_PRICE_TICK = 0.01          # 체결가 비교 단위 (미국 주식 호가 단위)
+
+def kis_sync_start_date(df_trade, today=None):
+    # KIS동기화 행의 마지막 날짜(없으면 전체 마지막 날짜) - 겹침 일수
+    today = today or datetime.now()
+    if df_trade.empty: return today - timedelta(days=KIS_SYNC_DEFAULT_DAYS)
+    # 날짜만/시각 포함 행이 섞여 있으므로 첫 행 형식 추론에 맡기지 않음 (엔진과 같은 변환)
+    try: dates = engine._to_datetime(df_trade['Date'])
+    except (ValueError, TypeError): dates = pd.to_datetime(df_trade['Date'].astype(str), format='mixed', errors='coerce')
+    synced = dates[df_trade['Note'].astype(str) == KIS_SYNC_MEMO] if 'Note' in df_trade.columns else dates[:0]
+    last = synced.max() if synced.notna().any() else dates.max()
+    if pd.isna(last): return today - timedelta(days=KIS_SYNC_DEFAULT_DAYS)
+    return min(last.to_pydatetime(), today) - timedelta(days=KIS_SYNC_OVERLAP_DAYS)
+
+def _trade_key(day, ticker, side, qty, price):
+    # 체결 대조 키: (매매일, 종목, 매수/매도, 수량, 호가 단위로 반올림한 단가)
+    return (day, ticker, side, int(round(qty)), int(round(price / KIS_PRICE_TICK)))
+
+def kis_trade_items(kis_items):
+    # KIS 체결 -> 파싱 결과와 같은 형식 (체결 한 건씩, 해외 체결은 카톡 파싱과 같은 23:30 표기)
+    # * 날짜는 결제일(dt)이 아닌 매매일(trad_dt) 기준
+    for item in kis_items:
+        try:
+            day = datetime.strptime(item.get('trad_dt') or item['dt'], "%Y%m%d")
+            qty, price = int(float(item['ccld_qty'])), float(item['ft_ccld_unpr3'])
+            ticker, side = str(item['pdno']).strip().upper(), "Sell" if item['sll_buy_dvsn_cd'] == '01' else "Buy"
+        except: continue
+        if qty <= 0: continue
+        yield {
+            "Category": "Trade", "Date": day.strftime("%Y-%m-%d 23:30:00"),
+            "Ticker": ticker, "Type": side, "Qty": qty, "Price": round(price, 4), "Amount": 0, "Memo": KIS_SYNC_MEMO
+        }
+
+def kis_sync_items(kis_items, df_trade):
+    # KIS 체결 -> (자동 추가, 확인 필요)
+    # 1) 기존 행과 키가 같은 체결은 이미 기록된 것으로 제외
+    # 2) 같은 날 남은 체결 묶음이 남은 기존 행 묶음과 총수량/평균단가가 같으면 제외 (카톡 부분 체결 vs KIS 합산)
+    # 3) 남은 체결: 같은 종목/방향의 대조 안 된 기존 행이 가까이 있으면 확인 필요, 없으면 자동 추가
+    existing = []
+    if not df_trade.empty:
+        try: dates = engine._to_datetime(df_trade['Date'])
+        except (ValueError, TypeError): dates = pd.to_datetime(df_trade['Date'].astype(str), format='mixed', errors='coerce')
+        log = pd.DataFrame({'day': dates.dt.normalize(), 'ticker': df_trade['Ticker'].astype(str).str.strip().str.upper(),
+                            'side': df_trade['Type'].astype(str).str.strip().str.capitalize(),
+                            'qty': pd.to_numeric(df_trade['Qty'], errors='coerce'), 'price': pd.to_numeric(df_trade['Price_USD'], errors='coerce')})
+        log = log[log['day'].notna() & (log['qty'] > 0) & log['price'].notna()]
+        existing = list(log.itertuples(index=False, name=None))
+
+    unmatched = {}
+    for day, ticker, side, qty, price in existing:
+        unmatched.setdefault(_trade_key(day, ticker, side, qty, price), []).append((day, ticker, side, qty, price))
+    left = []
+    for item in kis_trade_items(kis_items):
+        day = pd.Timestamp(item["Date"]).normalize()
+        rows = unmatched.get(_trade_key(day, item["Ticker"], item["Type"], item["Qty"], item["Price"]))
+        if rows: rows.pop()
+        else: left.append((day, item))
+
+    # 남은 기존 행 (종목, 방향) -> {날짜: [(수량, 단가), ...]}
+    rest = {}
+    for rows in unmatched.values():
+        for day, ticker, side, qty, price in rows:
+            rest.setdefault((ticker, side), {}).setdefault(day, []).append((qty, price))
+    groups = {}
+    for day, item in left:
+        groups.setdefault((day, item["Ticker"], item["Type"]), []).append(item)
+
+    def _total(fills):
+        qty = sum(q for q, _ in fills)
+        return _trade_key(None, None, None, qty, sum(q * p for q, p in fills) / qty)
+
+    auto, review = [], []
+    for (day, ticker, side), items in groups.items():
+        pool = rest.get((ticker, side), {})
+        if pool.get(day) and _total([(it["Qty"], it["Price"]) for it in items]) == _total(pool[day]):
+            pool.pop(day)
+            continue
+        near = any(abs((d - day).days) <= KIS_SYNC_REVIEW_DAYS for d in pool)
+        (review if near else auto).extend(items)
+    return auto, review
+
+@st.cache_resource
+def _kis_sync_job():
+    # 프로세스 공용 KIS 조회 작업 (스크립트 스레드를 막지 않도록 백그라운드에서 조회 + 자동 추가, 결과는 다음 재실행에서 사용)
+    return {'lock': threading.Lock(), 'running': False, 'started': 0.0, 'fetched': None, 'items': [], 'error': None, 'written': 0, 'failed': {}}
+
+def apply_kis_items(sheet_instance, kis_items):
+    # 최신 원장과 대조해 키가 겹치지 않는 새 체결만 바로 추가 -> (written, failed)
+    df_trade, df_money, df_domestic = load_data()
+    auto, _ = kis_sync_items(kis_items, df_trade)
+    rows = build_sheet_rows(auto, next_order_id(df_trade, df_money), log_indexes(df_trade, df_money, df_domestic))
+    with perf.timed("kis.sync"):
+        return write_sheet_rows(sheet_instance, rows)
+
+def _fetch_kis_items(job, sheet_instance, start, end):
+    written, failed = {}, {}
     try:
-        df_money['Date_Obj'] = pd.to_datetime(df_money['Date'].astype(str))
-        df_trade['Date_Obj'] = pd.to_datetime(df_trade['Date'].astype(str))
-    except: pass
-
-    timeline = pd.concat([df_money, df_trade], ignore_index=True)
-    if 'Order_ID' not in timeline.columns: timeline['Order_ID'] = 0
-    timeline['Order_ID'] = pd.to_numeric(timeline['Order_ID'], errors='coerce').fillna(999999)
-    timeline = timeline.sort_values(by=['Date_Obj', 'Order_ID'])
-    
-    current_balance = 0.0
-    current_avg_rate = 0.0
-    pure_exch_krw_sum = 0.0
-    pure_exch_usd_sum = 0.0
-    
-    portfolio = {} 
-    
-    for idx, row in timeline.iterrows():
-        source = row['Source']
-        t_type = str(row.get('Type', '')).lower()
-        
-        if source == 'Money':
-            usd_amt = safe_float(row.get('USD_Amount'))
-            krw_amt = safe_float(row.get('KRW_Amount'))
-            ticker = str(row.get('Ticker', '')).strip()
-            if ticker == '' or ticker == '-' or ticker == 'nan': ticker = 'Cash'
-            
-            if 'dividend' in t_type or '배당' in t_type:
-                if ticker != 'Cash':
-                    if ticker not in portfolio: portfolio[ticker] = {'qty':0, 'invested_krw':0, 'invested_usd':0, 'realized_krw':0, 'accum_div_usd':0, 'accum_div_krw':0, 'is_domestic':False, 'raw_ticker':ticker}
-                    portfolio[ticker]['accum_div_usd'] += usd_amt
-                if current_balance + usd_amt > 0: current_avg_rate = (current_balance * current_avg_rate) / (current_balance + usd_amt)
-            else:
-                if current_balance + usd_amt > 0: current_avg_rate = ((current_balance * current_avg_rate) + krw_amt) / (current_balance + usd_amt)
-                if 'krw_to_usd' in t_type or '환전' in t_type:
-                    pure_exch_krw_sum += krw_amt; pure_exch_usd_sum += usd_amt
-            current_balance += usd_amt
-
-        elif source == 'Trade':
-            qty = safe_float(row.get('Qty'))
-            price = safe_float(row.get('Price_USD'))
-            amount = qty * price
-            ticker = str(row.get('Ticker', '')).strip()
-            
-            if ticker not in portfolio: portfolio[ticker] = {'qty':0, 'invested_krw':0, 'invested_usd':0, 'realized_krw':0, 'accum_div_usd':0, 'accum_div_krw':0, 'is_domestic':False, 'raw_ticker':ticker}
-            
-            if 'buy' in t_type or '매수' in t_type:
-                current_balance -= amount
-                ex_rate_db = safe_float(row.get('Ex_Avg_Rate'))
-                rate_to_use = ex_rate_db if ex_rate_db > 0 else current_avg_rate
-                portfolio[ticker]['qty'] += qty
-                portfolio[ticker]['invested_krw'] += (amount * rate_to_use)
-                portfolio[ticker]['invested_usd'] += amount 
-                
-            elif 'sell' in t_type or '매도' in t_type:
-                current_balance += amount
-                if portfolio[ticker]['qty'] > 0:
-                    unit_krw = portfolio[ticker]['invested_krw'] / portfolio[ticker]['qty']
-                    unit_usd = portfolio[ticker]['invested_usd'] / portfolio[ticker]['qty']
-                    portfolio[ticker]['realized_krw'] += (amount * current_avg_rate) - (qty * unit_krw)
-                    portfolio[ticker]['qty'] -= qty
-                    portfolio[ticker]['invested_krw'] -= (qty * unit_krw)
-                    portfolio[ticker]['invested_usd'] -= (qty * unit_usd)
-
-    # 2. 원화 자산(Domestic_Log) 처리
-    domestic_cash = 0.0
-    for idx, row in df_domestic.iterrows():
-        t_type = str(row.get('Type', '')).lower()
-        raw_ticker = str(row.get('Ticker', '')).strip()
-        ticker = DOMESTIC_TICKER_MAP.get(raw_ticker, raw_ticker) 
-        
-        qty = safe_float(row.get('Qty'))
-        amount_krw = safe_float(row.get('Amount_KRW'))
-        
-        if ticker not in portfolio and raw_ticker and raw_ticker != '-':
-            portfolio[ticker] = {'qty':0, 'invested_krw':0, 'invested_usd':0, 'realized_krw':0, 'accum_div_usd':0, 'accum_div_krw':0, 'is_domestic':True, 'raw_ticker':raw_ticker}
-            
-        if 'buy' in t_type or '매수' in t_type:
-            portfolio[ticker]['qty'] += qty
-            portfolio[ticker]['invested_krw'] += amount_krw
-            domestic_cash -= amount_krw
-        elif 'sell' in t_type or '매도' in t_type:
-            if portfolio[ticker]['qty'] > 0:
-                unit_krw = portfolio[ticker]['invested_krw'] / portfolio[ticker]['qty']
-                portfolio[ticker]['realized_krw'] += amount_krw - (qty * unit_krw)
-                portfolio[ticker]['qty'] -= qty
-                portfolio[ticker]['invested_krw'] -= (qty * unit_krw)
-            domestic_cash += amount_krw
-        elif 'dividend' in t_type or '배당' in t_type:
-            if ticker in portfolio:
-                portfolio[ticker]['accum_div_krw'] += amount_krw
-            domestic_cash += amount_krw
-        elif 'deposit' in t_type or '입금' in t_type:
-            domestic_cash += amount_krw
-        elif 'withdraw' in t_type or '출금' in t_type:
-            domestic_cash -= amount_krw
-
-    pure_exch_rate = pure_exch_krw_sum / pure_exch_usd_sum if pure_exch_usd_sum > 0 else 0
-    return df_trade, df_money, current_balance, domestic_cash, current_avg_rate, pure_exch_rate, portfolio
+        items, error = list(kis.iter_trade_history(start, end, include_present=False)), None
+        written, failed = apply_kis_items(sheet_instance, items)
+    except Exception as e:
+        items, error = None, e
+        print(f"KIS Sync Error: {e}")
+    with job['lock']:
+        job['running'], job['error'] = False, error
+        job['written'], job['failed'] = sum(written.values()), failed
+        if items is not None: job['items'], job['fetched'] = items, time.time()
+
+def start_kis_fetch(sheet_instance, df_trade, force=False, wait=False):
+    # 조회 중이 아니고 간격이 지났으면 백그라운드 조회 시작 (wait=True 면 끝날 때까지 기다림)
+    job = _kis_sync_job()
+    with job['lock']:
+        if job['running'] or (not force and time.time() - job['started'] < KIS_SYNC_INTERVAL_SEC): return False
+        job['running'], job['started'] = True, time.time()
+    start = kis_sync_start_date(df_trade).strftime("%Y%m%d")
+    args = (job, sheet_instance, start, datetime.now().strftime("%Y%m%d"))
+    if wait: _fetch_kis_items(*args)
+    else: threading.Thread(target=_fetch_kis_items, args=args, daemon=True).start()
+    return True
+
+def kis_pending_rows(df_trade, df_money, df_domestic):
+    # 마지막 조회 결과 중 아직 원장에 없는 행 (확인 필요 + 자동 추가에 실패한 것) -> (조회 시각, {시트명: [행, ...]})
+    job = _kis_sync_job()
+    with job['lock']:
+        fetched, items = job['fetched'], job['items']
+    if fetched is None: return None, {}
+    def _rows():
+        with perf.timed("kis.pending"):
+            auto, review = kis_sync_items(items, df_trade)
+            return build_sheet_rows(review + auto, next_order_id(df_trade, df_money), log_indexes(df_trade, df_money, df_domestic))
+    return fetched, ledger_cached(("kis_pending", fetched), _rows)
+
+def render_kis_pending(sheet_instance, df_trade, df_money, df_domestic):
+    # 새 체결은 백그라운드에서 자동 추가됨. 기존 기록과 애매하게 겹치는 체결만 보여주고 확인을 받음
+    job = _kis_sync_job()
+    with job['lock']:
+        fetched, written, failed = job['fetched'], job['written'], job['failed']
+    if fetched is not None and st.session_state.get('kis_sync_notified') != fetched:
+        st.session_state['kis_sync_notified'] = fetched
+        if written: st.toast(f"🔗 KIS 체결내역 {written}건 자동 추가")
+        if failed: st.error(f"🚨 KIS 체결내역 자동 저장 실패: {', '.join(f'{n} ({e})' for n, e in failed.items())}")
+
+    fetched, rows = kis_pending_rows(df_trade, df_money, df_domestic)
+    if not rows.get("Trade_Log") or st.session_state.get('kis_sync_dismissed') == fetched: return
+    with st.expander(f"🔗 KIS 체결내역 중 기존 기록과 겹칠 수 있는 {len(rows['Trade_Log'])}건 (확인 후 추가)", expanded=True):
+        st.caption(f"같은 종목/방향의 기록이 {KIS_SYNC_REVIEW_DAYS}일 안에 있지만 날짜/수량/단가가 일치하지 않는 체결입니다.")
+        st.dataframe(pd.DataFrame([r[:7] + [r[8]] for r in rows["Trade_Log"]], columns=['Date', 'Order_ID', 'Ticker', 'Name', 'Type', 'Qty', 'Price_USD', 'Note']),
+                     hide_index=True, use_container_width=True)
+        c1, c2 = st.columns(2)
+        if c1.button("✅ Trade_Log 에 추가", key="kis_sync_apply", use_container_width=True):
+            with perf.timed("kis.sync"):
+                written, failed = write_sheet_rows(sheet_instance, rows)
+            if failed:
+                st.error(f"🚨 KIS 체결내역 저장 실패: {', '.join(f'{n} ({e})' for n, e in failed.items())}")
+            if written:
+                st.toast(f"🔗 KIS 체결내역 {sum(written.values())}건 추가")
+                if not failed: st.rerun()
+        if c2.button("무시", key="kis_sync_dismiss", use_container_width=True):
+            st.session_state['kis_sync_dismissed'] = fetched
+            st.rerun()
+
+# -------------------------------------------------------------------
+# [4.6] 카톡 내보내기 파일 일괄 가져오기 (메시지별 수신일 기준, 기존 행 중복 제외)
+# -------------------------------------------------------------------
+def import_kakaotalk_export(sheet_instance, lines, df_trade, df_money, df_domestic):
+    # -> (파싱 건수, 추가할 행 {시트명: 건수}, written, failed)
+    with perf.timed("import.parse"):
+        items = list(kakao.iter_parse_export(lines))
+    perf.count("rows.parsed", len(items))
+    rows = build_sheet_rows(items, next_order_id(df_trade, df_money), log_indexes(df_trade, df_money, df_domestic))
+    written, failed = write_sheet_rows(sheet_instance, rows)
+    return len(items), {name: len(r) for name, r in rows.items()}, written, failed
 
 # -------------------------------------------------------------------
 # [5] Helper: 카톡 파싱 (국내 주식 분기 및 K-ETF 배당 추가)
 # -------------------------------------------------------------------
 def parse_kakaotalk_final(text, base_date):
-    parsed_list = []
-    base_year = base_date.year
-    lines = text.split('\n')
-    full_text = "\n".join([l.strip() for l in lines if l.strip()])
-
-    # 1. 매매 파싱 (해외/국내 분기)
-    blocks = re.split(r'\[한국투자증권 체결안내\]', full_text)
-    for block in blocks:
-        if not block: continue
-        try:
-            time_match = re.match(r'(\d{2}:\d{2})', block.strip())
-            time_str = time_match.group(1) if time_match else "00:00"
-            
-            # K-ETF(국내) 매수 패턴
-            dom_buy = re.search(r'\*매매구분:현금(매수|매도)체결', block)
-            dom_name = re.search(r'\*종목명:.*?\(([\dA-Za-z]+)\)', block)
-            dom_qty = re.search(r'\*체결수량:([\d,]+)', block)
-            dom_price = re.search(r'\*체결단가:([\d,]+)원', block)
-            
-            if dom_buy and dom_name and dom_qty and dom_price:
-                t_dt = datetime.combine(base_date, datetime.min.time()).replace(hour=int(time_str.split(':')[0]), minute=int(time_str.split(':')[1]))
-                t_type = "Buy" if dom_buy.group(1) == "매수" else "Sell"
-                parsed_list.append({
-                    "Category": "Domestic_Trade", "Date": t_dt.strftime("%Y-%m-%d %H:%M:%S"),
-                    "Ticker": dom_name.group(1), "Name": "-", "Type": t_type,
-                    "Qty": int(dom_qty.group(1).replace(',','')), "Price": float(dom_price.group(1).replace(',','')), "Amount": 0, "Memo": f"카톡파싱_{time_str}"
-                })
-                continue 
-            
-            # 해외 매수 패턴
-            type_m = re.search(r'\*매매구분:(매수|매도)', block)
-            name_m = re.search(r'\*종목명:([A-Za-z0-9 ]+)(?:/|$)', block)
-            qty_m = re.search(r'\*체결수량:([\d,]+)', block)
-            price_m = re.search(r'\*체결단가:USD\s*([\d.]+)', block)
-            
-            if type_m and name_m and qty_m and price_m:
-                trade_dt = datetime.combine(base_date, datetime.min.time()) - timedelta(days=1)
-                final_dt = trade_dt.strftime("%Y-%m-%d 23:30:00")
-                parsed_list.append({
-                    "Category": "Trade", "Date": final_dt,
-                    "Ticker": name_m.group(1).strip(), "Type": "Buy" if type_m.group(1) == "매수" else "Sell",
-                    "Qty": int(qty_m.group(1).replace(',','')), "Price": float(price_m.group(1).replace(',','')), "Amount": 0, "Memo": f"카톡파싱_{time_str}"
-                })
-        except: continue
+    # 미리 컴파일된 패턴으로 메시지 블록 단위 1회 스캔 (Kakao_Parser)
+    return kakao.parse_kakaotalk(text, base_date)
 
-    # 2. 해외 배당 파싱
-    div_pattern = re.compile(r'최원준님\s*(\d{2}/\d{2}).*?([A-Z]+)/.*?USD\s*([\d.]+)\s*세전배당입금', re.DOTALL)
-    for match in div_pattern.finditer(full_text):
-        try:
-            date_part, ticker, amount = match.groups()
-            m, d = map(int, date_part.split('/'))
-            div_dt = datetime(base_year, m, d, 15, 0, 0)
-            parsed_list.append({
-                "Category": "Dividend", "Date": div_dt.strftime("%Y-%m-%d %H:%M:%S"),
-                "Ticker": ticker.strip(), "Type": "Dividend",
-                "Qty": 0, "Price": float(amount), "Amount": 0, "Memo": "카톡파싱_배당"
-            })
-        except: continue
+# -------------------------------------------------------------------
+# [5.5] 실시간 시세 (KIS 웹소켓 구독 값만 주기적으로 다시 그림, 전체 재실행 없음)
+# -------------------------------------------------------------------
+KIS_STREAM_ENABLED = True
+LIVE_REFRESH_SEC = 3
+
+@st.fragment(run_every=LIVE_REFRESH_SEC)
+def render_live_quotes(holdings, base_prices, fx_rate):
+    # holdings: {ticker: qty} (해외 보유분), base_prices: 페이지 로드 시점 시세
+    live = kis_stream.get_live_quotes(list(holdings))
+    if not live:
+        st.caption("📡 실시간 시세 " + ("대기 중 (장 마감 또는 체결 없음)" if kis_stream.is_connected() else "연결 중..."))
+        return
+    base_usd = sum(qty * base_prices.get(tk, 0) for tk, qty in holdings.items())
+    live_usd = sum(qty * live[tk]['price'] if tk in live else qty * base_prices.get(tk, 0) for tk, qty in holdings.items())
+    cols = st.columns([2] + [1] * min(len(live), 6))
+    with cols[0]:
+        st.metric("📡 해외주식 평가액 (실시간)", f"₩ {live_usd * fx_rate:,.0f}", f"{(live_usd - base_usd) * fx_rate:+,.0f} (로드 이후)")
+    for col, (tk, q) in zip(cols[1:], sorted(live.items(), key=lambda kv: -holdings[kv[0]] * kv[1]['price'])):
+        with col: st.metric(tk, f"$ {q['price']:,.2f}", f"{q['rate']:+.2f}%")
 
-    # [NEW] 2.5 국내 ETF 배당 파싱
-    dom_div_pattern = re.compile(
-        r'ETF 결산분배금 입금 안내.*?'
-        r'\*\s*종목명\s*:\s*(.*?)\s*\*'
-        r'.*?'
-        r'\*\s*입금액\s*:\s*([\d,]+)원.*?'
-        r'\*\s*입금일자\s*:\s*(\d{4})년\s*(\d{2})월\s*(\d{2})일', 
-        re.DOTALL
-    )
-    
-    # 한국 이름 -> 종목코드 변환 사전
-    K_ETF_NAME_TO_CODE = {
-        "TIGER 미국배당다우존스": "458730"
-        # 나중에 다른 종목이 생기면 여기에 "이름": "코드" 추가
-    }
+# -------------------------------------------------------------------
+# [5.6] 화면 (탭별 fragment: 선택된 탭만 실행, 입력 위젯 조작은 해당 fragment 만 재실행)
+# -------------------------------------------------------------------
+@st.fragment
+def render_dashboard_tab(portfolio, metrics):
+    st.write("### 💳 Portfolio Status")
+    for sec in ['배당', '테크', '리츠', '기타']:
+        target_list = SECTOR_ORDER_LIST.get(sec, [])
+        if sec == '기타':
+            all_defined = [t for lst in SECTOR_ORDER_LIST.values() for t in lst]
+            target_list = [t for t in portfolio.keys() if t not in all_defined and portfolio[t]['qty'] > 0]
+
+        valid_tickers = [t for t in target_list if t in portfolio and portfolio[t]['qty'] > 0]
+        if not valid_tickers: continue
+
+        st.caption(f"**{sec}** Sector")
+        cols = st.columns(4)
+        for idx, tk in enumerate(valid_tickers):
+            m = metrics.loc[tk]
+            qty, cur_p = m['qty'], m['price']
+            val_krw, invested_krw, div_krw, total_pl_tk = m['eval_krw'], m['invested_krw'], m['div_krw'], m['total_pl']
+            if m['is_domestic']:
+                margin_tk_str = "-"
+                price_display = f"₩ {cur_p:,.0f}"
+            else:
+                margin_tk_str = f"{m['margin']:+.1f} 원"
+                price_display = f"${cur_p:.2f}"
+
+            total_ret = m['total_ret']
+            is_plus = total_pl_tk >= 0
+            color_cls = "card-up" if is_plus else "card-down"
+            txt_cls = "txt-red" if is_plus else "txt-blue"
+            arrow = "▲" if is_plus else "▼"
+            sign = "+" if is_plus else ""
+
+            html = f"""
+            <div class="stock-card {color_cls}">
+                <div class="card-header"><span class="card-ticker">{tk}</span><span class="card-price">{price_display}</span></div>
+                <div class="card-main-val">₩ {val_krw:,.0f}</div>
+                <div class="card-sub-box {txt_cls}"><span class="pl-amt">{arrow} {abs(total_pl_tk):,.0f}</span> <span class="pl-pct">{sign}{total_ret:.1f}%</span></div>
+                <details>
+                    <summary style="text-align:right; font-size:0.8rem; color:#888; cursor:pointer; margin-top:5px;">상세 내역</summary>
+                    <table class="detail-table" style="width:100%; font-size:0.85rem; color:#ccc;">
+                        <tr><td>보유수량</td><td style="text-align:right;">{qty:,.0f}</td></tr>
+                        <tr><td>투자원금</td><td style="text-align:right;">₩ {invested_krw:,.0f}</td></tr>
+                        <tr><td>누적실현</td><td style="text-align:right;">₩ {m['realized_krw']:,.0f}</td></tr>
+                        <tr><td>누적배당</td><td style="text-align:right;">₩ {div_krw:,.0f}</td></tr>
+                        <tr><td style="color:#AAA">안전마진</td><td style="text-align:right; color:{COLOR_RED if is_plus else COLOR_BLUE}">{margin_tk_str}</td></tr>
+                    </table>
+                </details>
+            </div>
+            """
+            with cols[idx % 4]:
+                st.markdown(html, unsafe_allow_html=True)
+
+@st.fragment
+def render_table_tab(portfolio, metrics, cur_bal, cur_real_rate, dom_cash, total_principal_all, safety_margin):
+    header = "<table class='int-table'><thead><tr><th>종목</th><th>평가액 (₩)</th><th>평가손익</th><th>환손익</th><th>실현+배당</th><th>총 손익 (Total)</th><th>안전마진</th></tr></thead><tbody>"
+    rows_html = ""
+
+    all_keys = list(portfolio.keys())
+    def sort_key(tk): return SORT_ORDER_TABLE.index(tk) if tk in SORT_ORDER_TABLE else 999
+    sorted_tickers = sorted(all_keys, key=sort_key)
+
+    sum_eval_krw = 0; sum_realized = 0;
+
+    for tk in sorted_tickers:
+        if tk not in metrics.index or not metrics.at[tk, 'active']: continue
+        m = metrics.loc[tk]
+        is_dom, held = m['is_domestic'], m['qty'] > 0
+        eval_krw, div_krw, total_pl = m['eval_krw'], m['div_krw'], m['total_pl']
+        price_profit, fx_profit = m['price_profit'], m['fx_profit']
+        fx_profit_str = f"{fx_profit:,.0f}" if held and not is_dom else "-"
+        margin_str = f"{m['margin']:+.1f}" if held and not is_dom else "-"
+
+        realized_total = m['realized_krw'] + div_krw
+        sum_eval_krw += eval_krw
+        sum_realized += realized_total
+
+        cls_price = "txt-red" if price_profit >= 0 else "txt-blue"
+        cls_fx = "txt-red" if (is_dom or fx_profit >= 0) else "txt-blue"
+        cls_tot = "txt-red" if total_pl >= 0 else "txt-blue"
+        bg_cls = "bg-red" if total_pl >= 0 else "bg-blue"
+
+        if is_dom: cls_fx = "txt-sub" 
+
+        rows_html += f"<tr><td>{tk}</td><td>{eval_krw:,.0f}</td><td class='{cls_price}'>{price_profit:,.0f}</td><td class='{cls_fx}'>{fx_profit_str}</td><td>{realized_total:,.0f}</td><td class='{cls_tot} {bg_cls}'><b>{total_pl:,.0f}</b></td><td>{margin_str}</td></tr>"
+
+    cash_krw = cur_bal * cur_real_rate
+    final_pl_calc = (sum_eval_krw + cash_krw + dom_cash) - total_principal_all
+    cls_fin = "txt-red" if final_pl_calc >= 0 else "txt-blue"
+
+    cash_row = f"<tr class='row-cash'><td>Cash (USD/KRW)</td><td>{cash_krw+dom_cash:,.0f}</td><td>-</td><td>-</td><td>-</td><td>-</td><td>-</td></tr>"
+    total_row = f"<tr class='row-total'><td>TOTAL</td><td>{(sum_eval_krw + cash_krw + dom_cash):,.0f}</td><td>-</td><td>-</td><td>{sum_realized:,.0f}</td><td class='{cls_fin}'>{final_pl_calc:,.0f}</td><td>{safety_margin:+.1f}</td></tr>"
+
+    full_table = header + rows_html + cash_row + total_row + "</tbody></table>"
+    st.markdown(full_table, unsafe_allow_html=True)
+
+HISTORY_RANGES = {"1년": 365, "3년": 3 * 365, "5년": 5 * 365, "전체": None}
+HISTORY_WEEKLY_AFTER_DAYS = 3 * 365   # 이보다 긴 구간은 주간(금요일 종가)으로 줄여서 그림
+
+def daily_state(df_trade, df_money, df_domestic):
+    # 일별 상태는 원장이 바뀔 때만 (하루가 지나면 날짜 축이 늘어나므로 오늘 날짜도 키에 포함)
+    today = datetime.now().strftime("%Y-%m-%d")
+    with perf.timed("nav.state"):
+        return today, ledger_cached(("nav_state", today), lambda: history_engine.daily_state(df_trade, df_money, df_domestic, DOMESTIC_TICKER_MAP))
+
+@st.fragment
+def render_history_tab(df_trade, df_money, df_domestic, prices, cur_real_rate, metrics):
+    # 과거 시세는 로컬 보관분 재사용
+    today, state = daily_state(df_trade, df_money, df_domestic)
+    if len(state['days']) < 2:
+        st.info("자산 추이를 그릴 기록이 아직 없습니다.")
+        return
+    nav = history_engine.get_nav_history((_ledger()['version'], today), state, prices, cur_real_rate)
+    with perf.timed("returns"):
+        rets = returns_engine.get_returns((_ledger()['version'], today), state, nav, metrics['eval_krw'].where(metrics['qty'] > 0, 0.0).to_dict())
+
+    span = st.radio("기간", list(HISTORY_RANGES), index=len(HISTORY_RANGES) - 1, horizontal=True, key="history_range")
+    days = HISTORY_RANGES[span]
+    hist = nav.assign(twr=rets['twr_curve'] * 100)
+    view = hist if days is None else hist[hist.index >= hist.index[-1] - timedelta(days=days)]
+    if len(view) > HISTORY_WEEKLY_AFTER_DAYS: view = view.resample('W-FRI').last()
+
+    last = nav.iloc[-1]
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("총 자산", f"₩ {last['nav']:,.0f}")
+    c2.metric("투입 원금", f"₩ {last['principal']:,.0f}")
+    c3.metric("평가손익", f"₩ {last['price_pl']:,.0f}")
+    c4.metric("환손익", f"₩ {last['fx_pl']:,.0f}")
+    # 단순 손익률(손익/원금)은 입금 시점을 무시하므로 금액가중(XIRR)/시간가중(TWR) 수익률을 같이 표시
+    fmt_pct = lambda v: "-" if pd.isna(v) else f"{v * 100:+.2f}%"
+    r1, r2, r3, r4 = st.columns(4)
+    r1.metric("XIRR (연)", fmt_pct(rets['xirr']))
+    r2.metric("TWR (누적)", fmt_pct(rets['twr']))
+    r3.metric("TWR (연환산)", fmt_pct(rets['twr_annual']))
+    r4.metric("단순 손익률", fmt_pct(last['pl'] / last['principal'] if last['principal'] > 0 else float('nan')))
+
+    st.caption("총 자산 vs 투입 원금 (원화)")
+    st.line_chart(view[['nav', 'principal']].rename(columns={'nav': '총 자산', 'principal': '투입 원금'}), color=[COLOR_RED, "#888888"])
+    st.caption("손익 분해 (평가손익 / 환손익 / 실현·배당 등)")
+    st.area_chart(view[['price_pl', 'fx_pl', 'other_pl']].rename(columns={'price_pl': '평가손익', 'fx_pl': '환손익', 'other_pl': '실현·배당 등'}))
+
+    c_left, c_right = st.columns([3, 2])
+    with c_left:
+        st.caption("시간가중 누적 수익률 (TWR, %)")
+        st.line_chart(view['twr'].rename("TWR"), color=COLOR_RED)
+    with c_right:
+        st.caption("종목별 XIRR (연, 원화 기준)")
+        tx = rets['ticker_xirr'].dropna().sort_values(ascending=False)
+        st.dataframe((tx * 100).round(2).rename("XIRR %").to_frame(), use_container_width=True)
+
+TAX_RATE_MODES = {"매매일 시장환율 (신고용)": "market", "달러 매수평단 (저수지)": "reservoir"}
+
+@st.fragment
+def render_tax_tab(df_trade, df_money, df_domestic, prices, cur_real_rate):
+    # 로트/연도별 표는 원장이 바뀔 때만 다시 만들고, 연도 선택/가상 매도는 그 표만 조회
+    today, state = daily_state(df_trade, df_money, df_domestic)
+    mode = TAX_RATE_MODES[st.radio("환율 기준", list(TAX_RATE_MODES), horizontal=True, key="tax_rate_mode")]
+    with perf.timed("tax.lots"):
+        book = ledger_cached(("tax_lots", today, mode), lambda: tax_engine.build_lots(state, history_engine.daily_fx(state) if mode == "market" else None))
+    if book['by_year'].empty and book['lots'].empty:
+        st.info("해외 매매 기록이 없습니다.")
+        return
+
+    years = sorted(set(book['by_year'].index) | {datetime.now().year}, reverse=True)
+    year = st.selectbox("과세 연도", years, key="tax_year")
+    est = tax_engine.estimate_tax(book, year)
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("실현 양도차익", f"₩ {est['gain']:,.0f}")
+    c2.metric("기본공제", f"₩ {est['deduction']:,.0f}")
+    c3.metric("과세표준", f"₩ {est['taxable']:,.0f}")
+    c4.metric("예상 세액 (22%)", f"₩ {est['tax']:,.0f}")
+
+    c_left, c_right = st.columns(2)
+    with c_left:
+        st.caption(f"{year}년 종목별 실현손익 (FIFO)")
+        st.dataframe(tax_engine.realized_by_year(book, year).round(0).rename("양도차익 ₩").to_frame(), use_container_width=True)
+    with c_right:
+        st.caption("연도별 합계")
+        st.dataframe(tax_engine.yearly_summary(book).round(0).rename(columns={'gain': '양도차익', 'deduction': '공제', 'taxable': '과세표준', 'tax': '세액'}), use_container_width=True)
+
+    # 가상 매도: 남은 로트 누적원가에서 바로 계산 (원장 재처리 없음)
+    open_tickers = [tk for tk, (cum_qty, _, _) in book['open'].items() if len(cum_qty)]
+    if open_tickers:
+        st.caption("가상 매도 (올해 세액 변화)")
+        w1, w2, w3, w4 = st.columns(4)
+        tk = w1.selectbox("종목", open_tickers, key="tax_whatif_ticker")
+        held_qty = float(book['open'][tk][0][-1])
+        qty = w2.number_input("수량", min_value=0.0, max_value=held_qty, value=held_qty, key=f"tax_whatif_qty_{tk}")
+        price = w3.number_input("매도가 ($)", min_value=0.0, value=float(prices.get(tk, 0) or 0), key=f"tax_whatif_price_{tk}")
+        fx = w4.number_input("환율 (₩)", min_value=0.0, value=float(cur_real_rate or 0), key="tax_whatif_fx")
+        w = tax_engine.what_if_sell(book, tk, qty, price, fx, datetime.now().year)
+        st.markdown(f"FIFO 취득원가 ₩ {w['cost_krw']:,.0f} / 양도차익 ₩ {w['gain_krw']:,.0f} → 예상 세액 ₩ {w['tax_before']:,.0f} → **₩ {w['tax_after']:,.0f}** ({w['tax_delta']:+,.0f})")
+
+    with st.expander("보유 로트 (FIFO 순)"):
+        lots = book['lots'][book['lots']['remaining'] > tax_engine.QTY_EPS]
+        st.dataframe(lots[['ticker', 'buy_date', 'remaining', 'price_usd', 'rate']].rename(columns={'remaining': 'qty'}), hide_index=True, use_container_width=True)
+
+LOG_VIEW_COLUMNS = {
+    "Trade_Log": ['Date', 'Ticker', 'Type', 'Qty', 'Price_USD', 'Note'],
+    "Money_Log": ['Date', 'Type', 'USD_Amount', 'KRW_Amount', 'Note'],
+    "Domestic_Log": ['Date', 'Type', 'Ticker', 'Qty', 'Price_KRW', 'Amount_KRW', 'Note'],
+}
 
-    for match in dom_div_pattern.finditer(full_text):
-        try:
-            name, amount_str, year, month, day = match.groups()
-            name = name.strip()
-            amount = float(amount_str.replace(',', ''))
-            
-            # 카톡에 찍힌 입금일자 오후 3시로 픽스
-            div_dt = datetime(int(year), int(month), int(day), 15, 0, 0)
-            
-            # 사전에서 코드를 찾고, 없으면 일단 이름 자체를 넣음
-            ticker = K_ETF_NAME_TO_CODE.get(name, name)
-            
-            parsed_list.append({
-                "Category": "Domestic_Dividend", 
-                "Date": div_dt.strftime("%Y-%m-%d %H:%M:%S"),
-                "Ticker": ticker, 
-                "Type": "Dividend",
-                "Qty": 0, 
-                "Price": 0, 
-                "Amount": amount, 
-                "Memo": "카톡파싱_국내배당"
-            })
-        except: continue
+@st.fragment
+def render_log_tab(df_trade, df_money, df_domestic):
+    # 표시용 사본은 원장이 바뀔 때만 다시 만듦
+    views = ledger_cached("log_view", lambda: [df[LOG_VIEW_COLUMNS[name]].fillna('') for name, df in zip(LOG_COLUMNS, (df_trade, df_money, df_domestic))])
+    for view in views:
+        st.dataframe(view, use_container_width=True)
+
+@st.fragment
+def render_input_manager(sheet_instance, df_trade, df_money, df_domestic):
+    # 저장 후 st.rerun() 은 앱 전체 재실행 (새 행이 반영된 원장으로 다시 그림)
+    st.subheader("📝 입출금 및 배당 관리")
+    if 'save_error' in st.session_state:
+        st.error(st.session_state.pop('save_error'))
+    mode = st.radio("입력 모드", ["💬 카카오톡 파싱 (추천)", "📂 카톡 내보내기 파일 (일괄)", "✍️ 수기 입력"], horizontal=True)
+    st.divider()
+
+    if mode == "💬 카카오톡 파싱 (추천)":
+        c1, c2 = st.columns([1, 2])
+        with c1: ref_date = st.date_input("📅 기준 날짜 (카톡 수신일)", datetime.now())
+        with c2: st.info("카톡 내용을 복사해서 아래에 붙여넣으세요. '저장하기' 버튼을 누르면 즉시 DB에 저장됩니다.")
+
+        raw_text = st.text_area("카톡 내용 붙여넣기", height=200, placeholder="[한국투자증권 체결안내]08:05\n...")
+
+        if st.button("🚀 저장하기 (분석 및 DB전송)", type="primary"):
+            if raw_text:
+                parsed_items = parse_kakaotalk_final(raw_text, ref_date)
+                if parsed_items:
+                    with st.spinner("DB 저장 중..."):
+                        rows = build_sheet_rows(parsed_items, next_order_id(df_trade, df_money), log_indexes(df_trade, df_money, df_domestic))
+                        written, failed = write_sheet_rows(sheet_instance, rows)
+                    n_skipped = len(parsed_items) - sum(len(r) for r in rows.values())
+                    summary = ", ".join(f"{name} {n}건" for name, n in written.items())
+
+                    if failed:
+                        detail = ", ".join(f"{name} ({e})" for name, e in failed.items())
+                        # 일부라도 저장됐으면 아래 재실행으로 화면이 지워지므로 세션에 남겨 재실행 후 표시
+                        msg = f"🚨 일부 저장 실패: {detail}" + (f" / 저장됨: {summary}" if summary else "")
+                        st.error(msg)
+                        if written: st.session_state['save_error'] = msg
+                    elif written:
+                        st.success(f"✅ {sum(written.values())}건 저장 완료! ({summary}, 중복 {n_skipped}건 제외)")
+                    else:
+                        st.warning(f"⚠️ 이미 저장된 내역입니다. (중복 {n_skipped}건, 저장 없음)")
+                    if written:
+                        time.sleep(2)
+                        st.rerun()
+                else:
+                    st.warning("⚠️ 저장할 내역을 찾지 못했습니다. 텍스트를 확인해주세요.")
+    elif mode == "📂 카톡 내보내기 파일 (일괄)":
+        st.info("카카오톡 '대화 내보내기' 파일(.txt)을 올리면 메시지마다 수신일을 기준 날짜로 써서 전체를 한 번에 가져옵니다. 이미 있는 내역은 건너뜁니다.")
+        export_file = st.file_uploader("대화 내보내기 파일", type=["txt"])
+
+        if export_file is not None and st.button("📥 일괄 가져오기", type="primary"):
+            with st.spinner("파싱 및 DB 저장 중..."):
+                lines = io.TextIOWrapper(export_file, encoding="utf-8-sig", errors="replace")
+                n_parsed, n_new, written, failed = import_kakaotalk_export(sheet_instance, lines, df_trade, df_money, df_domestic)
+            n_skipped = n_parsed - sum(n_new.values())
+            summary = ", ".join(f"{name} {n}건" for name, n in written.items())
+
+            if failed:
+                detail = ", ".join(f"{name} ({e})" for name, e in failed.items())
+                msg = f"🚨 일부 저장 실패: {detail}" + (f" / 저장됨: {summary}" if summary else "")
+                st.error(msg)
+                if written: st.session_state['save_error'] = msg
+            elif written:
+                st.success(f"✅ {n_parsed}건 중 {sum(written.values())}건 저장, 중복 {n_skipped}건 제외 ({summary})")
+            else:
+                st.warning(f"⚠️ 새로 저장할 내역이 없습니다. (파싱 {n_parsed}건, 중복 {n_skipped}건)")
+            if written:
+                time.sleep(2)
+                st.rerun()
+    else:
+        with st.form("input_form"):
+            col1, col2 = st.columns(2)
+            i_date = col1.date_input("날짜", datetime.now())
+            i_usd = col2.number_input("금액 (USD)", min_value=0.01, step=0.01, format="%.2f")
+            i_krw = st.number_input("입금 원화 (KRW)", min_value=0, step=100)
+            i_ticker = st.text_input("종목코드 (배당 시)")
+            i_type = st.selectbox("유형", ["KRW_to_USD", "Dividend", "Withdraw"])
+            i_note = st.text_input("비고", value="수기입력")
+
+            if st.form_submit_button("💾 저장하기"):
+                next_id = next_order_id(df_trade, df_money)
+                rate = i_krw / i_usd if i_type=="KRW_to_USD" and i_usd > 0 else 0
+
+                written, failed = write_sheet_rows(sheet_instance, {"Money_Log": [[
+                    i_date.strftime("%Y-%m-%d"), int(next_id), i_type, i_ticker,
+                    int(i_krw), float(i_usd), float(rate), "", "", i_note
+                ]]})
+                if failed:
+                    st.error(f"🚨 저장 실패: {failed['Money_Log']}")
+                    st.stop()
+                st.success("저장 완료!")
+                time.sleep(1)
+                st.rerun()
 
-    # 3. 환전 파싱
-    exch_pattern = re.compile(r'외화매수환전.*?￦([0-9,]+).*?@([0-9,.]+).*?USD\s*([0-9,.]+)', re.DOTALL)
-    for match in exch_pattern.finditer(full_text):
-        try:
-            krw_str, rate_str, usd_str = match.groups()
-            exch_dt = datetime.combine(base_date, datetime.min.time()).replace(hour=14, minute=0)
-            parsed_list.append({
-                "Category": "Exchange", "Date": exch_dt.strftime("%Y-%m-%d %H:%M:%S"),
-                "Ticker": "-", "Type": "KRW_to_USD",
-                "Qty": 0, "Price": float(usd_str.replace(',', '')), 
-                "Amount": float(krw_str.replace(',', '')), "Memo": "카톡파싱_환전"
-            })
-        except: continue
-        
-    return parsed_list
+
+# -------------------------------------------------------------------
+# [5.7] 성능 진단 패널 (이번 실행 단계별 소요시간 + 누적 백분위 + 이벤트 카운터)
+# -------------------------------------------------------------------
+PERF_PANEL_ENABLED = True
+PERF_PROM_DEFAULT_PATH = os.path.join(db.LOCAL_CACHE_DIR, "perf_metrics.prom")
+
+def render_diagnostics():
+    run = perf.current_run()
+    with st.expander("🩺 성능 진단", expanded=False):
+        if run:
+            st.caption(f"이번 실행 {run['total'] * 1000:,.0f} ms (패널 제외) / 단계 합계는 중첩 구간을 포함")
+            c1, c2 = st.columns([3, 2])
+            with c1:
+                st.dataframe(pd.DataFrame(sorted(run['stages'].items(), key=lambda kv: -kv[1]), columns=['단계', 'ms']).assign(ms=lambda d: (d['ms'] * 1000).round(1)), hide_index=True, use_container_width=True)
+            with c2:
+                st.dataframe(pd.DataFrame(sorted(run['counters'].items()), columns=['이벤트', '건수']), hide_index=True, use_container_width=True)
+
+        st.caption("프로세스 누적 (최근 샘플 기준 백분위)")
+        summary = pd.DataFrame(perf.stage_summary(), columns=['stage', 'count', 'total', 'p50', 'p95', 'max'])
+        for c in ['total', 'p50', 'p95', 'max']: summary[c] = (summary[c] * 1000).round(1)
+        st.dataframe(summary.rename(columns={'total': 'total ms', 'p50': 'p50 ms', 'p95': 'p95 ms', 'max': 'max ms'}), hide_index=True, use_container_width=True)
+        st.dataframe(pd.DataFrame(perf.counters().items(), columns=['이벤트', '누적']), hide_index=True, use_container_width=True)
+
+        prom_path = perf.PERF_PROM_PATH or PERF_PROM_DEFAULT_PATH
+        if st.button("📤 Prometheus 파일로 내보내기"):
+            perf.write_prometheus(prom_path)
+            st.toast(f"저장됨: {prom_path}")
 
 # -------------------------------------------------------------------
 # [6] Main App
 # -------------------------------------------------------------------
 def main():
+    # 재실행 1회의 단계별 소요시간 기록 (진단 패널 / PERF_LOG_PATH / PERF_PROM_PATH)
+    perf.begin_run()
+    try:
+        render_app()
+    finally:
+        perf.end_run()
+
+def render_app():
     try:
-        df_trade, df_money, df_domestic = load_data()
+        with perf.timed("load_data"):
+            df_trade, df_money, df_domestic = load_data()
         
-        # 시트 저장용 인스턴스는 여기서 따로 불러오기
-        client = get_gsheet_client()
-        sheet_instance = client.open("Investment_Dashboard_DB")
+        # 시트 저장용 인스턴스 (load_data 와 같은 캐시된 핸들)
+        sheet_instance = get_spreadsheet()
     except Exception as e:
         st.error(f"🚨 DB 연결/로딩 실패 상세 원인: {e}")
         st.info("💡 팁: 구글 시트의 탭 이름(Money_Log, Trade_Log, Domestic_Log)이 일치하는지 확인하세요.")
         st.stop()
         
-    u_trade, u_money, cur_bal, dom_cash, cur_rate, pure_exch_rate, portfolio = process_timeline(df_trade, df_money, df_domestic)
-    cur_real_rate = get_realtime_rate()
+    if not kis.KIS_CONFIGURED:
+        st.warning("⚠️ KIS API 설정(secrets.toml [kis_api])이 없어 해외 시세 조회/체결내역 동기화를 건너뜁니다.")
+
+    # [KIS 체결내역 동기화] 조회/새 체결 추가는 백그라운드, 기존 기록과 애매하게 겹치는 체결만 확인 후 추가
+    if kis.KIS_CONFIGURED:
+        start_kis_fetch(sheet_instance, df_trade)
+        render_kis_pending(sheet_instance, df_trade, df_money, df_domestic)
+
+    def _timeline():
+        perf.count("rows.timeline", len(df_trade) + len(df_money) + len(df_domestic))
+        return compute_timeline(df_trade, df_money, df_domestic)
+    with perf.timed("timeline"):
+        u_trade, u_money, cur_bal, dom_cash, cur_rate, pure_exch_rate, portfolio = ledger_cached("timeline", _timeline)
+    with perf.timed("fx"):
+        cur_real_rate = get_realtime_rate(fallback_rate=cur_rate)
+    if market.get_fx_rate_age() is None:
+        st.warning("⚠️ 시장환율을 받아오지 못해 달러 매수평단 환율로 계산합니다.")
     
-    # [시세 조회 캐싱]
-    tickers = list(portfolio.keys())
-    if tickers:
-        uncached = [t for t in tickers if t not in st.session_state['price_cache']]
-        if uncached:
-            with st.spinner("최신 시세 조회 중..."):
-                for tk in uncached:
-                    data = portfolio[tk]
-                    if data['is_domestic']:
-                        try:
-                            st.session_state['price_cache'][tk] = yf.Ticker(f"{data['raw_ticker']}.KS").history(period="1d")['Close'].iloc[-1]
-                        except: st.session_state['price_cache'][tk] = 0
-                    else:
-                        st.session_state['price_cache'][tk] = kis.get_current_price(tk)
-        prices = st.session_state['price_cache']
-    else:
-        prices = {}
-    
-    # --- KPI Logic Aggregation ---
-    total_stock_val_krw = 0.0
-    total_input_principal = df_money[df_money['Type'] == 'KRW_to_USD']['KRW_Amount'].apply(safe_float).sum()
-    total_dom_principal = df_domestic[df_domestic['Type'].isin(['Deposit', '입금'])]['Amount_KRW'].apply(safe_float).sum()
-    total_principal_all = total_input_principal + total_dom_principal
-    
-    total_realized_krw = sum(d['realized_krw'] for d in portfolio.values())
-    total_div_usd = sum(d['accum_div_usd'] for d in portfolio.values())
-    total_div_krw = (total_div_usd * cur_real_rate) + sum(d['accum_div_krw'] for d in portfolio.values())
-    
-    total_price_profit = 0
-    total_fx_profit = 0
+    # [시세] 프로세스 공용 캐시에서 바로 읽음 (장중/장외 TTL 에 따라 백그라운드 갱신, 처음 보는 종목만 즉시 조회)
+    with perf.timed("prices"):
+        prices = market.get_prices({tk: (d['raw_ticker'], d['is_domestic']) for tk, d in portfolio.items()})
     
-    for tk, data in portfolio.items():
-        if data['qty'] > 0:
-            cur_p = prices.get(tk, 0)
-            if data['is_domestic']:
-                val_krw = data['qty'] * cur_p
-                total_stock_val_krw += val_krw
-                total_price_profit += (val_krw - data['invested_krw'])
-            else:
-                val_usd = data['qty'] * cur_p
-                val_krw = val_usd * cur_real_rate
-                invested_krw = data['invested_krw']
-                invested_usd = data['invested_usd']
-                
-                avg_rate_tk = invested_krw / invested_usd if invested_usd > 0 else 0
-                fx_p = invested_usd * (cur_real_rate - avg_rate_tk)
-                price_p = (val_usd - invested_usd) * cur_real_rate
-                
-                total_stock_val_krw += val_krw
-                total_price_profit += price_p
-                total_fx_profit += fx_p
-
-    cash_val_krw = cur_bal * cur_real_rate
-    cash_invested_krw = cur_bal * cur_rate 
-    total_fx_profit += (cash_val_krw - cash_invested_krw)
-
-    total_asset_krw = total_stock_val_krw + cash_val_krw + dom_cash
-    total_pl_krw = total_asset_krw - total_principal_all
-    total_pl_pct = (total_pl_krw / total_principal_all * 100) if total_principal_all > 0 else 0
-    
-    # BEP 
-    bep_numerator = total_input_principal - sum(d['realized_krw'] for d in portfolio.values() if not d['is_domestic']) - (total_div_usd * cur_real_rate)
-    total_usd_assets = sum(d['qty'] * prices.get(tk,0) for tk, d in portfolio.items() if not d['is_domestic']) + cur_bal
-    bep_rate = bep_numerator / total_usd_assets if total_usd_assets > 0 else 0
-    safety_margin = cur_real_rate - bep_rate
+    # --- KPI Logic Aggregation --- (종목별 지표는 원장/시세/환율이 같으면 재사용)
+    with perf.timed("metrics"):
+        total_input_principal, total_dom_principal = ledger_cached("principal", lambda: (
+            df_money[df_money['Type'] == 'KRW_to_USD']['KRW_Amount'].apply(safe_float).sum(),
+            df_domestic[df_domestic['Type'].isin(['Deposit', '입금'])]['Amount_KRW'].apply(safe_float).sum()))
+        metrics = metrics_engine.get_metrics(_ledger()['version'], portfolio, prices, cur_real_rate)
+        kpi = metrics_engine.summarize(metrics, cur_bal, cur_rate, dom_cash, cur_real_rate, total_input_principal, total_dom_principal)
+
+    total_principal_all = kpi['principal_all']
+    total_asset_krw, total_pl_krw, total_pl_pct = kpi['asset_krw'], kpi['pl_krw'], kpi['pl_pct']
+    total_price_profit, total_fx_profit = kpi['price_profit'], kpi['fx_profit']
+    total_realized_krw, total_div_krw = kpi['realized_krw'], kpi['div_krw']
+    bep_rate, safety_margin = kpi['bep_rate'], kpi['safety_margin']
 
     # Header
     c1, c2 = st.columns([3, 1])
     with c1: st.title("🚀 Investment Command Center")
     with c2:
         if st.button("🔄 시세/데이터 새로고침"):
-            st.session_state['price_cache'] = {}
-            if 'fx_rate' in st.session_state: del st.session_state['fx_rate']
-            st.cache_data.clear()
+            # 시세/환율은 무효화 후 백그라운드 갱신만 깨움 (화면 스레드에서 전 종목 조회하지 않음)
+            market.expire_fx_rate()
+            market.expire_prices()
+            db.clear_snapshot()
+            reset_ledger()
             st.rerun()
 
     # ------------------------------------------------------------------
@@ -507,224 +950,28 @@ def main():
         </div>
         """, unsafe_allow_html=True)
 
-    tab1, tab2, tab3, tab4 = st.tabs(["📊 대시보드", "📋 통합 상세", "📜 통합 로그", "🕹️ 입력 매니저"])
-    
-    # [Tab 1] Dashboard
-    with tab1:
-        st.write("### 💳 Portfolio Status")
-        for sec in ['배당', '테크', '리츠', '기타']:
-            target_list = SECTOR_ORDER_LIST.get(sec, [])
-            if sec == '기타':
-                all_defined = [t for lst in SECTOR_ORDER_LIST.values() for t in lst]
-                target_list = [t for t in portfolio.keys() if t not in all_defined and portfolio[t]['qty'] > 0]
-            
-            valid_tickers = [t for t in target_list if t in portfolio and portfolio[t]['qty'] > 0]
-            if not valid_tickers: continue
-            
-            st.caption(f"**{sec}** Sector")
-            cols = st.columns(4)
-            for idx, tk in enumerate(valid_tickers):
-                data = portfolio[tk]
-                qty = data['qty']
-                cur_p = prices.get(tk, 0)
-                
-                is_dom = data['is_domestic']
-                if is_dom:
-                    val_krw = qty * cur_p
-                    invested_krw = data['invested_krw']
-                    div_krw = data['accum_div_krw']
-                    total_pl_tk = val_krw - invested_krw + data['realized_krw'] + div_krw
-                    margin_tk_str = "-"
-                    price_display = f"₩ {cur_p:,.0f}"
-                else:
-                    val_krw = qty * cur_p * cur_real_rate
-                    invested_krw = data['invested_krw']
-                    div_krw = data['accum_div_usd'] * cur_real_rate
-                    total_pl_tk = val_krw - invested_krw + data['realized_krw'] + div_krw
-                    bep_rate_tk = (invested_krw - data['realized_krw'] - div_krw) / (qty * cur_p) if (qty*cur_p) > 0 else 0
-                    margin_tk = cur_real_rate - bep_rate_tk
-                    margin_tk_str = f"{margin_tk:+.1f} 원"
-                    price_display = f"${cur_p:.2f}"
-
-                total_ret = (total_pl_tk / invested_krw * 100) if invested_krw > 0 else 0
-                is_plus = total_pl_tk >= 0
-                color_cls = "card-up" if is_plus else "card-down"
-                txt_cls = "txt-red" if is_plus else "txt-blue"
-                arrow = "▲" if is_plus else "▼"
-                sign = "+" if is_plus else ""
-                
-                html = f"""
-                <div class="stock-card {color_cls}">
-                    <div class="card-header"><span class="card-ticker">{tk}</span><span class="card-price">{price_display}</span></div>
-                    <div class="card-main-val">₩ {val_krw:,.0f}</div>
-                    <div class="card-sub-box {txt_cls}"><span class="pl-amt">{arrow} {abs(total_pl_tk):,.0f}</span> <span class="pl-pct">{sign}{total_ret:.1f}%</span></div>
-                    <details>
-                        <summary style="text-align:right; font-size:0.8rem; color:#888; cursor:pointer; margin-top:5px;">상세 내역</summary>
-                        <table class="detail-table" style="width:100%; font-size:0.85rem; color:#ccc;">
-                            <tr><td>보유수량</td><td style="text-align:right;">{qty:,.0f}</td></tr>
-                            <tr><td>투자원금</td><td style="text-align:right;">₩ {invested_krw:,.0f}</td></tr>
-                            <tr><td>누적실현</td><td style="text-align:right;">₩ {data['realized_krw']:,.0f}</td></tr>
-                            <tr><td>누적배당</td><td style="text-align:right;">₩ {div_krw:,.0f}</td></tr>
-                            <tr><td style="color:#AAA">안전마진</td><td style="text-align:right; color:{COLOR_RED if is_plus else COLOR_BLUE}">{margin_tk_str}</td></tr>
-                        </table>
-                    </details>
-                </div>
-                """
-                with cols[idx % 4]:
-                    st.markdown(html, unsafe_allow_html=True)
-
-    # [Tab 2] Integrated Table
-    with tab2:
-        header = "<table class='int-table'><thead><tr><th>종목</th><th>평가액 (₩)</th><th>평가손익</th><th>환손익</th><th>실현+배당</th><th>총 손익 (Total)</th><th>안전마진</th></tr></thead><tbody>"
-        rows_html = ""
-        
-        all_keys = list(portfolio.keys())
-        def sort_key(tk): return SORT_ORDER_TABLE.index(tk) if tk in SORT_ORDER_TABLE else 999
-        sorted_tickers = sorted(all_keys, key=sort_key)
-        
-        sum_eval_krw = 0; sum_realized = 0;
-        
-        for tk in sorted_tickers:
-            if tk == 'Cash': continue
-            data = portfolio[tk]
-            qty = data['qty']
-            cur_p = prices.get(tk, 0)
-            
-            if qty == 0 and data['realized_krw'] == 0 and data['accum_div_usd'] == 0 and data['accum_div_krw'] == 0: continue
-
-            is_dom = data['is_domestic']
-            invested_krw = data['invested_krw']
-            
-            if is_dom:
-                eval_krw = qty * cur_p
-                div_krw = data['accum_div_krw']
-                total_pl = eval_krw - invested_krw + data['realized_krw'] + div_krw
-                price_profit = eval_krw - invested_krw if qty > 0 else 0
-                fx_profit_str = "-"
-                margin_str = "-"
-            else:
-                eval_krw = qty * cur_p * cur_real_rate
-                invested_usd = data['invested_usd']
-                div_krw = data['accum_div_usd'] * cur_real_rate
-                total_pl = eval_krw - invested_krw + data['realized_krw'] + div_krw
-                
-                if qty > 0:
-                    my_avg_rate_tk = invested_krw / invested_usd if invested_usd > 0 else 0
-                    fx_profit = invested_usd * (cur_real_rate - my_avg_rate_tk)
-                    val_usd = qty * cur_p
-                    price_profit = (val_usd - invested_usd) * cur_real_rate
-                    fx_profit_str = f"{fx_profit:,.0f}"
-                else:
-                    fx_profit = 0; price_profit = 0; fx_profit_str = "-"
-                
-                bep_tk = (invested_krw - (data['realized_krw'] + div_krw)) / (qty * cur_p) if (qty*cur_p) > 0 else 0
-                margin_str = f"{cur_real_rate - bep_tk:+.1f}" if qty > 0 else "-"
-
-            realized_total = data['realized_krw'] + div_krw
-            sum_eval_krw += eval_krw
-            sum_realized += realized_total
-            
-            cls_price = "txt-red" if price_profit >= 0 else "txt-blue"
-            cls_fx = "txt-red" if (is_dom or fx_profit >= 0) else "txt-blue"
-            cls_tot = "txt-red" if total_pl >= 0 else "txt-blue"
-            bg_cls = "bg-red" if total_pl >= 0 else "bg-blue"
-            
-            if is_dom: cls_fx = "txt-sub" 
-            
-            rows_html += f"<tr><td>{tk}</td><td>{eval_krw:,.0f}</td><td class='{cls_price}'>{price_profit:,.0f}</td><td class='{cls_fx}'>{fx_profit_str}</td><td>{realized_total:,.0f}</td><td class='{cls_tot} {bg_cls}'><b>{total_pl:,.0f}</b></td><td>{margin_str}</td></tr>"
-            
-        cash_krw = cur_bal * cur_real_rate
-        final_pl_calc = (sum_eval_krw + cash_krw + dom_cash) - total_principal_all
-        cls_fin = "txt-red" if final_pl_calc >= 0 else "txt-blue"
-        
-        cash_row = f"<tr class='row-cash'><td>Cash (USD/KRW)</td><td>{cash_krw+dom_cash:,.0f}</td><td>-</td><td>-</td><td>-</td><td>-</td><td>-</td></tr>"
-        total_row = f"<tr class='row-total'><td>TOTAL</td><td>{(sum_eval_krw + cash_krw + dom_cash):,.0f}</td><td>-</td><td>-</td><td>{sum_realized:,.0f}</td><td class='{cls_fin}'>{final_pl_calc:,.0f}</td><td>{safety_margin:+.1f}</td></tr>"
-        
-        full_table = header + rows_html + cash_row + total_row + "</tbody></table>"
-        st.markdown(full_table, unsafe_allow_html=True)
-
-    with tab3:
-        st.dataframe(df_trade[['Date', 'Ticker', 'Type', 'Qty', 'Price_USD', 'Note']].fillna(''), use_container_width=True)
-        st.dataframe(df_money[['Date', 'Type', 'USD_Amount', 'KRW_Amount', 'Note']].fillna(''), use_container_width=True)
-        st.dataframe(df_domestic[['Date', 'Type', 'Ticker', 'Qty', 'Price_KRW', 'Amount_KRW', 'Note']].fillna(''), use_container_width=True)
-
-    # ---------------------------------------------------------
-    # [Tab 4] Input Manager
-    # ---------------------------------------------------------
-    with tab4:
-        st.subheader("📝 입출금 및 배당 관리")
-        mode = st.radio("입력 모드", ["💬 카카오톡 파싱 (추천)", "✍️ 수기 입력"], horizontal=True)
-        st.divider()
-        
-        if mode == "💬 카카오톡 파싱 (추천)":
-            c1, c2 = st.columns([1, 2])
-            with c1: ref_date = st.date_input("📅 기준 날짜 (카톡 수신일)", datetime.now())
-            with c2: st.info("카톡 내용을 복사해서 아래에 붙여넣으세요. '저장하기' 버튼을 누르면 즉시 DB에 저장됩니다.")
-            
-            raw_text = st.text_area("카톡 내용 붙여넣기", height=200, placeholder="[한국투자증권 체결안내]08:05\n...")
-            
-            if st.button("🚀 저장하기 (분석 및 DB전송)", type="primary"):
-                if raw_text:
-                    parsed_items = parse_kakaotalk_final(raw_text, ref_date)
-                    count = 0
-                    if parsed_items:
-                        ws_trade = sheet_instance.worksheet("Trade_Log")
-                        ws_money = sheet_instance.worksheet("Money_Log")
-                        ws_dom = sheet_instance.worksheet("Domestic_Log")
-                        
-                        max_id = max(pd.to_numeric(df_trade['Order_ID']).max(), pd.to_numeric(df_money['Order_ID']).max())
-                        next_id = int(max_id) + 1 if not pd.isna(max_id) else 1
-                        
-                        for item in parsed_items:
-                            if item["Category"] == "Trade":
-                                ws_trade.append_row([ item["Date"], int(next_id), str(item["Ticker"]), str(item["Ticker"]), str(item["Type"]), int(item["Qty"]), float(item["Price"]), "", item["Memo"] ])
-                                next_id += 1
-                            elif item["Category"] == "Domestic_Trade":
-                                ws_dom.append_row([ item["Date"], str(item["Type"]), str(item["Ticker"]), "-", int(item["Qty"]), float(item["Price"]), float(item["Qty"]*item["Price"]), item["Memo"] ])
-                            elif item["Category"] == "Dividend":
-                                ws_money.append_row([ item["Date"], int(next_id), "Dividend", str(item["Ticker"]), 0, float(item["Price"]), 0, "", "", item["Memo"] ])
-                                next_id += 1
-                            
-                            # [NEW] 국내 ETF 배당 저장 로직 추가
-                            elif item["Category"] == "Domestic_Dividend":
-                                ws_dom.append_row([ item["Date"], "Dividend", str(item["Ticker"]), "-", 0, 0, float(item["Amount"]), item["Memo"] ])
-                                
-                            elif item["Category"] == "Exchange":
-                                ws_money.append_row([ item["Date"], int(next_id), "KRW_to_USD", "-", float(item["Amount"]), float(item["Price"]), float(item["Amount"]/item["Price"] if item["Price"]>0 else 0), "", "", item["Memo"] ])
-                                next_id += 1
-                            count += 1
-                            
-                        st.success(f"✅ {count}건 저장 완료! (캐시 초기화됨)")
-                        st.session_state['price_cache'] = {}
-                        st.cache_data.clear()
-                        time.sleep(2)
-                        st.rerun()
-                    else:
-                        st.warning("⚠️ 저장할 내역을 찾지 못했습니다. 텍스트를 확인해주세요.")
-        else:
-            with st.form("input_form"):
-                col1, col2 = st.columns(2)
-                i_date = col1.date_input("날짜", datetime.now())
-                i_usd = col2.number_input("금액 (USD)", min_value=0.01, step=0.01, format="%.2f")
-                i_krw = st.number_input("입금 원화 (KRW)", min_value=0, step=100)
-                i_ticker = st.text_input("종목코드 (배당 시)")
-                i_type = st.selectbox("유형", ["KRW_to_USD", "Dividend", "Withdraw"])
-                i_note = st.text_input("비고", value="수기입력")
-                
-                if st.form_submit_button("💾 저장하기"):
-                    max_id = max(pd.to_numeric(df_trade['Order_ID']).max(), pd.to_numeric(df_money['Order_ID']).max())
-                    next_id = int(max_id) + 1 if not pd.isna(max_id) else 1
-                    rate = i_krw / i_usd if i_type=="KRW_to_USD" and i_usd > 0 else 0
-                    
-                    sheet_instance.worksheet("Money_Log").append_row([
-                        i_date.strftime("%Y-%m-%d"), int(next_id), i_type, i_ticker,
-                        int(i_krw), float(i_usd), float(rate), "", "", i_note
-                    ])
-                    st.success("저장 완료!")
-                    st.session_state['price_cache'] = {}
-                    st.cache_data.clear()
-                    time.sleep(1)
-                    st.rerun()
+    if KIS_STREAM_ENABLED and kis.KIS_CONFIGURED:
+        live_holdings = {tk: d['qty'] for tk, d in portfolio.items() if not d['is_domestic'] and d['qty'] > 0}
+        if live_holdings:
+            kis_stream.ensure_subscribed(list(live_holdings))
+            render_live_quotes(live_holdings, prices, cur_real_rate)
+
+    tab1, tab_hist, tab2, tab_tax, tab3, tab4 = st.tabs(["📊 대시보드", "📈 자산 추이", "📋 통합 상세", "🧾 양도세", "📜 통합 로그", "🕹️ 입력 매니저"], key="main_tab", on_change="rerun")
+    if tab1.open:
+        with tab1, perf.timed("render.dashboard"): render_dashboard_tab(portfolio, metrics)
+    if tab_hist.open:
+        with tab_hist, perf.timed("render.history"): render_history_tab(df_trade, df_money, df_domestic, prices, cur_real_rate, metrics)
+    if tab2.open:
+        with tab2, perf.timed("render.table"): render_table_tab(portfolio, metrics, cur_bal, cur_real_rate, dom_cash, total_principal_all, safety_margin)
+    if tab_tax.open:
+        with tab_tax, perf.timed("render.tax"): render_tax_tab(df_trade, df_money, df_domestic, prices, cur_real_rate)
+    if tab3.open:
+        with tab3, perf.timed("render.logs"): render_log_tab(df_trade, df_money, df_domestic)
+    if tab4.open:
+        with tab4, perf.timed("render.input"): render_input_manager(sheet_instance, df_trade, df_money, df_domestic)
+
+    if PERF_PANEL_ENABLED:
+        render_diagnostics()
 
 if __name__ == "__main__":
     main()
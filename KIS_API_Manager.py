@@ -1,101 +1,252 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import os
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime, timedelta
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import Perf_Monitor as perf
 
 # =========================================================
 # [1] 설정 및 상수
 # =========================================================
-try:
-    URL_BASE = st.secrets["kis_api"]["URL_BASE"]
-    APP_KEY = st.secrets["kis_api"]["APP_KEY"]
-    APP_SECRET = st.secrets["kis_api"]["APP_SECRET"]
-    CANO = st.secrets["kis_api"]["CANO"]
-    ACNT_PRDT_CD = st.secrets["kis_api"]["ACNT_PRDT_CD"]
-except Exception:
-    st.error("secrets.toml 파일 설정을 확인해주세요.")
-    st.stop()
+KIS_CONFIG_KEYS = ["URL_BASE", "APP_KEY", "APP_SECRET", "CANO", "ACNT_PRDT_CD"]
+
+def _load_config():
+    # secrets.toml [kis_api] -> 환경변수 KIS_<키> 순. 둘 다 없으면 빈 값 (import 는 계속, KIS 호출만 꺼짐)
+    try:
+        return {k: st.secrets["kis_api"][k] for k in KIS_CONFIG_KEYS}
+    except Exception:
+        return {k: os.environ.get(f"KIS_{k}", "") for k in KIS_CONFIG_KEYS}
+
+_config = _load_config()
+URL_BASE, APP_KEY, APP_SECRET, CANO, ACNT_PRDT_CD = (_config[k] for k in KIS_CONFIG_KEYS)
+KIS_CONFIGURED = all(_config.values())
+if not KIS_CONFIGURED:
+    print("KIS API 설정 없음: secrets.toml [kis_api] 또는 KIS_* 환경변수를 확인해주세요.")
+
+# KIS REST 호출 제한 (실전계좌 초당 20건) 대비 여유를 둔 값
+KIS_MAX_CALLS_PER_SEC = 15
+KIS_MAX_WORKERS = 5
+
+class _RateLimiter:
+    # 전 스레드 공용: 호출 간 최소 간격을 보장하는 단순 스로틀
+    def __init__(self, calls_per_sec):
+        self.interval = 1.0 / calls_per_sec
+        self.lock = threading.Lock()
+        self.next_ts = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait_sec = self.next_ts - now
+            self.next_ts = max(now, self.next_ts) + self.interval
+        if wait_sec > 0: time.sleep(wait_sec)
+
+_rate_limiter = _RateLimiter(KIS_MAX_CALLS_PER_SEC)
+
+# 공용 HTTP 세션: keep-alive 연결 재사용 + 연결/읽기 타임아웃 + 전송 계층 재시도
+KIS_TIMEOUT = (3.05, 10)   # (connect, read) 초
+KIS_POOL_SIZE = KIS_MAX_WORKERS * 2
+
+def _build_session():
+    retry = Retry(
+        total=2, connect=2, read=1, status=2,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=KIS_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+_session = _build_session()
+
+# 로컬 캐시 파일 위치 (거래소 코드 맵 등)
+LOCAL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".local_cache")
+EXCHANGE_MAP_PATH = os.path.join(LOCAL_CACHE_DIR, "kis_exchange_map.json")
+EXCHANGE_CODES = ["NYS", "NAS", "AMS"]
 
 # =========================================================
 # [2] 토큰 관리 (Smart Refresh)
 # =========================================================
+TOKEN_SAFETY_MARGIN = timedelta(hours=1)    # 만료 1시간 전부터는 쓰지 않음
+TOKEN_REFRESH_AHEAD = timedelta(hours=2)    # 만료 2시간 전부터 백그라운드 갱신
+TOKEN_MIN_REISSUE_SEC = 60                  # tokenP 발급 제한 대비 최소 재발급 간격
+
+_sheet_client = None
+_sheet_client_lock = threading.Lock()
+
 def get_sheet_client():
-    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-    creds_dict = dict(st.secrets["gcp_service_account"])
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-    return gspread.authorize(creds)
+    global _sheet_client
+    with _sheet_client_lock:
+        if _sheet_client is None:
+            scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+            creds_dict = dict(st.secrets["gcp_service_account"])
+            creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
+            _sheet_client = gspread.authorize(creds)
+        return _sheet_client
 
-def get_access_token(force_refresh=False):
-    if not force_refresh and 'kis_token' in st.session_state:
-        return st.session_state['kis_token']
+class _TokenManager:
+    # 프로세스 공용 토큰 보관소: 세션이 바뀌어도 메모리에서 바로 반환, 발급은 lock 으로 1회만
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.token = None
+        self.expiry = None
+        self.issued_ts = 0.0
+        self.loaded = False
+        self.refreshing = False
+        self.ws = None
 
-    client = get_sheet_client()
-    try:
-        sh = client.open("Investment_Dashboard_DB")
-        ws = sh.worksheet("Token_Storage")
-        token_val = ws.acell('A1').value
-        expiry_val = ws.acell('B1').value
-        
-        if not force_refresh and token_val and expiry_val:
-            expiry_dt = datetime.strptime(expiry_val, "%Y-%m-%d %H:%M:%S")
-            if datetime.now() < expiry_dt - timedelta(hours=1):
-                st.session_state['kis_token'] = token_val
-                return token_val
-    except:
-        pass
+    def _usable(self):
+        return self.token and self.expiry and datetime.now() < self.expiry - TOKEN_SAFETY_MARGIN
 
-    headers = {"content-type": "application/json"}
-    body = {
-        "grant_type": "client_credentials",
-        "appkey": APP_KEY,
-        "appsecret": APP_SECRET
-    }
-    
-    try:
-        res = requests.post(f"{URL_BASE}/oauth2/tokenP", headers=headers, data=json.dumps(body))
-        data = res.json()
-        
-        if res.status_code == 200 and 'access_token' in data:
-            new_token = data['access_token']
-            expires_in = data['expires_in']
-            expiry_dt = datetime.now() + timedelta(seconds=expires_in)
-            
-            try:
-                ws.update_acell('A1', new_token)
-                ws.update_acell('B1', expiry_dt.strftime("%Y-%m-%d %H:%M:%S"))
-            except:
-                pass
-            
-            st.session_state['kis_token'] = new_token
-            return new_token
-        return None
-    except Exception as e:
-        print(f"Token Error: {e}")
-        return None
+    def _storage(self):
+        if self.ws is None:
+            self.ws = get_sheet_client().open("Investment_Dashboard_DB").worksheet("Token_Storage")
+        return self.ws
+
+    def _load_from_sheet(self):
+        # A1(토큰), B1(만료시각) 한 번에 읽기
+        self.loaded = True
+        perf.count("kis.token_sheet_read")
+        try:
+            values = self._storage().get('A1:B1')
+            token_val, expiry_val = (list(values[0]) + ['', ''])[:2] if values else ('', '')
+            if token_val and expiry_val:
+                self.token = token_val
+                self.expiry = datetime.strptime(expiry_val, "%Y-%m-%d %H:%M:%S")
+        except Exception as e:
+            print(f"Token Storage Read Error: {e}")
+
+    def _issue(self):
+        headers = {"content-type": "application/json"}
+        body = {
+            "grant_type": "client_credentials",
+            "appkey": APP_KEY,
+            "appsecret": APP_SECRET
+        }
+        perf.count("kis.token_issue")
+        try:
+            res = _session.post(f"{URL_BASE}/oauth2/tokenP", headers=headers, data=json.dumps(body), timeout=KIS_TIMEOUT)
+            data = res.json()
+            if res.status_code == 200 and 'access_token' in data:
+                self.token = data['access_token']
+                self.expiry = datetime.now() + timedelta(seconds=data['expires_in'])
+                self.issued_ts = time.time()
+                try:
+                    self._storage().update(range_name='A1:B1', values=[[self.token, self.expiry.strftime("%Y-%m-%d %H:%M:%S")]])
+                except Exception as e:
+                    print(f"Token Storage Write Error: {e}")
+                return self.token
+            return None
+        except Exception as e:
+            print(f"Token Error: {e}")
+            return None
+
+    def _refresh_in_background(self):
+        try:
+            with self.lock:
+                if self.expiry and datetime.now() < self.expiry - TOKEN_REFRESH_AHEAD: return
+                self._issue()
+        finally:
+            self.refreshing = False
+
+    def get(self, force_refresh=False, stale_token=None):
+        if not KIS_CONFIGURED: return None
+        if not force_refresh and self._usable():
+            if datetime.now() >= self.expiry - TOKEN_REFRESH_AHEAD and not self.refreshing:
+                self.refreshing = True
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+            return self.token
+
+        with self.lock:
+            # 기다리는 동안 다른 세션이 이미 갱신했으면 그 토큰 사용
+            if force_refresh and stale_token and self.token != stale_token and self._usable():
+                return self.token
+            if not force_refresh:
+                if not self.loaded: self._load_from_sheet()
+                if self._usable(): return self.token
+            elif self.token and time.time() - self.issued_ts < TOKEN_MIN_REISSUE_SEC:
+                return self.token
+            return self._issue()
+
+_token_manager = _TokenManager()
+
+def get_access_token(force_refresh=False, stale_token=None):
+    return _token_manager.get(force_refresh=force_refresh, stale_token=stale_token)
 
 def _request_api(method, url, headers, params=None, body=None):
-    if method == 'GET':
-        res = requests.get(url, headers=headers, params=params)
-    else:
-        res = requests.post(url, headers=headers, data=json.dumps(body))
+    with perf.timed("kis.rate_wait"):
+        _rate_limiter.wait()
+    perf.count("kis.api_calls")
+    with perf.timed("kis.request"):
+        if method == 'GET':
+            res = _session.get(url, headers=headers, params=params, timeout=KIS_TIMEOUT)
+        else:
+            res = _session.post(url, headers=headers, data=json.dumps(body), timeout=KIS_TIMEOUT)
     
     if res.status_code != 200 or res.json().get('msg_cd') == 'EGW00123':
-        new_token = get_access_token(force_refresh=True)
+        perf.count("kis.token_retry")
+        used_token = headers.get("authorization", "").replace("Bearer ", "")
+        new_token = get_access_token(force_refresh=True, stale_token=used_token)
         if not new_token: return res
         
         headers["authorization"] = f"Bearer {new_token}"
-        if method == 'GET':
-            res = requests.get(url, headers=headers, params=params)
-        else:
-            res = requests.post(url, headers=headers, data=json.dumps(body))
+        _rate_limiter.wait()
+        perf.count("kis.api_calls")
+        with perf.timed("kis.request"):
+            if method == 'GET':
+                res = _session.get(url, headers=headers, params=params, timeout=KIS_TIMEOUT)
+            else:
+                res = _session.post(url, headers=headers, data=json.dumps(body), timeout=KIS_TIMEOUT)
             
     return res
 
-def get_current_price(ticker):
-    token = get_access_token()
+# =========================================================
+# [2.5] 종목 -> 거래소 코드(EXCD) 캐시
+# =========================================================
+_exchange_lock = threading.Lock()
+_exchange_map = None
+
+def _load_exchange_map():
+    global _exchange_map
+    if _exchange_map is None:
+        try:
+            with open(EXCHANGE_MAP_PATH, encoding="utf-8") as f:
+                _exchange_map = json.load(f)
+        except:
+            _exchange_map = {}
+    return _exchange_map
+
+def _save_exchange(ticker, excd):
+    with _exchange_lock:
+        ex_map = _load_exchange_map()
+        if ex_map.get(ticker) == excd: return
+        ex_map[ticker] = excd
+        try:
+            os.makedirs(LOCAL_CACHE_DIR, exist_ok=True)
+            tmp_path = EXCHANGE_MAP_PATH + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(ex_map, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(tmp_path, EXCHANGE_MAP_PATH)
+        except Exception as e:
+            print(f"Exchange Map Save Error: {e}")
+
+def get_exchange_code(ticker):
+    with _exchange_lock:
+        return _load_exchange_map().get(ticker)
+
+def get_current_price(ticker, token=None):
+    if token is None: token = get_access_token()
     if not token: return 0.0
 
     headers = {
@@ -106,7 +257,11 @@ def get_current_price(ticker):
         "tr_id": "HHDFS00000300"
     }
     
-    markets = ["NYS", "NAS", "AMS"]
+    # 캐시된 거래소를 먼저 조회하고, 실패할 때만 나머지 거래소를 재탐색
+    cached_mkt = get_exchange_code(ticker)
+    markets = EXCHANGE_CODES
+    if cached_mkt: markets = [cached_mkt] + [m for m in EXCHANGE_CODES if m != cached_mkt]
+
     for mkt in markets:
         params = {"AUTH": "", "EXCD": mkt, "SYMB": ticker}
         try:
@@ -114,60 +269,175 @@ def get_current_price(ticker):
             if res.status_code == 200:
                 data = res.json()
                 if data['rt_cd'] == '0':
-                    return float(data['output']['last'])
+                    price = float(data['output']['last'])
+                    if mkt != cached_mkt: _save_exchange(ticker, mkt)
+                    return price
         except:
             continue
     return 0.0
 
+def get_current_prices(tickers, max_workers=KIS_MAX_WORKERS):
+    # 여러 종목 시세 동시 조회 -> {ticker: price}
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers: return {}
+
+    # 토큰은 한 번만 확보해서 모든 작업에 전달
+    token = get_access_token()
+    if not token: return {tk: 0.0 for tk in tickers}
+
+    workers = max(1, min(max_workers, len(tickers)))
+    with perf.timed("kis.quotes"), ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(lambda tk: get_current_price(tk, token=token), tickers)
+        return dict(zip(tickers, results))
+
 # =========================================================
 # [3] 핵심: 하이브리드 거래내역 조회 (기간별 + 잔고)
 # =========================================================
-def get_trade_history(start_date, end_date):
-    token = get_access_token()
-    if not token: return None
+SETTLED_AFTER_DAYS = 5     # T+3 영업일 + 주말 여유: 이보다 오래된 날짜는 확정분으로 보고 캐시
+MAX_PAGES = 200            # 연속조회 무한 루프 방지
+
+_trade_day_lock = threading.Lock()
 
-    final_result = []
+def _trade_day_cache_path():
+    # 계좌별 확정 체결 내역 날짜 캐시 (매매일 기준, 결제일 기준이던 이전 캐시와 파일을 나눔)
+    return os.path.join(LOCAL_CACHE_DIR, f"kis_trade_days_v2_{CANO}.json")
+
+def _iter_pages(url, headers, params):
+    # 연속조회: 응답 헤더 tr_cont 가 F/M 이면 ctx_area 키를 넘겨 다음 페이지 요청
+    headers = dict(headers, tr_cont="")
+    params = dict(params)
+    for _ in range(MAX_PAGES):
+        res = _request_api('GET', url, headers, params=params)
+        if res.status_code != 200: raise RuntimeError(f"HTTP {res.status_code}")
+        data = res.json()
+        if data.get('rt_cd', '0') != '0': raise RuntimeError(f"{data.get('msg_cd')} {data.get('msg1')}")
+        yield data
+        if res.headers.get('tr_cont') not in ('F', 'M'): return
+        params["CTX_AREA_FK100"] = data.get('ctx_area_fk100', '').strip()
+        params["CTX_AREA_NK100"] = data.get('ctx_area_nk100', '').strip()
+        headers["tr_cont"] = "N"
+
+def _load_trade_days():
+    try:
+        with open(_trade_day_cache_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except:
+        return {}
 
+def _save_trade_days(days):
+    try:
+        os.makedirs(LOCAL_CACHE_DIR, exist_ok=True)
+        tmp_path = _trade_day_cache_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(days, f, ensure_ascii=False)
+        os.replace(tmp_path, _trade_day_cache_path())
+    except Exception as e:
+        print(f"Trade Day Cache Save Error: {e}")
+
+def _day_range(start_date, end_date):
+    d = datetime.strptime(start_date, "%Y%m%d")
+    end = datetime.strptime(end_date, "%Y%m%d")
+    while d <= end:
+        yield d.strftime("%Y%m%d")
+        d += timedelta(days=1)
+
+def _missing_runs(days, cached):
+    # 캐시에 없는 날짜들을 연속 구간 [(시작, 끝), ...] 으로 묶기
+    runs = []
+    for day in days:
+        if day in cached: continue
+        prev = (datetime.strptime(day, "%Y%m%d") - timedelta(days=1)).strftime("%Y%m%d")
+        if runs and runs[-1][1] == prev: runs[-1][1] = day
+        else: runs.append([day, day])
+    return runs
+
+def _iter_period_trans(token, start_date, end_date):
     # --- TRACK A: 기간별 결제내역 조회 (CTOS4001R) ---
     # * 목적: 이미 결제(T+3)가 끝나서 원장에 박제된 '확정 데이터' 조회
-    try:
-        headers_hist = {
-            "content-type": "application/json",
-            "authorization": f"Bearer {token}",
-            "appkey": APP_KEY,
-            "appsecret": APP_SECRET,
-            "tr_id": "CTOS4001R", 
-            "custtype": "P"
-        }
-        
-        params_hist = {
-            "CANO": CANO,
-            "ACNT_PRDT_CD": ACNT_PRDT_CD,
-            "ORD_DT_S": start_date, # YYYYMMDD
-            "ORD_DT_E": end_date,   # YYYYMMDD
-            "WCRC_DVSN": "00",      # 외화기준
-            "CTX_AREA_FK100": "",
-            "CTX_AREA_NK100": ""
-        }
-        
-        res_hist = _request_api('GET', f"{URL_BASE}/uapi/overseas-stock/v1/trading/inquire-period-trans", headers_hist, params=params_hist)
-        
-        if res_hist.status_code == 200:
-            data = res_hist.json()
-            if 'output1' in data:
-                for item in data['output1']:
-                    if item.get('dt') and float(item.get('ccld_qty', 0)) > 0:
-                        final_result.append({
-                            'dt': item['dt'],  # 날짜
-                            'pdno': item['pdno'], # 종목코드
-                            'prdt_name': item['ovrs_item_name'],
-                            'sll_buy_dvsn_cd': item['sll_buy_dvsn_cd'], # 01:매도, 02:매수
-                            'ccld_qty': str(int(float(item['ccld_qty']))),
-                            'ft_ccld_unpr3': item.get('ovrs_stck_ccld_unpr', '0') # 체결단가
-                        })
-    except Exception:
-        pass
+    headers_hist = {
+        "content-type": "application/json",
+        "authorization": f"Bearer {token}",
+        "appkey": APP_KEY,
+        "appsecret": APP_SECRET,
+        "tr_id": "CTOS4001R", 
+        "custtype": "P"
+    }
+    
+    params_hist = {
+        "CANO": CANO,
+        "ACNT_PRDT_CD": ACNT_PRDT_CD,
+        "ORD_DT_S": start_date, # YYYYMMDD
+        "ORD_DT_E": end_date,   # YYYYMMDD
+        "WCRC_DVSN": "00",      # 외화기준
+        "CTX_AREA_FK100": "",
+        "CTX_AREA_NK100": ""
+    }
+    
+    for data in _iter_pages(f"{URL_BASE}/uapi/overseas-stock/v1/trading/inquire-period-trans", headers_hist, params_hist):
+        for item in data.get('output1', []):
+            if item.get('dt') and float(item.get('ccld_qty', 0)) > 0:
+                yield {
+                    'dt': item['dt'],  # 날짜 (조회 기준일, 결제 기준으로 매매일과 다를 수 있음)
+                    'trad_dt': item.get('trad_dt', ''),  # 매매일자 (장부 기록은 이 날짜 기준)
+                    'pdno': item['pdno'], # 종목코드
+                    'prdt_name': item['ovrs_item_name'],
+                    'sll_buy_dvsn_cd': item['sll_buy_dvsn_cd'], # 01:매도, 02:매수
+                    'ccld_qty': str(int(float(item['ccld_qty']))),
+                    'ft_ccld_unpr3': item.get('ovrs_stck_ccld_unpr', '0') # 체결단가
+                }
 
+def _iter_settled_history(token, start_date, end_date):
+    # 확정 구간: 날짜별 캐시에 없는 연속 구간만 조회 후 날짜 단위로 저장 (거래 없는 날도 빈 목록으로 저장)
+    settled_until = (datetime.now() - timedelta(days=SETTLED_AFTER_DAYS)).strftime("%Y%m%d")
+    with _trade_day_lock:
+        cached = _load_trade_days()
+    all_days = list(_day_range(start_date, end_date))
+    settled_days = [d for d in all_days if d <= settled_until]
+    runs = {run[0]: run for run in _missing_runs(settled_days, cached)}
+    perf.count("kis.trade_days_cached", sum(d in cached for d in settled_days))
+    perf.count("kis.trade_day_runs_fetched", len(runs))
+
+    run_items = {}
+    for day in settled_days:
+        if day in cached:
+            yield from cached[day]
+            continue
+        if day in runs:
+            run_start, run_end = runs[day]
+            fetched = {d: [] for d in _day_range(run_start, run_end)}
+            stray = []
+            try:
+                # ORD_DT 는 매매일로 거르므로 매매일(trad_dt)로 날짜를 나눔 (결제일 dt 는 구간 뒤로 넘어갈 수 있음)
+                for item in _iter_period_trans(token, run_start, run_end):
+                    day_key = item.get('trad_dt') or item['dt']
+                    if day_key in fetched: fetched[day_key].append(item)
+                    else: stray.append(item)
+                # 매매일을 알 수 없는 항목이 있으면 구간 끝에 붙여 내보내고 캐시하지 않음 (다음 동기화에서 다시 조회)
+                if stray:
+                    fetched[run_end].extend(stray)
+                else:
+                    with _trade_day_lock:
+                        days = _load_trade_days()
+                        days.update(fetched)
+                        _save_trade_days(days)
+                run_items = fetched
+            except Exception as e:
+                # 중간에 실패한 구간은 일부만 내보내지 않음 (다음 동기화에서 구간 전체를 다시 조회)
+                print(f"Trade History Error ({run_start}~{run_end}): {e}")
+                run_items = {}
+        yield from run_items.get(day, [])
+
+    # 미결제 꼬리 구간은 매번 새로 조회 (실패 시 역시 전부 버림)
+    tail_days = [d for d in all_days if d > settled_until]
+    if tail_days:
+        try:
+            tail = list(_iter_period_trans(token, tail_days[0], tail_days[-1]))
+        except Exception as e:
+            print(f"Trade History Error ({tail_days[0]}~{tail_days[-1]}): {e}")
+            tail = []
+        yield from tail
+
+def _iter_present_balance(token):
     # --- TRACK B: 체결기준 현재잔고 조회 (CTRP6504R) ---
     # * 목적: 아직 결제일이 안 되어 A트랙에 안 뜨는 '당일/최근 체결분' 확인
     # * 2월 3일 거래(미결제)는 여기서 잡힐 것입니다.
@@ -201,15 +471,27 @@ def get_trade_history(start_date, end_date):
                     
                     if today_buy > 0:
                         # 잔고 API는 날짜를 안 주므로 '오늘'로 가정하고 생성
-                        final_result.append({
+                        yield {
                             'dt': datetime.now().strftime("%Y%m%d"), 
                             'pdno': item['pdno'],
                             'prdt_name': item['prdt_name'],
                             'sll_buy_dvsn_cd': '02', # 매수
                             'ccld_qty': str(int(today_buy)),
                             'ft_ccld_unpr3': item.get('pchs_avg_pric', '0') # 매입평균가 사용
-                        })
+                        }
     except Exception:
         pass
 
-    return {'output1': final_result}
+def iter_trade_history(start_date, end_date, include_present=True):
+    # 체결 내역을 한 건씩 흘려보내는 제너레이터 (A트랙: 확정분 캐시 + 미결제 꼬리, B트랙: 당일 체결)
+    # * B트랙은 매입평균가 기준 추정치라 장부 기록용으로는 include_present=False
+    token = get_access_token()
+    if not token: return
+    yield from _iter_settled_history(token, start_date, end_date)
+    if include_present:
+        yield from _iter_present_balance(token)
+
+def get_trade_history(start_date, end_date):
+    token = get_access_token()
+    if not token: return None
+    return {'output1': list(iter_trade_history(start_date, end_date))}
@@ -0,0 +1,144 @@
+import json
+import time
+import threading
+from websockets.sync.client import connect
+import KIS_API_Manager as kis
+
+# =========================================================
+# [1] 설정 및 상수
+# =========================================================
+WS_URL = None                    # None 이면 URL_BASE 로 실전(21000)/모의(31000) 판별
+
+STREAM_TR_ID = "HDFSCNT0"        # 해외주식 실시간지연체결가
+STREAM_FIELD_COUNT = 26          # RSYM^SYMB^ZDIV^TYMD^XYMD^XHMS^KYMD^KHMS^OPEN^HIGH^LOWE^LAST^SIGN^DIFF^RATE^...
+STREAM_MAX_SUBSCRIPTIONS = 40    # 세션당 실시간 등록 한도(41) 여유
+STREAM_FRESH_SEC = 30            # 이보다 오래된 실시간 값은 REST 시세로 대체
+STREAM_RECV_TIMEOUT = 1.0        # 구독 변경 반영 주기
+STREAM_MAX_BACKOFF_SEC = 60
+
+# =========================================================
+# [2] 접속키 (웹소켓 전용, 24시간 유효)
+# =========================================================
+def get_approval_key():
+    body = {"grant_type": "client_credentials", "appkey": kis.APP_KEY, "secretkey": kis.APP_SECRET}
+    res = kis._session.post(f"{kis.URL_BASE}/oauth2/Approval", headers={"content-type": "application/json"}, data=json.dumps(body), timeout=kis.KIS_TIMEOUT)
+    return res.json()["approval_key"]
+
+def _ws_url():
+    if WS_URL: return WS_URL
+    return "ws://ops.koreainvestment.com:31000" if "openapivts" in kis.URL_BASE else "ws://ops.koreainvestment.com:21000"
+
+def _tr_key(ticker):
+    # 'D' + 거래소(NAS/NYS/AMS) + 종목. 거래소를 아직 모르면 None (추측한 거래소로 구독하면 값이 오지 않음)
+    # * REST 시세 조회가 거래소를 알아내 저장하므로 다음 ensure_subscribed 에서 구독됨
+    excd = kis.get_exchange_code(ticker)
+    return f"D{excd}{ticker}" if excd else None
+
+def _request(approval_key, tr_key, subscribe=True):
+    return json.dumps({
+        "header": {"approval_key": approval_key, "custtype": "P", "tr_type": "1" if subscribe else "2", "content-type": "utf-8"},
+        "body": {"input": {"tr_id": STREAM_TR_ID, "tr_key": tr_key}}
+    })
+
+# =========================================================
+# [3] 실시간 시세 테이블 (연결/구독/재접속은 수신 스레드 하나가 전담)
+# =========================================================
+class _QuoteStream:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.quotes = {}        # {ticker: {'price', 'rate', 'diff', 'ts'}}
+        self.wanted = {}        # {tr_key: ticker}
+        self.subscribed = set()
+        self.approval_key = None
+        self.approval_ts = 0.0
+        self.connected = False
+        self.thread = None
+
+    def _approval(self):
+        if not self.approval_key or time.time() - self.approval_ts > 12 * 3600:
+            self.approval_key, self.approval_ts = get_approval_key(), time.time()
+        return self.approval_key
+
+    def _sync_subscriptions(self, ws):
+        with self.lock:
+            wanted = set(self.wanted)
+        for tr_key in self.subscribed - wanted:
+            ws.send(_request(self.approval_key, tr_key, subscribe=False))
+        for tr_key in wanted - self.subscribed:
+            ws.send(_request(self.approval_key, tr_key))
+        self.subscribed = wanted
+
+    def _handle(self, ws, msg):
+        if msg[:1] in ("0", "1"):
+            # 0|TR_ID|건수|필드^필드^... (1 은 암호화 - 체결가 피드에는 없음)
+            parts = msg.split("|", 3)
+            if msg[0] != "0" or len(parts) < 4 or parts[1] != STREAM_TR_ID: return
+            fields = parts[3].split("^")
+            try: n = max(int(parts[2]), 1)
+            except ValueError: return
+            # 건수 x 필드 수가 맞지 않으면 레코드 경계를 알 수 없으므로 메시지 전체를 버림
+            if len(fields) != n * STREAM_FIELD_COUNT: return
+            now_ts = time.time()
+            with self.lock:
+                for i in range(n):
+                    rec = fields[i * STREAM_FIELD_COUNT:(i + 1) * STREAM_FIELD_COUNT]
+                    ticker = self.wanted.get(rec[0], rec[1])
+                    try:
+                        self.quotes[ticker] = {'price': float(rec[11]), 'diff': float(rec[13]), 'rate': float(rec[14]), 'ts': now_ts}
+                    except ValueError:
+                        continue
+            return
+        data = json.loads(msg)
+        header = data.get("header", {})
+        if header.get("tr_id") == "PINGPONG":
+            ws.send(msg)
+        elif data.get("body", {}).get("rt_cd") not in (None, "0"):
+            print(f"KIS Stream Subscribe Error ({header.get('tr_key')}): {data['body'].get('msg1')}")
+
+    def _run(self):
+        backoff = 1
+        while True:
+            try:
+                self._approval()
+                with connect(_ws_url(), open_timeout=10, close_timeout=2, ping_interval=None) as ws:
+                    self.connected, self.subscribed, backoff = True, set(), 1
+                    while True:
+                        self._sync_subscriptions(ws)
+                        try:
+                            msg = ws.recv(timeout=STREAM_RECV_TIMEOUT)
+                        except TimeoutError:
+                            continue
+                        self._handle(ws, msg)
+            except Exception as e:
+                print(f"KIS Stream Error: {e}")
+            self.connected = False
+            time.sleep(backoff)
+            backoff = min(backoff * 2, STREAM_MAX_BACKOFF_SEC)
+
+    def ensure(self, tickers):
+        keys = [(_tr_key(tk), tk) for tk in dict.fromkeys(tickers)]
+        wanted = dict([(key, tk) for key, tk in keys if key][:STREAM_MAX_SUBSCRIPTIONS])
+        with self.lock:
+            self.wanted = wanted
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def get(self, tickers=None, max_age=STREAM_FRESH_SEC):
+        now_ts = time.time()
+        with self.lock:
+            items = self.quotes.items() if tickers is None else [(tk, self.quotes.get(tk)) for tk in tickers]
+            return {tk: dict(q) for tk, q in items if q and now_ts - q['ts'] <= max_age}
+
+_stream = _QuoteStream()
+
+def ensure_subscribed(tickers):
+    # 보유 해외 종목 실시간 구독 (목록이 바뀌면 다음 수신 주기에 등록/해제, 거래소를 모르는 종목은 건너뜀)
+    _stream.ensure(tickers)
+
+def get_live_quotes(tickers=None, max_age=STREAM_FRESH_SEC):
+    # {ticker: {'price', 'rate', 'diff', 'ts'}} (max_age 초 이내 값만)
+    return _stream.get(tickers, max_age)
+
+def is_connected():
+    return _stream.connected
@@ -0,0 +1,259 @@
+import re
+from functools import lru_cache
+from datetime import date, datetime, timedelta
+
+# =========================================================
+# [1] 패턴 (모듈 로드 시 1회 컴파일)
+# =========================================================
+# 메시지 시작 표지 -> 블록 종류. 표지마다 리터럴 접두어 스캔 후 위치순으로 병합 (긴 교대 패턴보다 빠름)
+_ANCHORS = [
+    ("trade", re.compile(r'\[한국투자증권 체결안내\]')),
+    ("div", re.compile(r'최원준님(?=\s*\d{2}/\d{2})')),
+    ("dom_div", re.compile(r'ETF 결산분배금 입금 안내')),
+    ("exchange", re.compile(r'외화매수환전')),
+]
+TRADE_HEADER = "[한국투자증권 체결안내]"
+STREAM_CHUNK_LINES = 4096     # 스트리밍 시 한 번에 정규화/스캔하는 줄 수
+MAX_BLOCK_CHARS = 4096        # 블록 하나의 최대 길이 (메모리 상한, 안내 메시지는 보통 수백 자)
+
+# 체결안내: 기존 파서와 같은 패턴으로 블록(다음 체결안내 직전까지) 전체를 검색 (필드별 첫 매치)
+_TIME = re.compile(r'\s*(\d{2}:\d{2})')
+_DOM_SIDE = re.compile(r'\*매매구분:현금(매수|매도)체결')
+_DOM_NAME = re.compile(r'\*종목명:.*?\(([\dA-Za-z]+)\)')
+_DOM_PRICE = re.compile(r'\*체결단가:([\d,]+)원')
+_OVS_SIDE = re.compile(r'\*매매구분:(매수|매도)')
+_OVS_NAME = re.compile(r'\*종목명:([A-Za-z0-9 ]+)(?:/|$)')   # '$' 는 블록 끝
+_OVS_PRICE = re.compile(r'\*체결단가:USD\s*([\d.]+)')
+_QTY = re.compile(r'\*체결수량:([\d,]+)')
+
+# 입금/환전 안내: 표지 조각에서 시작해 맞을 때까지 뒤 조각을 이어 붙여 매칭 (기존 전체 텍스트 매칭과 같은 범위, MAX_BLOCK_CHARS 까지)
+_DIV = re.compile(r'최원준님\s*(\d{2}/\d{2}).*?([A-Z]+)/.*?USD\s*([\d.]+)\s*세전배당입금', re.DOTALL)
+_DOM_DIV = re.compile(
+    r'ETF 결산분배금 입금 안내.*?'
+    r'\*\s*종목명\s*:\s*(.*?)\s*\*'
+    r'.*?'
+    r'\*\s*입금액\s*:\s*([\d,]+)원.*?'
+    r'\*\s*입금일자\s*:\s*(\d{4})년\s*(\d{2})월\s*(\d{2})일',
+    re.DOTALL
+)
+_EXCHANGE = re.compile(r'외화매수환전.*?￦([0-9,]+).*?@([0-9,.]+).*?USD\s*([0-9,.]+)', re.DOTALL)
+
+# 한국 이름 -> 종목코드 변환 사전
+K_ETF_NAME_TO_CODE = {
+    "TIGER 미국배당다우존스": "458730"
+    # 나중에 다른 종목이 생기면 여기에 "이름": "코드" 추가
+}
+
+# parse_kakaotalk 결과 순서 (매매 -> 해외배당 -> 국내배당 -> 환전)
+CATEGORY_ORDER = {"Trade": 0, "Domestic_Trade": 0, "Dividend": 1, "Domestic_Dividend": 2, "Exchange": 3}
+
+# =========================================================
+# [2] 토큰화: 줄 스트림 -> (표지 종류, 원문 조각)
+#     - 조각은 표지에서 다음 표지 직전까지의 원문 그대로 (이어 붙이면 정규화된 전체 텍스트와 같음)
+# =========================================================
+def _iter_chunks(lines):
+    # 줄 앞뒤 공백 제거 + 빈 줄 제외 (기존 full_text 정규화와 동일) 후 청크 단위로 이어 붙임
+    buf = []
+    for line in lines:
+        buf.append(line)
+        if len(buf) >= STREAM_CHUNK_LINES:
+            yield "\n".join(filter(None, map(str.strip, buf)))
+            buf = []
+    if buf: yield "\n".join(filter(None, map(str.strip, buf)))
+
+def _anchor_hits(text, start):
+    hits = [(m.start(), kind) for kind, pattern in _ANCHORS for m in pattern.finditer(text, start)]
+    hits.sort()
+    return hits
+
+def iter_segments(lines):
+    # 첫 표지 이전 텍스트는 종류 None. 마지막 조각은 다음 청크와 이어 붙여서 계속 (표지는 한 줄 안에 있으므로 청크 경계에서 잘리지 않음)
+    kind, carry = None, ""
+    for chunk in _iter_chunks(lines):
+        if not chunk: continue
+        text = carry + "\n" + chunk if carry else chunk
+        pos = 0
+        for hit, hit_kind in _anchor_hits(text, len(carry)):
+            if hit > pos: yield kind, text[pos:hit]
+            kind, pos = hit_kind, hit
+        carry = text[pos:pos + MAX_BLOCK_CHARS]
+    if carry: yield kind, carry
+
+# =========================================================
+# [3] 블록별 매처
+# =========================================================
+@lru_cache(maxsize=4096)
+def _trade_date_str(base_date, time_str):
+    t_dt = datetime.combine(base_date, datetime.min.time()).replace(hour=int(time_str.split(':')[0]), minute=int(time_str.split(':')[1]))
+    return t_dt.strftime("%Y-%m-%d %H:%M:%S")
+
+@lru_cache(maxsize=4096)
+def _ovs_trade_date_str(base_date):
+    trade_dt = datetime.combine(base_date, datetime.min.time()) - timedelta(days=1)
+    return trade_dt.strftime("%Y-%m-%d 23:30:00")
+
+@lru_cache(maxsize=4096)
+def _date_str(year, month, day, hour):
+    # 배당/환전 날짜 문자열 (같은 날짜가 반복되므로 캐시, 없는 날짜는 ValueError 그대로)
+    return datetime(year, month, day, hour, 0, 0).strftime("%Y-%m-%d %H:%M:%S")
+
+def _parse_trade(text, base_date):
+    body = text[len(TRADE_HEADER):] if text.startswith(TRADE_HEADER) else text
+    time_match = _TIME.match(body)
+    time_str = time_match.group(1) if time_match else "00:00"
+    qty_m = _QTY.search(body)
+    if not qty_m: return None
+
+    # K-ETF(국내) 매수 패턴
+    dom_buy = _DOM_SIDE.search(body)
+    if dom_buy:
+        dom_name, dom_price = _DOM_NAME.search(body), _DOM_PRICE.search(body)
+        if dom_name and dom_price:
+            return {
+                "Category": "Domestic_Trade", "Date": _trade_date_str(base_date, time_str),
+                "Ticker": dom_name.group(1), "Name": "-", "Type": "Buy" if dom_buy.group(1) == "매수" else "Sell",
+                "Qty": int(qty_m.group(1).replace(',','')), "Price": float(dom_price.group(1).replace(',','')), "Amount": 0, "Memo": f"카톡파싱_{time_str}"
+            }
+
+    # 해외 매수 패턴
+    type_m, name_m, price_m = _OVS_SIDE.search(body), _OVS_NAME.search(body), _OVS_PRICE.search(body)
+    if type_m and name_m and price_m:
+        return {
+            "Category": "Trade", "Date": _ovs_trade_date_str(base_date),
+            "Ticker": name_m.group(1).strip(), "Type": "Buy" if type_m.group(1) == "매수" else "Sell",
+            "Qty": int(qty_m.group(1).replace(',','')), "Price": float(price_m.group(1).replace(',','')), "Amount": 0, "Memo": f"카톡파싱_{time_str}"
+        }
+    return None
+
+def _parse_div(text, base_date):
+    m = _DIV.match(text)
+    if not m: return None
+    date_part, ticker, amount = m.groups()
+    mon, day = map(int, date_part.split('/'))
+    return {
+        "Category": "Dividend", "Date": _date_str(base_date.year, mon, day, 15),
+        "Ticker": ticker.strip(), "Type": "Dividend",
+        "Qty": 0, "Price": float(amount), "Amount": 0, "Memo": "카톡파싱_배당"
+    }
+
+def _parse_dom_div(text, base_date):
+    m = _DOM_DIV.match(text)
+    if not m: return None
+    name, amount_str, year, month, day = m.groups()
+    name = name.strip()
+    # 카톡에 찍힌 입금일자 오후 3시로 픽스
+    return {
+        "Category": "Domestic_Dividend", "Date": _date_str(int(year), int(month), int(day), 15),
+        "Ticker": K_ETF_NAME_TO_CODE.get(name, name), "Type": "Dividend",
+        "Qty": 0, "Price": 0, "Amount": float(amount_str.replace(',', '')), "Memo": "카톡파싱_국내배당"
+    }
+
+def _parse_exchange(text, base_date):
+    m = _EXCHANGE.match(text)
+    if not m: return None
+    krw_str, rate_str, usd_str = m.groups()
+    return {
+        "Category": "Exchange", "Date": _date_str(base_date.year, base_date.month, base_date.day, 14),
+        "Ticker": "-", "Type": "KRW_to_USD",
+        "Qty": 0, "Price": float(usd_str.replace(',', '')),
+        "Amount": float(krw_str.replace(',', '')), "Memo": "카톡파싱_환전"
+    }
+
+def parse_block(kind, text, base_date):
+    try:
+        if kind == "trade": return _parse_trade(text, base_date)
+        if kind == "div": return _parse_div(text, base_date)
+        if kind == "dom_div": return _parse_dom_div(text, base_date)
+        if kind == "exchange": return _parse_exchange(text, base_date)
+    except: pass
+    return None
+
+# =========================================================
+# [4] 진입점
+#     - 체결안내: 다음 체결안내 표지까지가 한 블록 (기존 re.split 조각과 같은 범위, 사이의 다른 안내도 포함)
+#     - 배당/국내배당/환전: 자기 조각 안에서 맞지 않으면 뒤 조각을 이어 붙여 계속 매칭
+#       (기존 전체 텍스트 DOTALL 매칭과 같은 결과, 이어 붙이는 길이는 MAX_BLOCK_CHARS 까지)
+# =========================================================
+TRUNCATED = "\n…"   # 잘린 체결 블록 끝 표시 ('$' 가 잘린 위치에서 맞지 않도록)
+_PENDING_PATTERNS = {"div": _DIV, "dom_div": _DOM_DIV, "exchange": _EXCHANGE}
+
+def _append(text, part):
+    if len(text) >= MAX_BLOCK_CHARS: return text
+    text += part
+    return text if len(text) <= MAX_BLOCK_CHARS else text[:MAX_BLOCK_CHARS] + TRUNCATED
+
+def iter_parse_kakaotalk(lines, base_date):
+    # 줄 단위 스트리밍 (파일 객체/제너레이터 그대로 전달 가능). 종류별로는 메시지 순서대로 yield
+    trade, pending = "", {}
+    for kind, raw in iter_segments(lines):
+        if kind == "trade":
+            if trade.strip():
+                item = parse_block("trade", trade, base_date)
+                if item: yield item
+            trade = _append("", raw)
+        else:
+            trade = _append(trade, raw)
+
+        # 앞에서 맞지 않은 표지: 이번 조각까지 붙여서 다시 매칭. 맞으면 그 사이 같은 종류 표지(이번 조각 포함)는 소비됨
+        consumed = False
+        for k in list(pending):
+            text = pending[k] + raw
+            item = parse_block(k, text, base_date)
+            if item:
+                del pending[k]
+                consumed = consumed or k == kind
+                yield item
+            elif len(text) > MAX_BLOCK_CHARS: del pending[k]
+            else:
+                pending[k] = text
+                consumed = consumed or k == kind
+        if kind in _PENDING_PATTERNS and not consumed:
+            item = parse_block(kind, raw, base_date)
+            if item: yield item
+            else: pending[kind] = raw
+    if trade.strip():
+        item = parse_block("trade", trade, base_date)
+        if item: yield item
+
+def parse_kakaotalk(text, base_date):
+    # 붙여넣기 텍스트 -> 기존 parse_kakaotalk_final 과 같은 종류별 순서의 목록
+    lines = text.split('\n') if isinstance(text, str) else text
+    return sorted(iter_parse_kakaotalk(lines, base_date), key=lambda item: CATEGORY_ORDER[item["Category"]])
+
+# =========================================================
+# [5] 카톡 대화 내보내기 파일 (메시지별 수신 시각을 기준 날짜로 사용)
+# =========================================================
+# PC:      --------------- 2026년 2월 3일 화요일 ---------------  /  [한국투자증권] [오전 8:05] 본문
+# Android: 2026년 2월 3일 오전 8:05, 한국투자증권 : 본문
+# iOS:     2026. 2. 3. 오전 8:05, 한국투자증권 : 본문
+_EXPORT_DAY = re.compile(r'-+ (\d{4})년 (\d{1,2})월 (\d{1,2})일 \S+ -+$')
+_EXPORT_MSG = re.compile(
+    r'\[[^\]]+\] \[(?:오전|오후) \d{1,2}:\d{2}\] '
+    r'|(\d{4})(?:년 |\. )(\d{1,2})(?:월 |\. )(\d{1,2})(?:일|\.) (?:오전|오후) \d{1,2}:\d{2}, .+? : '
+)
+MAX_MESSAGE_LINES = 200   # 메시지 하나에 모으는 최대 줄 수
+
+def iter_export_messages(lines):
+    # -> (수신일 date, [본문 줄, ...]) : 헤더 줄의 본문부터 다음 헤더 직전까지
+    cur_day, msg_day, body = None, None, []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        head = line[:1]
+        if head == "-" or head == "[" or head.isdigit():
+            m = _EXPORT_DAY.match(line)
+            if m:
+                cur_day = date(*map(int, m.groups()))
+                continue
+            m = _EXPORT_MSG.match(line)
+            if m:
+                if body and msg_day: yield msg_day, body
+                msg_day = date(*map(int, m.groups())) if m.group(1) else cur_day
+                body = [line[m.end():]]
+                continue
+        if body and len(body) < MAX_MESSAGE_LINES: body.append(line)
+    if body and msg_day: yield msg_day, body
+
+def iter_parse_export(lines):
+    # 내보내기 파일 스트리밍 파싱. 메시지 순서(= 시간순)대로 yield
+    for msg_day, body in iter_export_messages(lines):
+        yield from iter_parse_kakaotalk(body, msg_day)
@@ -0,0 +1,442 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime, timedelta, timezone, time as dt_time
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import yfinance as yf
+import KIS_API_Manager as kis
+import KIS_Stream_Manager as kis_stream
+import Perf_Monitor as perf
+
+# =========================================================
+# [1] 설정 및 상수
+# =========================================================
+LOCAL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".local_cache")
+
+FX_TICKER = "KRW=X"
+FX_TTL_SEC = int(os.environ.get("FX_TTL_SEC", 300))   # 이 시간이 지나면 백그라운드로 새로 받음
+FX_LAST_GOOD_PATH = os.path.join(LOCAL_CACHE_DIR, "fx_last_good.json")
+FX_HISTORY_PATH = os.path.join(LOCAL_CACHE_DIR, "fx_history_KRWX.parquet")
+FX_HISTORY_META_PATH = os.path.join(LOCAL_CACHE_DIR, "fx_history_KRWX.json")
+FX_HISTORY_TAIL_TTL_SEC = 6 * 3600   # 마지막 날(장중 값일 수 있음)을 다시 받는 간격
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except:
+        return {}
+
+# =========================================================
+# [2] 실시간 환율 (프로세스 공용 캐시 + 백그라운드 갱신 + 마지막 정상값 보관)
+# =========================================================
+class _FxCache:
+    # 세션/탭이 바뀌어도 메모리 값을 바로 반환. TTL 이 지나면 다음 요청은 기존 값을 주고 뒤에서 갱신
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rate = None
+        self.fetched_ts = 0.0
+        self.loaded = False
+        self.refreshing = False
+        self.flag_lock = threading.Lock()   # refreshing 확인/설정 전용 (self.lock 은 조회 내내 잡혀 있으므로 따로)
+
+    def _load_last_good(self):
+        self.loaded = True
+        saved = _read_json(FX_LAST_GOOD_PATH)
+        if saved.get('rate'):
+            self.rate = float(saved['rate'])
+            self.fetched_ts = float(saved.get('ts', 0))
+
+    def _fetch(self):
+        perf.count("fx.fetch")
+        try:
+            with perf.timed("fx.fetch"):
+                data = yf.Ticker(FX_TICKER).history(period="1d")
+            if data.empty: return None
+            rate = float(data['Close'].iloc[-1])
+            if not rate > 0: return None
+            self.rate, self.fetched_ts = rate, time.time()
+            try:
+                _write_json(FX_LAST_GOOD_PATH, {'rate': rate, 'ts': self.fetched_ts})
+            except Exception as e:
+                print(f"FX Last Good Save Error: {e}")
+            return rate
+        except Exception as e:
+            print(f"FX Fetch Error: {e}")
+            return None
+
+    def _refresh_in_background(self):
+        try:
+            with self.lock:
+                if time.time() - self.fetched_ts < FX_TTL_SEC: return
+                self._fetch()
+        finally:
+            with self.flag_lock: self.refreshing = False
+
+    def _start_refresh(self):
+        # 동시에 여러 재실행이 와도 백그라운드 갱신은 하나만
+        with self.flag_lock:
+            if self.refreshing: return
+            self.refreshing = True
+        threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def expire(self):
+        # 새로고침 버튼: 값은 그대로 두고 바로 백그라운드 갱신
+        self.fetched_ts = 0.0
+        self._start_refresh()
+
+    def get(self, force_refresh=False):
+        if not force_refresh and self.rate is not None:
+            perf.count("fx.cache_hit")
+            if time.time() - self.fetched_ts >= FX_TTL_SEC: self._start_refresh()
+            return self.rate
+
+        with self.lock:
+            if not self.loaded: self._load_last_good()
+            if not force_refresh and self.rate is not None:
+                return self.get()   # 디스크의 마지막 정상값 (오래됐으면 백그라운드 갱신)
+            # 받아오지 못하면 마지막 정상값 (한 번도 받은 적이 없으면 None)
+            return self._fetch() or self.rate
+
+    def age_sec(self):
+        return time.time() - self.fetched_ts if self.rate is not None else None
+
+_fx_cache = _FxCache()
+
+def get_fx_rate(force_refresh=False):
+    # USD/KRW. 받아온 적이 전혀 없고 지금도 실패하면 None
+    return _fx_cache.get(force_refresh)
+
+def get_fx_rate_age():
+    return _fx_cache.age_sec()
+
+def expire_fx_rate():
+    _fx_cache.expire()
+
+# =========================================================
+# [3] 과거 일별 환율 (로컬 보관, 없는 구간만 추가로 받음)
+# =========================================================
+_fx_history_lock = threading.Lock()
+
+def _load_fx_history():
+    try:
+        s = pd.read_parquet(FX_HISTORY_PATH)['Close']
+        s.index = pd.DatetimeIndex(s.index)
+        return s
+    except:
+        return pd.Series(dtype=float, index=pd.DatetimeIndex([]), name='Close')
+
+def _download_fx(start, end):
+    # [start, end) 일별 종가, 날짜(시간대 없음) 인덱스
+    data = yf.Ticker(FX_TICKER).history(start=start.strftime("%Y-%m-%d"), end=end.strftime("%Y-%m-%d"), auto_adjust=False)
+    if data.empty: return pd.Series(dtype=float, index=pd.DatetimeIndex([]), name='Close')
+    idx = data.index.tz_localize(None) if data.index.tz is not None else data.index
+    return pd.Series(data['Close'].to_numpy(dtype=float), index=idx.normalize(), name='Close')
+
+def get_fx_history(start, end=None):
+    # 일별 USD/KRW 종가 Series (start~end, 거래일만). 받아둔 구간 밖만 새로 요청
+    start = pd.Timestamp(start).normalize()
+    # 미래 구간은 받을 값이 없고, 받아둔 구간 끝(to)을 미래로 적으면 마지막 날 재조회가 멈추므로 오늘까지만
+    end = min(pd.Timestamp(end or datetime.now()).normalize(), pd.Timestamp(datetime.now()).normalize())
+    if start > end: return pd.Series(dtype=float, index=pd.DatetimeIndex([]), name='Close')
+    with _fx_history_lock:
+        hist = _load_fx_history()
+        meta = _read_json(FX_HISTORY_META_PATH)
+        covered_from = pd.Timestamp(meta['from']) if meta.get('from') else None
+        covered_to = pd.Timestamp(meta['to']) if meta.get('to') else None
+        tail_ts = meta.get('ts', 0)
+
+        parts, changed = [hist], False
+        try:
+            if covered_from is None:
+                parts.append(_download_fx(start, end + timedelta(days=1)))
+                covered_from, covered_to, tail_ts, changed = start, end, time.time(), True
+            else:
+                if start < covered_from:
+                    parts.append(_download_fx(start, covered_from))
+                    covered_from, changed = start, True
+                # 마지막 날 값은 장중 값일 수 있어서 FX_HISTORY_TAIL_TTL_SEC 마다 다시 받음
+                if end > covered_to or (end == covered_to and time.time() - tail_ts > FX_HISTORY_TAIL_TTL_SEC):
+                    parts.append(_download_fx(covered_to, end + timedelta(days=1)))
+                    covered_to, tail_ts, changed = end, time.time(), True
+        except Exception as e:
+            print(f"FX History Error: {e}")
+
+        if changed:
+            hist = pd.concat(parts)
+            hist = hist[~hist.index.duplicated(keep='last')].sort_index()
+            try:
+                os.makedirs(LOCAL_CACHE_DIR, exist_ok=True)
+                hist.to_frame('Close').to_parquet(FX_HISTORY_PATH + ".tmp")
+                os.replace(FX_HISTORY_PATH + ".tmp", FX_HISTORY_PATH)
+                _write_json(FX_HISTORY_META_PATH, {'from': covered_from.strftime("%Y-%m-%d"), 'to': covered_to.strftime("%Y-%m-%d"), 'ts': tail_ts})
+            except Exception as e:
+                print(f"FX History Save Error: {e}")
+    return hist[(hist.index >= start) & (hist.index <= end)]
+
+# =========================================================
+# [4] 시세 캐시 (프로세스 공용, 장중/장외 TTL, 백그라운드 갱신)
+# =========================================================
+PRICE_TTL_OPEN_SEC = 60            # 해당 시장 정규장 중
+PRICE_TTL_CLOSED_SEC = 30 * 60     # 장 마감/휴일
+PRICE_REFRESH_TICK_SEC = 15        # 백그라운드 갱신 주기
+PRICE_IDLE_DROP_SEC = 24 * 3600    # 이 시간 동안 요청이 없던 종목은 갱신 대상에서 제외
+PRICE_RETRY_SEC = 60               # 한 번도 받지 못한 종목의 백그라운드 재시도 간격
+PRICE_CACHE_PATH = os.path.join(LOCAL_CACHE_DIR, "price_cache.json")
+
+US_MARKET = (ZoneInfo("America/New_York"), dt_time(9, 30), dt_time(16, 0))
+KR_MARKET = (ZoneInfo("Asia/Seoul"), dt_time(9, 0), dt_time(15, 30))
+
+def is_market_open(is_domestic, now=None):
+    tz, open_t, close_t = KR_MARKET if is_domestic else US_MARKET
+    local = (now or datetime.now(timezone.utc)).astimezone(tz)
+    return local.weekday() < 5 and open_t <= local.time() < close_t
+
+def price_ttl(is_domestic, now=None):
+    return PRICE_TTL_OPEN_SEC if is_market_open(is_domestic, now) else PRICE_TTL_CLOSED_SEC
+
+def fetch_domestic_prices(raw_tickers):
+    # 국내 종목(.KS) 종가 일괄 조회 -> {raw_ticker: price}
+    raw_tickers = list(dict.fromkeys(raw_tickers))
+    if not raw_tickers: return {}
+    prices = {rt: 0 for rt in raw_tickers}
+    try:
+        data = yf.download([f"{rt}.KS" for rt in raw_tickers], period="5d", progress=False, threads=True)
+        closes = data['Close'].ffill()
+        for rt in raw_tickers:
+            sym = f"{rt}.KS"
+            if sym in closes.columns and not closes.empty and not pd.isna(closes[sym].iloc[-1]):
+                prices[rt] = float(closes[sym].iloc[-1])
+    except: pass
+    return prices
+
+def fetch_overseas_prices(tickers):
+    return kis.get_current_prices(tickers)
+
+class _PriceCache:
+    # {UI 티커: {'price', 'ts', 'raw', 'dom', 'seen', 'tried'}}. 읽기는 잠금 없이 메모리 값, 갱신은 한 번에 한 스레드
+    # * tried: 마지막 조회 시도 시각 (실패 포함). 즉시 조회는 한 번도 시도하지 않은 종목만
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.entries = {}
+        self.loaded = False
+        self.thread = None
+        self.wake = threading.Event()   # expire 시 다음 주기를 기다리지 않고 바로 갱신
+
+    def _load(self):
+        self.loaded = True
+        saved = _read_json(PRICE_CACHE_PATH)
+        for tk, e in saved.items():
+            self.entries.setdefault(tk, dict(e, seen=0.0, tried=e.get('ts', 0.0)))
+
+    def _save(self):
+        try:
+            _write_json(PRICE_CACHE_PATH, {tk: {k: e[k] for k in ('price', 'ts', 'raw', 'dom')} for tk, e in self.entries.items() if e['price']})
+        except Exception as e:
+            print(f"Price Cache Save Error: {e}")
+
+    def _stale(self, tickers=None):
+        now, now_ts = datetime.now(timezone.utc), time.time()
+        ttl = {True: price_ttl(True, now), False: price_ttl(False, now)}
+        with self.lock:
+            items = [(tk, self.entries[tk]) for tk in (tickers if tickers is not None else list(self.entries)) if tk in self.entries]
+        # 값이 없는 종목은 PRICE_RETRY_SEC 마다, 있는 종목은 TTL 이 지나면
+        return [tk for tk, e in items if (now_ts - e['tried'] >= PRICE_RETRY_SEC if not e['price'] else now_ts - e['ts'] >= ttl[e['dom']])]
+
+    def refresh(self, tickers):
+        # 국내(yfinance 일괄)와 해외(KIS 병렬)를 동시에. 실패(0)한 종목은 이전 값 유지
+        asked = time.time()
+        with self.refresh_lock:
+            # 잠금을 기다리는 동안 다른 스레드가 이미 시도한 종목은 제외
+            with self.lock:
+                specs = {tk: (self.entries[tk]['raw'], self.entries[tk]['dom']) for tk in tickers if tk in self.entries and self.entries[tk]['tried'] <= asked}
+            if not specs: return
+            dom = [tk for tk, (_, is_dom) in specs.items() if is_dom]
+            ovs = [tk for tk, (_, is_dom) in specs.items() if not is_dom]
+            # 해외는 실시간 구독 값이 살아 있으면 REST 호출 생략
+            live = {tk: q['price'] for tk, q in kis_stream.get_live_quotes(ovs).items()} if ovs else {}
+            rest = [tk for tk in ovs if tk not in live]
+            perf.count("prices.live_used", len(live))
+            perf.count("prices.rest_fetch", len(rest) + len(dom))
+            # 한쪽이 실패해도 다른 쪽 값은 반영, 실패도 시도로 기록 (다음 페이지 로드에서 다시 즉시 조회하지 않음)
+            with perf.timed("prices.refresh"), ThreadPoolExecutor(max_workers=1) as pool:
+                dom_future = pool.submit(fetch_domestic_prices, [specs[tk][0] for tk in dom])
+                try: ovs_prices = fetch_overseas_prices(rest) if rest else {}
+                except Exception as e:
+                    print(f"Price Refresh Error: {e}")
+                    ovs_prices = {}
+                try: dom_prices = dom_future.result()
+                except Exception as e:
+                    print(f"Price Refresh Error: {e}")
+                    dom_prices = {}
+            ovs_prices.update(live)
+            fresh = {tk: ovs_prices.get(tk, 0) for tk in ovs}
+            fresh.update({tk: dom_prices.get(specs[tk][0], 0) for tk in dom})
+            now_ts = time.time()
+            with self.lock:
+                for tk, price in fresh.items():
+                    if tk not in self.entries: continue
+                    self.entries[tk]['tried'] = now_ts
+                    if price: self.entries[tk]['price'], self.entries[tk]['ts'] = float(price), now_ts
+                self._save()
+
+    def _run(self):
+        while True:
+            self.wake.wait(PRICE_REFRESH_TICK_SEC)
+            self.wake.clear()
+            try:
+                now_ts = time.time()
+                with self.lock:
+                    for tk in [tk for tk, e in self.entries.items() if e['seen'] and now_ts - e['seen'] > PRICE_IDLE_DROP_SEC]:
+                        del self.entries[tk]
+                with self.lock:
+                    requested = [tk for tk, e in self.entries.items() if e['seen']]
+                stale = self._stale(requested)
+                if stale: self.refresh(stale)
+            except Exception as e:
+                print(f"Price Refresher Error: {e}")
+
+    def get(self, specs):
+        # specs: {UI 티커: (raw_ticker, is_domestic)} -> {UI 티커: price}
+        now_ts = time.time()
+        with self.lock:
+            if not self.loaded: self._load()
+            for tk, (raw, is_dom) in specs.items():
+                e = self.entries.get(tk)
+                if e is None or e['raw'] != raw or e['dom'] != bool(is_dom):
+                    e = self.entries[tk] = {'price': 0.0, 'ts': 0.0, 'raw': raw, 'dom': bool(is_dom), 'seen': now_ts, 'tried': 0.0}
+                e['seen'] = now_ts
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        # 한 번도 조회를 시도하지 않은 종목만 즉시 조회, 나머지는 캐시 값 그대로 (오래된 값/실패 재시도는 백그라운드가)
+        missing = [tk for tk in specs if not self.entries[tk]['tried']]
+        perf.count("prices.cache_hit", len(specs) - len(missing))
+        perf.count("prices.cache_miss", len(missing))
+        if missing: self.refresh(missing)
+        prices = {tk: self.entries[tk]['price'] for tk in specs}
+        # 실시간 구독 값이 캐시보다 새로우면 그 값 사용
+        for tk, q in kis_stream.get_live_quotes([tk for tk, (_, is_dom) in specs.items() if not is_dom]).items():
+            if q['ts'] > self.entries[tk]['ts']: prices[tk] = q['price']
+        return prices
+
+    def expire(self, tickers=None):
+        with self.lock:
+            for tk in (tickers if tickers is not None else list(self.entries)):
+                if tk in self.entries: self.entries[tk]['ts'] = 0.0
+        self.wake.set()
+
+_price_cache = _PriceCache()
+
+def get_prices(specs):
+    return _price_cache.get(specs)
+
+def expire_prices(tickers=None):
+    # 새로고침 버튼: 오래된 값으로 표시하고 백그라운드 갱신을 바로 깨움 (화면은 기존 값으로 먼저 그림)
+    _price_cache.expire(tickers)
+
+# =========================================================
+# [5] 과거 일별 시세 OHLC (종목 전체 한 파일로 로컬 보관, 없는 구간만 일괄 다운로드)
+# =========================================================
+PRICE_HISTORY_PATH = os.path.join(LOCAL_CACHE_DIR, "price_history.parquet")
+PRICE_HISTORY_META_PATH = os.path.join(LOCAL_CACHE_DIR, "price_history.json")
+OHLC_COLUMNS = ['Open', 'High', 'Low', 'Close']
+_price_history_lock = threading.Lock()
+
+def history_symbol(raw_ticker, is_domestic):
+    # 원장 티커 -> yfinance 심볼 (국내는 .KS, 해외 클래스주는 BRK.B -> BRK-B)
+    return f"{raw_ticker}.KS" if is_domestic else str(raw_ticker).replace('.', '-')
+
+def _empty_ohlc():
+    return pd.DataFrame({'Date': pd.DatetimeIndex([]), 'Symbol': pd.Series(dtype=str), **{c: pd.Series(dtype=float) for c in OHLC_COLUMNS}})
+
+def _load_price_history():
+    try:
+        df = pd.read_parquet(PRICE_HISTORY_PATH)
+        df['Date'] = pd.DatetimeIndex(df['Date'])
+        return df
+    except:
+        return _empty_ohlc()
+
+def _download_ohlc(symbols, start, end):
+    # [start, end) 여러 종목을 yf.download 한 번으로 -> (Date, Symbol, OHLC) 긴 형식
+    perf.count("price_history.download")
+    perf.count("price_history.symbols", len(symbols))
+    data = yf.download(symbols, start=start.strftime("%Y-%m-%d"), end=end.strftime("%Y-%m-%d"),
+                       auto_adjust=False, progress=False, threads=True, group_by='column')
+    if data is None or data.empty: return _empty_ohlc()
+    if not isinstance(data.columns, pd.MultiIndex):
+        data.columns = pd.MultiIndex.from_product([data.columns, symbols[:1]])
+    idx = data.index.tz_localize(None) if data.index.tz is not None else data.index
+    parts = []
+    for sym in symbols:
+        if sym not in data.columns.get_level_values(1): continue
+        sub = data.xs(sym, axis=1, level=1)
+        part = pd.DataFrame({'Date': idx.normalize(), 'Symbol': sym, **{c: sub[c].to_numpy(dtype=float) for c in OHLC_COLUMNS if c in sub.columns}})
+        parts.append(part.dropna(subset=['Close']))
+    return pd.concat(parts, ignore_index=True) if parts else _empty_ohlc()
+
+def get_price_history(symbols, start, end=None, field='Close'):
+    # 일별 시세 표 (index: 날짜, columns: 심볼). 처음 보는 종목/앞쪽/마지막 날 이후 구간만 묶어서 새로 받음
+    symbols = list(dict.fromkeys(symbols))
+    start = pd.Timestamp(start).normalize()
+    # 미래 구간은 오늘까지로 자름 (환율 이력과 같은 이유)
+    end = min(pd.Timestamp(end or datetime.now()).normalize(), pd.Timestamp(datetime.now()).normalize())
+    if start > end: return pd.DataFrame(index=pd.DatetimeIndex([]), columns=symbols, dtype=float)
+    with _price_history_lock:
+        hist = _load_price_history()
+        meta = _read_json(PRICE_HISTORY_META_PATH)
+        now = time.time()
+
+        fresh = [s for s in symbols if s not in meta]
+        head = [s for s in symbols if s in meta and start < pd.Timestamp(meta[s]['from'])]
+        # 마지막 날 값은 장중 값일 수 있어서 FX_HISTORY_TAIL_TTL_SEC 마다 다시 받음
+        tail = [s for s in symbols if s in meta and (end > pd.Timestamp(meta[s]['to'])
+                or (end == pd.Timestamp(meta[s]['to']) and now - meta[s].get('ts', 0) > FX_HISTORY_TAIL_TTL_SEC))]
+
+        parts, changed = [hist], False
+        try:
+            if fresh:
+                got = _download_ohlc(fresh, start, end + timedelta(days=1))
+                parts.append(got)
+                # 아무것도 못 받은 종목은 기록하지 않음 (다음 호출에서 다시 시도)
+                for s in set(got['Symbol']):
+                    meta[s] = {'from': start.strftime("%Y-%m-%d"), 'to': end.strftime("%Y-%m-%d"), 'ts': now}
+                changed = True
+            if head:
+                parts.append(_download_ohlc(head, start, max(pd.Timestamp(meta[s]['from']) for s in head)))
+                for s in head: meta[s]['from'] = start.strftime("%Y-%m-%d")
+                changed = True
+            if tail:
+                parts.append(_download_ohlc(tail, min(pd.Timestamp(meta[s]['to']) for s in tail), end + timedelta(days=1)))
+                for s in tail: meta[s].update({'to': end.strftime("%Y-%m-%d"), 'ts': now})
+                changed = True
+        except Exception as e:
+            print(f"Price History Error: {e}")
+        if not changed: perf.count("price_history.hit")
+
+        if changed:
+            hist = pd.concat([p for p in parts if len(p)], ignore_index=True) if any(len(p) for p in parts) else _empty_ohlc()
+            hist = hist.drop_duplicates(subset=['Date', 'Symbol'], keep='last').sort_values(['Symbol', 'Date'], ignore_index=True)
+            try:
+                os.makedirs(LOCAL_CACHE_DIR, exist_ok=True)
+                hist.to_parquet(PRICE_HISTORY_PATH + ".tmp", index=False)
+                os.replace(PRICE_HISTORY_PATH + ".tmp", PRICE_HISTORY_PATH)
+                _write_json(PRICE_HISTORY_META_PATH, meta)
+            except Exception as e:
+                print(f"Price History Save Error: {e}")
+
+    sel = hist[hist['Symbol'].isin(symbols) & (hist['Date'] >= start) & (hist['Date'] <= end)]
+    wide = sel.pivot(index='Date', columns='Symbol', values=field) if len(sel) else pd.DataFrame(index=pd.DatetimeIndex([]))
+    return wide.reindex(columns=symbols).sort_index()
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# =========================================================
+# [1] 설정 및 상수
+# =========================================================
+PERF_ENABLED = os.environ.get("PERF_ENABLED", "1") != "0"
+PERF_WINDOW = 200                                    # 단계별 백분위 계산용 최근 샘플 수
+PERF_PROM_PATH = os.environ.get("PERF_PROM_PATH")    # Prometheus textfile (node_exporter textfile collector 등)
+PERF_LOG_PATH = os.environ.get("PERF_LOG_PATH")      # 재실행 1회당 JSON 한 줄
+
+# =========================================================
+# [2] 프로세스 공용 계측 저장소 (단계별 소요시간 + 이벤트 카운터)
+#     - 재실행(스크립트 스레드) 단위 기록은 thread-local 로 따로 모음
+# =========================================================
+class _Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}      # {stage: {'count', 'total', 'max', 'recent': deque}}
+        self.counters = {}    # {name: int}
+        self.last_run = None  # 마지막으로 끝난 재실행 {'ts', 'total', 'stages', 'counters'}
+        self.local = threading.local()
+
+    def record(self, stage, sec):
+        with self.lock:
+            s = self.stages.get(stage)
+            if s is None:
+                s = self.stages[stage] = {'count': 0, 'total': 0.0, 'max': 0.0, 'recent': deque(maxlen=PERF_WINDOW)}
+            s['count'] += 1
+            s['total'] += sec
+            s['max'] = max(s['max'], sec)
+            s['recent'].append(sec)
+        run = getattr(self.local, 'run', None)
+        if run is not None:
+            run['stages'][stage] = run['stages'].get(stage, 0.0) + sec
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+        run = getattr(self.local, 'run', None)
+        if run is not None:
+            run['counters'][name] = run['counters'].get(name, 0) + n
+
+_registry = _Registry()
+
+@contextmanager
+def timed(stage):
+    # with perf.timed("sheets.sync"): ...
+    if not PERF_ENABLED:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _registry.record(stage, time.perf_counter() - t0)
+
+def count(name, n=1):
+    if PERF_ENABLED and n: _registry.count(name, n)
+
+# =========================================================
+# [3] 재실행 단위 기록 (Dashboard.main 시작/끝)
+# =========================================================
+def begin_run():
+    _registry.local.run = {'ts': time.time(), 't0': time.perf_counter(), 'stages': {}, 'counters': {}}
+
+def end_run():
+    run = getattr(_registry.local, 'run', None)
+    if run is None: return None
+    _registry.local.run = None
+    total = time.perf_counter() - run.pop('t0')
+    _registry.record("rerun.total", total)
+    run['total'] = total
+    with _registry.lock:
+        _registry.last_run = run
+    if PERF_LOG_PATH: _append_log(run)
+    if PERF_PROM_PATH: write_prometheus(PERF_PROM_PATH)
+    return run
+
+def current_run():
+    # 진행 중인 재실행의 단계별 합계 (진단 패널은 main 끝에서 그리므로 이 값을 씀)
+    run = getattr(_registry.local, 'run', None)
+    if run is None: return None
+    return {'ts': run['ts'], 'total': time.perf_counter() - run['t0'], 'stages': dict(run['stages']), 'counters': dict(run['counters'])}
+
+def last_run():
+    with _registry.lock:
+        return _registry.last_run
+
+# =========================================================
+# [4] 조회 / 내보내기
+# =========================================================
+def _quantile(sorted_vals, q):
+    if not sorted_vals: return 0.0
+    return sorted_vals[min(int(q * len(sorted_vals)), len(sorted_vals) - 1)]
+
+def stage_summary():
+    # -> [{'stage', 'count', 'total', 'p50', 'p95', 'max'}] (누적 시간 큰 순)
+    with _registry.lock:
+        items = [(k, s['count'], s['total'], s['max'], sorted(s['recent'])) for k, s in _registry.stages.items()]
+    rows = [{'stage': k, 'count': n, 'total': total, 'p50': _quantile(r, 0.5), 'p95': _quantile(r, 0.95), 'max': mx}
+            for k, n, total, mx, r in items]
+    return sorted(rows, key=lambda r: -r['total'])
+
+def counters():
+    with _registry.lock:
+        return dict(sorted(_registry.counters.items()))
+
+def reset():
+    with _registry.lock:
+        _registry.stages.clear()
+        _registry.counters.clear()
+        _registry.last_run = None
+
+def _label(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"')
+
+def prometheus_text():
+    lines = ["# HELP dashboard_stage_seconds Time spent per dashboard stage.", "# TYPE dashboard_stage_seconds summary"]
+    for r in stage_summary():
+        lab = f'stage="{_label(r["stage"])}"'
+        lines.append(f'dashboard_stage_seconds{{{lab},quantile="0.5"}} {r["p50"]:.6f}')
+        lines.append(f'dashboard_stage_seconds{{{lab},quantile="0.95"}} {r["p95"]:.6f}')
+        lines.append(f'dashboard_stage_seconds_sum{{{lab}}} {r["total"]:.6f}')
+        lines.append(f'dashboard_stage_seconds_count{{{lab}}} {r["count"]}')
+    lines += ["# HELP dashboard_events_total Event counters (API calls, cache hits/misses, rows processed).", "# TYPE dashboard_events_total counter"]
+    for name, n in counters().items():
+        lines.append(f'dashboard_events_total{{name="{_label(name)}"}} {n}')
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path):
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Perf Export Error: {e}")
+
+def _append_log(run):
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(PERF_LOG_PATH)), exist_ok=True)
+        with open(PERF_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps({'ts': round(run['ts'], 3), 'total_ms': round(run['total'] * 1000, 2),
+                                'stages_ms': {k: round(v * 1000, 2) for k, v in run['stages'].items()},
+                                'counters': run['counters']}, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"Perf Log Error: {e}")
@@ -0,0 +1,394 @@
+import pandas as pd
+import numpy as np
+import os
+import json
+import time
+import tempfile
+
+# =========================================================
+# [1] 컬럼 전처리 (한 번에 타입 변환)
+# =========================================================
+def _new_position(ticker, is_domestic):
+    return {'qty':0, 'invested_krw':0, 'invested_usd':0, 'realized_krw':0, 'accum_div_usd':0, 'accum_div_krw':0, 'is_domestic':is_domestic, 'raw_ticker':ticker}
+
+def _num_col(df, col):
+    # safe_float 과 동일: 콤마/공백 제거 후 숫자 변환, 실패/빈값/'-' 는 0
+    if col not in df.columns: return np.zeros(len(df))
+    s = df[col]
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return s.astype(float).fillna(0.0).to_numpy()
+    s = s.astype(str).str.replace(',', '', regex=False).str.strip()
+    return pd.to_numeric(s, errors='coerce').fillna(0.0).to_numpy(dtype=float)
+
+def _str_col(df, col, lower=False):
+    # str(row.get(col, '')).strip() 과 동일 (결측치는 'nan')
+    # 고유값만 문자열 처리한 뒤 코드로 펼쳐서 행 단위 문자열 연산을 피함
+    if col not in df.columns: return np.full(len(df), '', dtype=object)
+    codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+    vals = [str(u).strip() for u in uniques]
+    if lower: vals = [v.lower() for v in vals]
+    return np.array(vals, dtype=object)[codes] if len(vals) else np.zeros(0, dtype=object)
+
+def _has(values, *words):
+    codes, uniques = pd.factorize(values)
+    hit = np.array([any(w in u for w in words) for u in uniques], dtype=bool)
+    return hit[codes] if len(codes) else np.zeros(0, dtype=bool)
+
+def _seq_sum(arr, start=0.0):
+    # 순차 누적합(반복문 += 과 동일한 부동소수점 결과)
+    return float(np.cumsum(np.concatenate(([start], arr)))[-1]) if len(arr) else start
+
+# =========================================================
+# [2] 경로 의존 구간 (평단/평균단가) - 순수 스칼라 루프
+# =========================================================
+def _reservoir_avg_scan(bal_prev, bal_after, krw_amt, is_div, avg=0.0):
+    # 달러 저수지 매수평단: 입금/배당 행에서만 갱신
+    out = [0.0] * len(bal_prev)
+    for i, (b0, b1, krw, div) in enumerate(zip(bal_prev, bal_after, krw_amt, is_div)):
+        if b1 > 0:
+            avg = (b0 * avg) / b1 if div else ((b0 * avg) + krw) / b1
+        out[i] = avg
+    return out
+
+def _position_scan(fields, codes, is_buy, qty, amount, rate_buy, rate_sell, track_usd, trace=None):
+    # 종목별 평균단가 방식 매수/매도 (fields: 필드별 리스트, codes: 종목 인덱스)
+    # trace: 행마다 처리 직후 해당 종목의 (qty, invested_krw, invested_usd) 를 덧붙임 (일별 이력용)
+    s_qty, s_krw, s_usd, s_real = fields['qty'], fields['invested_krw'], fields['invested_usd'], fields['realized_krw']
+    for c, buy, q, amt, r_buy, r_sell in zip(codes, is_buy, qty, amount, rate_buy, rate_sell):
+        if buy:
+            s_qty[c] += q
+            s_krw[c] += (amt * r_buy)
+            if track_usd: s_usd[c] += amt
+        elif s_qty[c] > 0:
+            unit_krw = s_krw[c] / s_qty[c]
+            if track_usd:
+                unit_usd = s_usd[c] / s_qty[c]
+                s_real[c] += (amt * r_sell) - (q * unit_krw)
+            else:
+                s_real[c] += amt - (q * unit_krw)
+            s_qty[c] -= q
+            s_krw[c] -= (q * unit_krw)
+            if track_usd: s_usd[c] -= (q * unit_usd)
+        if trace is not None: trace.append((s_qty[c], s_krw[c], s_usd[c]))
+
+# =========================================================
+# [3] 엔진: 달러 저수지 & 원화 자산 통합 프로세싱 (컬럼 기반)
+# =========================================================
+TIMELINE_COLS = ['Date_Obj', 'Order_ID', 'Type', 'Ticker', 'USD_Amount', 'KRW_Amount', 'Qty', 'Price_USD', 'Ex_Avg_Rate']
+DOMESTIC_COLS = ['Type', 'Ticker', 'Qty', 'Amount_KRW']
+POSITION_FIELDS = ('qty', 'invested_krw', 'invested_usd', 'realized_krw', 'accum_div_usd', 'accum_div_krw')
+
+def _new_state():
+    # 엔진 전체 상태 (체크포인트로 그대로 저장/복원)
+    return {
+        'current_balance': 0.0, 'current_avg_rate': 0.0,
+        'pure_exch_krw_sum': 0.0, 'pure_exch_usd_sum': 0.0, 'domestic_cash': 0.0,
+        'keys': [], 'flags': [], 'fields': {f: [] for f in POSITION_FIELDS},
+        'n_ovs': 0, 'dom_refs': [], 'shared': False,
+    }
+
+def _index_of(st):
+    return {tk: c for c, tk in enumerate(st['keys'])}
+
+def _ensure(st, code_of, tk, raw, is_dom):
+    if tk in code_of: return False
+    code_of[tk] = len(st['keys']); st['keys'].append(tk); st['flags'].append([is_dom, raw])
+    for lst in st['fields'].values(): lst.append(0)
+    return True
+
+def _to_datetime(col):
+    # 수기 입력(날짜만)과 카톡/KIS(시각 포함)가 섞여 있어도 변환 (첫 행 형식 추론에 의존하지 않음)
+    col = col.astype(str)
+    try: return pd.to_datetime(col, format='ISO8601')
+    except ValueError: return pd.to_datetime(col, format='mixed')
+
+def _prepare_timeline(df_trade, df_money):
+    # 입력 프레임(프로세스 공용 원장 캐시)은 읽기만 함: 필요한 컬럼만 복사한 뒤 날짜/출처 컬럼을 붙여 병합 (정렬 키/순서는 기존과 동일)
+    has_order_id = 'Order_ID' in df_money.columns or 'Order_ID' in df_trade.columns
+    parts = []
+    for df, src in ((df_money, 'Money'), (df_trade, 'Trade')):
+        part = df[[c for c in TIMELINE_COLS if c != 'Date_Obj' and c in df.columns]].copy()
+        try: part.insert(0, 'Date_Obj', _to_datetime(df['Date']))
+        except: pass
+        part['Source'] = src
+        parts.append(part)
+    timeline = pd.concat(parts, ignore_index=True)
+    if not has_order_id: timeline['Order_ID'] = 0
+    timeline['Order_ID'] = pd.to_numeric(timeline['Order_ID'], errors='coerce').fillna(999999)
+    return timeline.sort_values(by=['Date_Obj', 'Order_ID'])
+
+def _apply_timeline(timeline, st, trace=None):
+    # 1. 달러 저수지 처리 (st 에 이어서 누적). 이번에 다룬 해외 종목 목록 반환
+    # trace(dict) 를 주면 행 단위 상태(잔고/매수평단/매매 직후 종목 상태)를 채워줌
+    is_money = (timeline['Source'] == 'Money').to_numpy()
+    is_trade = ~is_money
+    type_s = _str_col(timeline, 'Type', lower=True)
+    ticker = _str_col(timeline, 'Ticker')
+    usd_amt = _num_col(timeline, 'USD_Amount')
+    krw_amt = _num_col(timeline, 'KRW_Amount')
+    qty = _num_col(timeline, 'Qty')
+    amount = qty * _num_col(timeline, 'Price_USD')
+    ex_rate_db = _num_col(timeline, 'Ex_Avg_Rate')
+
+    is_div = is_money & _has(type_s, 'dividend', '배당')
+    is_exch = is_money & ~is_div & _has(type_s, 'krw_to_usd', '환전')
+    is_buy = is_trade & _has(type_s, 'buy', '매수')
+    is_sell = is_trade & ~is_buy & _has(type_s, 'sell', '매도')
+
+    money_ticker = np.where(pd.Series(ticker).isin(['', '-', 'nan']).to_numpy(), 'Cash', ticker)
+    ticker = np.where(is_money, money_ticker, ticker)
+
+    # 잔고: 부호 있는 증감의 누적합
+    delta = np.where(is_money, usd_amt, np.where(is_buy, -amount, np.where(is_sell, amount, 0.0)))
+    bal0 = st['current_balance']
+    bal_after = np.cumsum(np.concatenate(([bal0], delta)))[1:]
+    bal_prev = np.concatenate(([bal0], bal_after[:-1]))
+    if len(bal_after): st['current_balance'] = float(bal_after[-1])
+
+    # 매수평단: 입금/배당 행만 스캔 후 나머지 행은 직전 값으로 채움
+    avg0 = st['current_avg_rate']
+    money_pos = np.flatnonzero(is_money)
+    avg_money = _reservoir_avg_scan(bal_prev[money_pos].tolist(), bal_after[money_pos].tolist(), krw_amt[money_pos].tolist(), is_div[money_pos].tolist(), avg0)
+    avg_after = np.zeros(len(timeline))
+    avg_after[money_pos] = avg_money
+    last_money = np.maximum.accumulate(np.where(is_money, np.arange(len(timeline)), -1)) if len(timeline) else np.zeros(0, dtype=int)
+    avg_at = np.where(last_money >= 0, avg_after[np.maximum(last_money, 0)], avg0)
+    if avg_money: st['current_avg_rate'] = avg_money[-1]
+
+    st['pure_exch_krw_sum'] = _seq_sum(krw_amt[is_exch], st['pure_exch_krw_sum'])
+    st['pure_exch_usd_sum'] = _seq_sum(usd_amt[is_exch], st['pure_exch_usd_sum'])
+
+    # 종목 생성 순서 = 기존 루프에서 처음 등장한 순서 (해외 종목은 국내 종목보다 앞)
+    code_of = _index_of(st)
+    n_keys = len(st['keys'])
+    creators = (is_div & (ticker != 'Cash')) | is_trade
+    touched = pd.unique(ticker[creators]).tolist()
+    new_keys = [tk for tk in touched if _ensure(st, code_of, tk, tk, False)]
+    if new_keys and st['n_ovs'] < n_keys:
+        order = list(range(st['n_ovs'])) + list(range(n_keys, len(st['keys']))) + list(range(st['n_ovs'], n_keys))
+        st['keys'] = [st['keys'][i] for i in order]
+        st['flags'] = [st['flags'][i] for i in order]
+        st['fields'] = {f: [lst[i] for i in order] for f, lst in st['fields'].items()}
+        code_of = _index_of(st)
+    st['n_ovs'] += len(new_keys)
+
+    div_pos = np.flatnonzero(is_div & (ticker != 'Cash'))
+    div_acc = st['fields']['accum_div_usd']
+    for tk, usd in zip(ticker[div_pos].tolist(), usd_amt[div_pos].tolist()):
+        div_acc[code_of[tk]] += usd
+
+    trade_pos = np.flatnonzero(is_buy | is_sell)
+    trade_codes = [code_of[tk] for tk in ticker[trade_pos].tolist()]
+    rate_buy = np.where(ex_rate_db > 0, ex_rate_db, avg_at)
+    pos_trace = [] if trace is not None else None
+    _position_scan(st['fields'], trade_codes, is_buy[trade_pos].tolist(),
+                   qty[trade_pos].tolist(), amount[trade_pos].tolist(), rate_buy[trade_pos].tolist(), avg_at[trade_pos].tolist(), True, pos_trace)
+    if trace is not None:
+        trace.update(type=type_s, krw=krw_amt, usd=usd_amt, is_money=is_money, is_div=is_div, is_exch=is_exch, bal=bal_after, avg=avg_at,
+                     trade_pos=trade_pos, trade_codes=np.array(trade_codes, dtype=int), trade_state=np.array(pos_trace, dtype=float).reshape(-1, 3),
+                     trade_buy=is_buy[trade_pos], trade_qty=qty[trade_pos], trade_amount=amount[trade_pos], trade_rate=np.where(is_buy, rate_buy, avg_at)[trade_pos],
+                     div_pos=div_pos, div_codes=np.array([code_of[tk] for tk in ticker[div_pos].tolist()], dtype=int))
+    return touched
+
+def _apply_domestic(df_domestic, st, ticker_map, trace=None):
+    # 2. 원화 자산(Domestic_Log) 처리 (st 에 이어서 누적). trace 는 _apply_timeline 과 같은 용도
+    d_type = _str_col(df_domestic, 'Type', lower=True)
+    d_raw = _str_col(df_domestic, 'Ticker')
+    d_ticker = np.array([ticker_map.get(r, r) for r in d_raw], dtype=object) if ticker_map else d_raw
+    d_qty = _num_col(df_domestic, 'Qty')
+    d_amt = _num_col(df_domestic, 'Amount_KRW')
+
+    d_buy = _has(d_type, 'buy', '매수')
+    d_sell = ~d_buy & _has(d_type, 'sell', '매도')
+    d_div = ~d_buy & ~d_sell & _has(d_type, 'dividend', '배당')
+    d_dep = ~d_buy & ~d_sell & ~d_div & _has(d_type, 'deposit', '입금')
+    d_wd = ~d_buy & ~d_sell & ~d_div & ~d_dep & _has(d_type, 'withdraw', '출금')
+
+    # 국내 행이 해외 종목을 건드리면 이후 증분 처리 불가 (처리 순서가 달라짐)
+    refs = set(pd.unique(d_ticker).tolist()) if len(d_ticker) else set()
+    if refs & set(st['keys'][:st['n_ovs']]): st['shared'] = True
+    st['dom_refs'] = sorted(set(st['dom_refs']) | refs)
+
+    code_of = _index_of(st)
+    valid_raw = (d_raw != '') & (d_raw != '-')
+    for tk, raw in zip(d_ticker[valid_raw].tolist(), d_raw[valid_raw].tolist()): _ensure(st, code_of, tk, raw, True)
+
+    d_trade_pos = np.flatnonzero(d_buy | d_sell)
+    d_codes = [code_of[tk] for tk in d_ticker[d_trade_pos].tolist()]
+    ones = [1.0] * len(d_trade_pos)
+    pos_trace = [] if trace is not None else None
+    _position_scan(st['fields'], d_codes, d_buy[d_trade_pos].tolist(),
+                   d_qty[d_trade_pos].tolist(), d_amt[d_trade_pos].tolist(), ones, ones, False, pos_trace)
+    div_acc = st['fields']['accum_div_krw']
+    for tk, amt in zip(d_ticker[d_div].tolist(), d_amt[d_div].tolist()):
+        if tk in code_of: div_acc[code_of[tk]] += amt
+
+    d_delta = np.where(d_buy | d_wd, -d_amt, np.where(d_sell | d_div | d_dep, d_amt, 0.0))
+    if trace is not None:
+        d_div_pos = np.flatnonzero(d_div)
+        trace.update(type=d_type, amt=d_amt, is_dep=d_dep, is_wd=d_wd, cash=np.cumsum(np.concatenate(([st['domestic_cash']], d_delta)))[1:],
+                     trade_pos=d_trade_pos, trade_codes=np.array(d_codes, dtype=int), trade_state=np.array(pos_trace, dtype=float).reshape(-1, 3),
+                     trade_buy=d_buy[d_trade_pos], trade_amount=d_amt[d_trade_pos], trade_rate=np.ones(len(d_trade_pos)),
+                     div_pos=d_div_pos, div_codes=np.array([code_of.get(tk, -1) for tk in d_ticker[d_div_pos].tolist()], dtype=int))
+    st['domestic_cash'] = _seq_sum(d_delta, st['domestic_cash'])
+
+def _build_portfolio(st):
+    portfolio = {}
+    for c, tk in enumerate(st['keys']):
+        is_dom, raw = st['flags'][c]
+        portfolio[tk] = _new_position(raw, is_dom)
+        for f, lst in st['fields'].items(): portfolio[tk][f] = lst[c]
+    return portfolio
+
+# =========================================================
+# [4] 증분 처리용 체크포인트 (원장별 행 수 + 끝 행 해시 + 누적 지문)
+#     - 이어서 처리할 때는 직전 끝 행만 확인하고 새로 붙은 행만 정렬/해시 (비용이 과거 행 수와 무관)
+#     - 누적 지문 = 행 위치를 섞은 행 해시의 합 (새 행만 더해 갱신)
+#     - 앞쪽 행이 바뀌었을 수 있는 시각(verify_since) 이후 전체 대조한 적이 없을 때만 앞부분 전체 지문을 다시 계산
+# =========================================================
+CHECKPOINT_VERSION = 2
+CHECKPOINT_TAIL_ROWS = 3
+LOCAL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".local_cache")
+CHECKPOINT_PATH = os.path.join(LOCAL_CACHE_DIR, "timeline_checkpoint.json")
+
+# 원장별 엔진이 읽는 컬럼 (숫자 컬럼은 엔진과 같은 변환 후 해시 -> 1 / 1.0 / '1' 이 같은 행)
+_HASH_COLS = {
+    'trade': (['Date', 'Type', 'Ticker'], ['Order_ID', 'Qty', 'Price_USD', 'Ex_Avg_Rate']),
+    'money': (['Date', 'Type', 'Ticker'], ['Order_ID', 'USD_Amount', 'KRW_Amount']),
+    'domestic': (['Type', 'Ticker'], ['Qty', 'Amount_KRW']),
+}
+
+def _text_hash(df, col):
+    # 고유값만 해시 후 펼침 (날짜는 변환된 시각 값으로: 엔진이 보는 값이 같으면 같은 해시)
+    if col not in df.columns: return np.zeros(len(df), dtype=np.uint64)
+    if col == 'Date':
+        try: return pd.util.hash_array(_to_datetime(df[col]).to_numpy(dtype='datetime64[ns]').view(np.int64))
+        except: pass
+    codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+    return pd.util.hash_array(np.array([str(u).strip() for u in uniques], dtype=object))[codes]
+
+def _num_hash(df, col):
+    if col == 'Order_ID':
+        # 정렬 키와 같은 변환 (빈값/문자 -> 999999)
+        if col not in df.columns: return np.zeros(len(df), dtype=np.uint64)
+        return pd.util.hash_array(pd.to_numeric(df[col], errors='coerce').fillna(999999).to_numpy(dtype=float))
+    return pd.util.hash_array(_num_col(df, col))
+
+def _row_hashes(df, kind):
+    text_cols, num_cols = _HASH_COLS[kind]
+    h = np.zeros(len(df), dtype=np.uint64)
+    if not len(df): return h
+    cols = [_text_hash(df, c) for c in text_cols] + [_num_hash(df, c) for c in num_cols]
+    with np.errstate(over='ignore'):
+        for col in cols: h = (h * np.uint64(0x100000001B3)) ^ col
+    return h
+
+def _prefix_sum(hashes, start):
+    # 행 위치를 섞은 해시의 합 (uint64 자리 넘김): 앞부분 합 + 새 행 합 = 전체 합
+    if not len(hashes): return 0
+    pos = pd.util.hash_array(np.arange(start, start + len(hashes), dtype=np.uint64))
+    return int(np.bitwise_xor(hashes, pos).sum(dtype=np.uint64))
+
+def _frame_mark(df, kind, prev=None):
+    # -> {'n': 행 수, 'tail': 끝 행 해시, 'fp': 누적 지문}. prev 가 있으면 그 뒤에 붙은 행만 해시
+    n0, fp = (prev['n'], int(prev['fp'])) if prev else (0, 0)
+    fp = (fp + _prefix_sum(_row_hashes(df.iloc[n0:], kind), n0)) % (1 << 64)
+    tail = _row_hashes(df.iloc[max(len(df) - CHECKPOINT_TAIL_ROWS, 0):], kind)
+    return {'n': len(df), 'tail': [str(h) for h in tail], 'fp': str(fp)}
+
+def _frame_matches(df, kind, mark, verify_prefix):
+    n = mark['n']
+    if n > len(df): return False
+    tail = _row_hashes(df.iloc[max(n - CHECKPOINT_TAIL_ROWS, 0):n], kind)
+    if [str(h) for h in tail] != mark['tail']: return False
+    return not verify_prefix or str(_prefix_sum(_row_hashes(df.iloc[:n], kind), 0)) == mark['fp']
+
+def _row_key(timeline, i):
+    row = timeline.iloc[i]
+    return [str(row['Date_Obj']), float(row['Order_ID'])]
+
+def _after_key(timeline, key):
+    # 새 행이 모두 체크포인트 마지막 행 뒤에 정렬되는지 (그래야 전체 정렬 순서 = 기존 순서 + 새 행 순서)
+    if not len(timeline): return True
+    if key is None: return False
+    last = pd.Timestamp(key[0])
+    if pd.isna(last): return False
+    first = timeline.iloc[0]
+    return pd.notna(first['Date_Obj']) and (first['Date_Obj'], float(first['Order_ID'])) > (last, key[1])
+
+def load_checkpoint(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            ck = json.load(f)
+        return ck if ck.get('version') == CHECKPOINT_VERSION else None
+    except:
+        return None
+
+def save_checkpoint(path, ck):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(ck, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Checkpoint Save Error: {e}")
+
+def _resume_from(ck, frames, map_sig, verify_prefix):
+    # 체크포인트가 현재 원장의 앞부분과 일치할 때만 이어서 처리 (끝 행 확인, verify_prefix 면 앞부분 전체도)
+    if not ck or ck.get('ticker_map') != map_sig or ck['state'].get('shared'): return None
+    if not all(_frame_matches(df, kind, ck['frames'][kind], verify_prefix) for kind, df in frames.items()): return None
+    return ck['state']
+
+def _needs_verify(ck, verify_since):
+    return verify_since is not None and bool(ck) and ck.get('checked', 0) < verify_since
+
+def _full_replay(df_trade, df_money, df_domestic, ticker_map):
+    timeline = _prepare_timeline(df_trade, df_money)
+    st = _new_state()
+    _apply_timeline(timeline, st)
+    _apply_domestic(df_domestic, st, ticker_map)
+    return st, (_row_key(timeline, len(timeline) - 1) if len(timeline) else None)
+
+def process_timeline(df_trade, df_money, df_domestic, ticker_map=None, checkpoint_path=None, verify_since=None):
+    # verify_since: 원장 앞쪽 행이 바뀌었을 수 있는 시각 (시트 전체 동기화 시각, epoch 초). 체크포인트를 그 뒤로 전체 대조한 적이 없으면 앞부분 전체 대조
+    ticker_map = ticker_map or {}
+
+    if checkpoint_path is None:
+        st, _ = _full_replay(df_trade, df_money, df_domestic, ticker_map)
+    else:
+        map_sig = [list(kv) for kv in sorted(ticker_map.items())]
+        frames = {'trade': df_trade, 'money': df_money, 'domestic': df_domestic}
+        ck = load_checkpoint(checkpoint_path)
+        verify = _needs_verify(ck, verify_since)
+        st = _resume_from(ck, frames, map_sig, verify)
+        last_key = ck['last_key'] if st is not None else None
+        grown = st is not None and any(ck['frames'][kind]['n'] < len(df) for kind, df in frames.items())
+
+        if grown:
+            n = {kind: ck['frames'][kind]['n'] for kind in frames}
+            new_timeline = _prepare_timeline(df_trade.iloc[n['trade']:], df_money.iloc[n['money']:])
+            if not _after_key(new_timeline, last_key):
+                st = None  # 새 행이 기존 행 사이에 정렬됨 -> 전체 재계산
+            elif set(_apply_timeline(new_timeline, st)) & set(st['dom_refs']):
+                st = None  # 국내 원장에서 쓰던 종목을 해외 행이 건드림 -> 처리 순서가 달라지므로 전체 재계산
+            else:
+                _apply_domestic(df_domestic.iloc[n['domestic']:], st, ticker_map)
+                if len(new_timeline): last_key = _row_key(new_timeline, len(new_timeline) - 1)
+
+        checked = ck.get('checked', 0) if ck else 0
+        if st is None:
+            st, last_key = _full_replay(df_trade, df_money, df_domestic, ticker_map)
+            marks, checked = {kind: _frame_mark(df, kind) for kind, df in frames.items()}, time.time()
+        else:
+            marks = {kind: _frame_mark(df, kind, ck['frames'][kind]) for kind, df in frames.items()} if grown else ck['frames']
+            if verify: checked = time.time()
+
+        if grown or st is not (ck or {}).get('state') or checked != ck.get('checked', 0):
+            save_checkpoint(checkpoint_path, {
+                'version': CHECKPOINT_VERSION, 'ticker_map': map_sig, 'checked': checked,
+                'frames': marks, 'last_key': last_key, 'state': st,
+            })
+
+    pure_exch_rate = st['pure_exch_krw_sum'] / st['pure_exch_usd_sum'] if st['pure_exch_usd_sum'] > 0 else 0
+    return df_trade, df_money, st['current_balance'], st['domestic_cash'], st['current_avg_rate'], pure_exch_rate, _build_portfolio(st)
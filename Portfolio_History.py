@@ -0,0 +1,171 @@
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import Portfolio_Engine as engine
+import Market_Data_Manager as market
+import Perf_Monitor as perf
+
+# =========================================================
+# [1] 일별 상태 (원장을 한 번만 순회)
+#     - 엔진과 같은 스캔에서 행 단위 상태를 받아 날짜별 마지막 값으로 펼침
+#     - 결과는 (날짜 x 종목) 행렬: 보유수량 / 투자원금(원화, 달러)
+# =========================================================
+def _last_per_day(day_idx, n_days):
+    # 날짜순 행 -> 날짜별 마지막 행 번호 (그날 행이 없으면 직전 행, 첫 행 이전은 -1)
+    out = np.full(n_days, -1)
+    if len(day_idx):
+        last = np.flatnonzero(np.r_[day_idx[1:] != day_idx[:-1], True])
+        out[day_idx[last]] = last
+    return np.maximum.accumulate(out)
+
+def _pick(values, idx, fill=0.0):
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], fill) if len(values) else np.full(idx.shape, fill)
+
+def _day_index(dates, d0):
+    return ((dates - d0) // pd.Timedelta(days=1)).to_numpy(dtype=int)
+
+def _replay_days(dates):
+    # 엔진 처리 순서의 행 -> 반영 날짜 (그때까지의 최대 날짜, 날짜 없는 행은 직전 행과 같은 날)
+    # * 순서를 바꾸지 않으므로 마지막 날 상태 = 엔진 결과, 날짜가 앞선 행이 뒤에 있으면 앞 행들의 날짜에 반영
+    days = pd.Series(dates.to_numpy(), dtype='datetime64[ns]').dt.normalize()
+    return days.cummax().ffill().bfill()
+
+def daily_state(df_trade, df_money, df_domestic, ticker_map=None, today=None):
+    ticker_map = ticker_map or {}
+    # 엔진과 같은 순서/행: 해외는 (날짜, Order_ID) 정렬(날짜 없는 행은 끝), 국내는 입력 순서 그대로
+    timeline = engine._prepare_timeline(df_trade, df_money)
+    if 'Date_Obj' not in timeline.columns: timeline = timeline.iloc[:0].assign(Date_Obj=pd.Series(dtype='datetime64[ns]'))
+    dom_dates = engine._to_datetime(df_domestic['Date']) if 'Date' in df_domestic.columns and len(df_domestic) else pd.Series(pd.NaT, index=df_domestic.index)
+
+    st = engine._new_state()
+    t_tr, d_tr = {}, {}
+    engine._apply_timeline(timeline, st, t_tr)
+    engine._apply_domestic(df_domestic, st, ticker_map, d_tr)
+
+    # 날짜 축: 첫 기록일 ~ max(오늘, 마지막 기록일) (미래 날짜로 미리 적은 행도 축 안에 들도록)
+    today = pd.Timestamp(today or datetime.now()).normalize()
+    t_dates, d_dates = _replay_days(timeline['Date_Obj']), _replay_days(dom_dates)
+    dates = [s for s in (t_dates, d_dates) if s.notna().any()]
+    d0 = min(s.min() for s in dates) if dates else today
+    days = pd.date_range(d0, max([today] + [s.max() for s in dates]), freq='D')
+    n_days, n_keys = len(days), len(st['keys'])
+    # 날짜가 하나도 없는 원장은 첫날에 반영
+    t_day, d_day = _day_index(t_dates.fillna(d0), d0), _day_index(d_dates.fillna(d0), d0)
+
+    # 달러 저수지 / 원화 예수금 / 투입 원금: 날짜별 마지막 행의 누적값
+    t_last, d_last = _last_per_day(t_day, n_days), _last_per_day(d_day, n_days)
+    exch_krw = np.where(t_tr['is_money'] & (t_tr['type'] == 'krw_to_usd'), t_tr['krw'], 0.0)
+    dep_krw = np.where(d_tr['is_dep'], d_tr['amt'], 0.0)
+
+    # 종목 상태: (날짜, 종목) 별 마지막 매매 행. 해외 -> 국내 순으로 이어 붙여 엔진 처리 순서와 같게 함
+    codes = np.concatenate((t_tr['trade_codes'], d_tr['trade_codes']))
+    state = np.concatenate((t_tr['trade_state'], d_tr['trade_state']))
+    tr_day = np.concatenate((t_day[t_tr['trade_pos']], d_day[d_tr['trade_pos']]))
+    last_row = np.full((n_days, n_keys), -1)
+    if len(codes):
+        order = np.lexsort((np.arange(len(codes)), tr_day, codes))
+        key = codes[order] * n_days + tr_day[order]
+        last = order[np.r_[key[1:] != key[:-1], True]]
+        last_row[tr_day[last], codes[last]] = last
+    last_row = np.maximum.accumulate(last_row, axis=0)
+
+    # 외부 현금흐름 (수익률 계산용, 들어온 돈 +): 원화 입금(환전/국내 입금) - 국내 출금, 달러 직접 입출금은 USD 로 따로
+    is_ext_usd = t_tr['is_money'] & ~t_tr['is_div'] & ~t_tr['is_exch']
+    flow_krw = np.bincount(t_day, np.where(t_tr['is_exch'], t_tr['krw'], 0.0), n_days)
+    if len(d_day): flow_krw += np.bincount(d_day, np.where(d_tr['is_dep'], d_tr['amt'], np.where(d_tr['is_wd'], -d_tr['amt'], 0.0)), n_days)
+    flow_usd = np.bincount(t_day, np.where(is_ext_usd, t_tr['usd'], 0.0), n_days)
+
+    # 종목별 현금흐름 (원화, 투자자 기준 부호: 매수 -, 매도/배당 +) -> (종목, 날짜) 별 합계
+    t_div, d_div = t_tr['div_pos'], d_tr['div_pos'][d_tr['div_codes'] >= 0]
+    f_code = np.concatenate((codes, t_tr['div_codes'], d_tr['div_codes'][d_tr['div_codes'] >= 0]))
+    f_day = np.concatenate((tr_day, t_day[t_div], d_day[d_div]))
+    f_amt = np.concatenate((
+        np.concatenate((t_tr['trade_amount'] * t_tr['trade_rate'] * np.where(t_tr['trade_buy'], -1.0, 1.0),
+                        d_tr['trade_amount'] * np.where(d_tr['trade_buy'], -1.0, 1.0))),
+        t_tr['usd'][t_div] * t_tr['avg'][t_div], d_tr['amt'][d_div]))
+    f_key, f_inv = np.unique(f_code * n_days + f_day, return_inverse=True)
+
+    is_dom = np.array([bool(f[0]) for f in st['flags']], dtype=bool)
+    return {
+        'days': days, 'keys': list(st['keys']), 'is_domestic': is_dom,
+        'symbols': [market.history_symbol(f[1], f[0]) for f in st['flags']],
+        'qty': _pick(state[:, 0], last_row), 'invested_krw': _pick(state[:, 1], last_row), 'invested_usd': _pick(state[:, 2], last_row),
+        'usd_cash': _pick(t_tr['bal'], t_last), 'avg_rate': _pick(t_tr['avg'], t_last),
+        'krw_cash': _pick(d_tr['cash'], d_last) if len(d_day) else np.zeros(n_days),
+        'principal_ovs': _pick(np.cumsum(exch_krw), t_last), 'principal_dom': _pick(np.cumsum(dep_krw), d_last),
+        'flow_krw': flow_krw, 'flow_usd': flow_usd,
+        # 해외 매매 행 (원장 순서): 세금 계산용 로트 엔진 입력
+        'trades': {'day': t_day[t_tr['trade_pos']], 'code': t_tr['trade_codes'], 'buy': t_tr['trade_buy'],
+                   'qty': t_tr['trade_qty'], 'amount_usd': t_tr['trade_amount'], 'rate': t_tr['trade_rate']},
+        'ticker_flows': (f_key // n_days, f_key % n_days, np.bincount(f_inv.ravel(), f_amt, len(f_key))),
+    }
+
+# =========================================================
+# [2] 일별 평가 (상태 행렬 x 종가 행렬 x 환율, 전부 벡터 연산)
+#     - 손익 분해는 Portfolio_Metrics.summarize 와 같은 정의
+# =========================================================
+def value_history(state, close, fx):
+    # close: (날짜 x 종목) 현지통화 종가, fx: (날짜,) USD/KRW
+    qty, inv_krw, inv_usd = state['qty'], state['invested_krw'], state['invested_usd']
+    dom = state['is_domestic'][None, :]
+    held = qty > 0
+    fx_col = fx[:, None]
+
+    val_local = np.where(held, qty * close, 0.0)
+    stock_krw = np.where(dom, val_local, val_local * fx_col).sum(axis=1)
+    usd_cash, krw_cash = state['usd_cash'], state['krw_cash']
+    nav = stock_krw + usd_cash * fx + krw_cash
+    principal = state['principal_ovs'] + state['principal_dom']
+
+    price_pl = np.where(held, np.where(dom, val_local - inv_krw, (val_local - inv_usd) * fx_col), 0.0).sum(axis=1)
+    fx_pl = np.where(held & ~dom, inv_usd * fx_col - inv_krw, 0.0).sum(axis=1) + usd_cash * (fx - state['avg_rate'])
+    return pd.DataFrame({
+        'nav': nav, 'principal': principal, 'pl': nav - principal,
+        'stock_krw': stock_krw, 'usd_cash': usd_cash, 'krw_cash': krw_cash, 'fx': fx,
+        'price_pl': price_pl, 'fx_pl': fx_pl, 'other_pl': nav - principal - price_pl - fx_pl,
+    }, index=state['days'])
+
+# =========================================================
+# [3] 과거 시세 결합 + 메모 (원장 상태/날짜가 같으면 시세 행렬 재사용, 오늘 값만 실시간으로 덮어씀)
+# =========================================================
+_memo_lock = threading.Lock()
+_memo = {}
+
+def daily_fx(state):
+    # 일별 USD/KRW 종가 (휴장일은 직전 값, 받지 못한 날은 그날 달러 매수평단)
+    days = state['days']
+    fx_hist = market.get_fx_history(days[0], days[-1])
+    fx = fx_hist.reindex(days).ffill().bfill().to_numpy(dtype=float) if len(fx_hist) else np.full(len(days), np.nan)
+    return np.where(np.isnan(fx), state['avg_rate'], fx)
+
+def _market_matrices(state):
+    days = state['days']
+    with perf.timed("nav.price_history"):
+        wide = market.get_price_history(state['symbols'], days[0], days[-1]) if len(state['symbols']) else pd.DataFrame(index=days)
+        fx = daily_fx(state)
+    # 휴장일/주말은 직전 종가, 상장 전 구간은 첫 종가
+    close = wide.reindex(days).ffill().bfill().fillna(0.0).to_numpy(dtype=float).reshape(len(days), len(state['symbols']))
+    return close, fx
+
+def get_nav_history(state_key, state, live_prices=None, fx_rate=None):
+    # live_prices: {티커: 현재가}, fx_rate: 현재 환율 -> 마지막 날(오늘)을 KPI 카드와 같은 값으로
+    if not len(state['days']): return value_history(state, np.zeros((0, len(state['keys']))), np.zeros(0))
+    live = tuple(sorted((live_prices or {}).items())), fx_rate
+    base_key = (state_key, state['days'][-1])
+    with _memo_lock:
+        if _memo.get('key') == (base_key, live): return _memo['value']
+        base = _memo.get('base') if _memo.get('base_key') == base_key else None
+    if base is None:
+        base = _market_matrices(state)
+    close, fx = base
+    if live_prices or fx_rate:
+        close, fx = close.copy(), fx.copy()
+        for c, tk in enumerate(state['keys']):
+            if live_prices and live_prices.get(tk): close[-1, c] = float(live_prices[tk])
+        if fx_rate: fx[-1] = float(fx_rate)
+    with perf.timed("nav.value"):
+        value = value_history(state, close, fx)
+    with _memo_lock:
+        _memo.update({'base_key': base_key, 'base': base, 'key': (base_key, live), 'value': value})
+    return value
@@ -0,0 +1,87 @@
+import threading
+import numpy as np
+import pandas as pd
+
+# =========================================================
+# [1] 종목별 평가 지표 (전 종목 한 번에 벡터 계산)
+#     - KPI / 대시보드 카드 / 통합 테이블이 모두 이 표 하나를 씀
+# =========================================================
+POSITION_COLS = ['qty', 'invested_krw', 'invested_usd', 'realized_krw', 'accum_div_usd', 'accum_div_krw']
+
+def compute_metrics(portfolio, prices, fx_rate):
+    # -> DataFrame (index: 티커)
+    tickers = [tk for tk in portfolio if tk != 'Cash']
+    df = pd.DataFrame({c: np.array([float(portfolio[tk][c]) for tk in tickers]) for c in POSITION_COLS}, index=tickers)
+    df['is_domestic'] = np.array([bool(portfolio[tk]['is_domestic']) for tk in tickers], dtype=bool)
+    df['price'] = np.array([float(prices.get(tk, 0) or 0) for tk in tickers])
+
+    qty, price, dom = df['qty'].to_numpy(), df['price'].to_numpy(), df['is_domestic'].to_numpy()
+    inv_krw, inv_usd = df['invested_krw'].to_numpy(), df['invested_usd'].to_numpy()
+    held = qty > 0
+    rate = np.where(dom, 1.0, fx_rate)   # 국내는 원화 그대로
+
+    val_local = qty * price               # 해외: USD, 국내: KRW
+    eval_krw = val_local * rate
+    div_krw = df['accum_div_usd'].to_numpy() * fx_rate + df['accum_div_krw'].to_numpy()
+    realized = df['realized_krw'].to_numpy()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_rate = np.where(inv_usd > 0, inv_krw / np.where(inv_usd > 0, inv_usd, 1), 0.0)
+        bep = np.where(val_local > 0, (inv_krw - realized - div_krw) / np.where(val_local > 0, val_local, 1), 0.0)
+
+    df['eval_usd'] = np.where(dom, 0.0, val_local)
+    df['eval_krw'] = eval_krw
+    df['div_krw'] = div_krw
+    df['price_profit'] = np.where(held, np.where(dom, eval_krw - inv_krw, (val_local - inv_usd) * fx_rate), 0.0)
+    df['fx_profit'] = np.where(held & ~dom, inv_usd * (fx_rate - avg_rate), 0.0)
+    df['total_pl'] = eval_krw - inv_krw + realized + div_krw
+    df['total_ret'] = np.where(inv_krw > 0, df['total_pl'].to_numpy() / np.where(inv_krw > 0, inv_krw, 1) * 100, 0.0)
+    df['bep_rate'] = np.where(dom, np.nan, bep)
+    df['margin'] = np.where(held & ~dom, fx_rate - bep, np.nan)
+    df['active'] = (qty != 0) | (realized != 0) | (df['accum_div_usd'].to_numpy() != 0) | (df['accum_div_krw'].to_numpy() != 0)
+    return df
+
+def summarize(metrics, cur_bal, cur_rate, dom_cash, fx_rate, principal_ovs, principal_dom):
+    # 포트폴리오 합계 (KPI 카드용)
+    held = metrics[metrics['qty'] > 0]
+    ovs = metrics[~metrics['is_domestic']]
+    cash_val_krw = cur_bal * fx_rate
+    principal_all = principal_ovs + principal_dom
+
+    total_stock_val_krw = held['eval_krw'].sum()
+    total_asset_krw = total_stock_val_krw + cash_val_krw + dom_cash
+    total_pl_krw = total_asset_krw - principal_all
+
+    # BEP: 해외 원금에서 해외 실현/배당을 뺀 금액을 달러 자산(주식+잔고)으로 나눔
+    bep_numerator = principal_ovs - ovs['realized_krw'].sum() - ovs['accum_div_usd'].sum() * fx_rate
+    total_usd_assets = ovs['eval_usd'].sum() + cur_bal
+    bep_rate = bep_numerator / total_usd_assets if total_usd_assets > 0 else 0
+
+    return {
+        'principal_all': principal_all,
+        'stock_val_krw': total_stock_val_krw,
+        'asset_krw': total_asset_krw,
+        'pl_krw': total_pl_krw,
+        'pl_pct': (total_pl_krw / principal_all * 100) if principal_all > 0 else 0,
+        'price_profit': held['price_profit'].sum(),
+        'fx_profit': held['fx_profit'].sum() + (cash_val_krw - cur_bal * cur_rate),
+        'realized_krw': metrics['realized_krw'].sum(),
+        'div_krw': metrics['div_krw'].sum(),
+        'bep_rate': bep_rate,
+        'safety_margin': fx_rate - bep_rate,
+    }
+
+# =========================================================
+# [2] 메모이즈 (원장 상태/시세/환율이 같으면 재계산 없음)
+# =========================================================
+_memo_lock = threading.Lock()
+_memo = {}
+
+def get_metrics(state_key, portfolio, prices, fx_rate):
+    key = (state_key, tuple(sorted((tk, prices.get(tk, 0)) for tk in portfolio)), float(fx_rate))
+    with _memo_lock:
+        if _memo.get('key') == key: return _memo['value']
+    value = compute_metrics(portfolio, prices, fx_rate)
+    with _memo_lock:
+        _memo['key'], _memo['value'] = key, value
+    return value
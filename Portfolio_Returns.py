@@ -0,0 +1,115 @@
+import threading
+import numpy as np
+import pandas as pd
+
+# =========================================================
+# [1] XIRR (여러 현금흐름 묶음을 한 번에 푸는 벡터 NPV 솔버)
+#     - 묶음 번호(gid) 별 NPV/도함수를 bincount 로 합산 -> 뉴턴법, 실패한 묶음만 이분법
+# =========================================================
+XIRR_LOW, XIRR_HIGH = -0.9999, 100.0   # 연 수익률 탐색 범위
+XIRR_TOL = 1e-9
+
+def _npv(rate, gid, years, amount, n):
+    base = 1.0 + rate[gid]
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        disc = amount * base ** (-years)
+        return np.bincount(gid, disc, n), np.bincount(gid, -years * disc / base, n)
+
+def xirr_grouped(gid, years, amount, n, guess=0.1, max_iter=50):
+    # gid: 묶음 번호(0..n-1), years: 첫 흐름 기준 경과 연수, amount: 투자자 기준 부호 -> 묶음별 연 수익률 (해 없으면 NaN)
+    gid, years, amount = np.asarray(gid, dtype=int), np.asarray(years, dtype=float), np.asarray(amount, dtype=float)
+    has_pos = np.bincount(gid, amount > 0, n) > 0
+    has_neg = np.bincount(gid, amount < 0, n) > 0
+    solvable = has_pos & has_neg
+    rate = np.full(n, guess)
+    done = ~solvable
+    # 수렴한 묶음의 흐름은 다음 반복부터 빼고 계산 (남은 흐름이 절반 이하로 줄 때마다 압축)
+    g, y, a = gid, years, amount
+    for _ in range(max_iter):
+        if done.all(): break
+        f, df = _npv(rate, g, y, a, n)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = np.where(df != 0, f / df, np.nan)
+        new = np.clip(rate - np.nan_to_num(step, nan=0.0), XIRR_LOW, XIRR_HIGH)
+        ok = np.isfinite(step) & ~done
+        rate = np.where(ok, new, rate)
+        done |= ok & (np.abs(step) < XIRR_TOL)
+        keep = ~done[g]
+        if keep.sum() * 2 <= len(g): g, y, a = g[keep], y[keep], a[keep]
+
+    # 뉴턴법이 수렴하지 않은 묶음: 부호가 바뀌는 구간에서 이분법
+    retry = solvable & ~done
+    if retry.any():
+        sel = retry[gid]
+        g, y, a = gid[sel], years[sel], amount[sel]
+        lo, hi = np.full(n, XIRR_LOW), np.full(n, XIRR_HIGH)
+        f_lo = _npv(lo, g, y, a, n)[0]
+        f_hi = _npv(hi, g, y, a, n)[0]
+        bracket = retry & (np.sign(f_lo) != np.sign(f_hi))
+        for _ in range(100):
+            mid = (lo + hi) / 2
+            f_mid = _npv(mid, g, y, a, n)[0]
+            left = np.sign(f_mid) == np.sign(f_lo)
+            lo, f_lo = np.where(left, mid, lo), np.where(left, f_mid, f_lo)
+            hi = np.where(left, hi, mid)
+        rate = np.where(bracket, (lo + hi) / 2, rate)
+        done |= bracket
+    return np.where(solvable & done, rate, np.nan)
+
+# =========================================================
+# [2] 포트폴리오 / 종목별 수익률 (일별 상태 + 자산 추이 결과 사용)
+#     - 포트폴리오: 외부 입출금(원화 입금, 달러 직접 입출금은 그날 환율) + 마지막 날 총 자산
+#     - 종목: 매수 -, 매도/배당 + (원화 환산은 엔진과 같은 환율) + 현재 평가액
+#     - TWR: 입금이 그날 시작에 들어왔다고 보고 일별 수익률을 연결
+# =========================================================
+def compute_returns(state, nav, eval_krw):
+    # eval_krw: {티커: 현재 평가액(원)}
+    days, n_days = state['days'], len(state['days'])
+    if n_days == 0: return {'xirr': np.nan, 'twr': np.nan, 'twr_annual': np.nan, 'twr_curve': pd.Series(dtype=float), 'ticker_xirr': pd.Series(dtype=float)}
+    value = nav['nav'].to_numpy()
+    flow = state['flow_krw'] + state['flow_usd'] * nav['fx'].to_numpy()
+
+    # 묶음 0: 포트폴리오, 1..: 종목
+    keys = state['keys']
+    f_code, f_day, f_amt = state['ticker_flows']
+    p_day = np.flatnonzero(flow != 0)
+    term = np.array([eval_krw.get(tk, 0.0) for tk in keys], dtype=float)
+    gid = np.concatenate((np.zeros(len(p_day) + 1, dtype=int), f_code + 1, np.arange(1, len(keys) + 1)))
+    day = np.concatenate((p_day, [n_days - 1], f_day, np.full(len(keys), n_days - 1)))
+    amt = np.concatenate((-flow[p_day], [value[-1]], f_amt, term))
+
+    # 묶음별 첫 흐름일 기준 경과 연수
+    first = np.full(len(keys) + 1, n_days)
+    np.minimum.at(first, gid, day)
+    rates = xirr_grouped(gid, (day - first[gid]) / 365.0, amt, len(keys) + 1)
+
+    prev = np.concatenate(([0.0], value[:-1]))
+    denom = prev + flow
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily = np.where(denom > 0, value / denom - 1.0, 0.0)
+    curve = np.cumprod(1.0 + daily) - 1.0
+    start = p_day[0] if len(p_day) else 0
+    span_years = (n_days - 1 - start) / 365.0
+    twr = float(curve[-1])
+    return {
+        'xirr': float(rates[0]),
+        'twr': twr,
+        'twr_annual': (1.0 + twr) ** (1.0 / span_years) - 1.0 if span_years >= 1 and twr > -1 else np.nan,
+        'twr_curve': pd.Series(curve, index=days),
+        'ticker_xirr': pd.Series(rates[1:], index=keys),
+    }
+
+# =========================================================
+# [3] 메모이즈 (원장 상태/시세/환율이 같으면 재계산 없음)
+# =========================================================
+_memo_lock = threading.Lock()
+_memo = {}
+
+def get_returns(state_key, state, nav, eval_krw):
+    key = (state_key, tuple(sorted(eval_krw.items())), float(nav['nav'].iloc[-1]) if len(nav) else 0.0)
+    with _memo_lock:
+        if _memo.get('key') == key: return _memo['value']
+    value = compute_returns(state, nav, eval_krw)
+    with _memo_lock:
+        _memo['key'], _memo['value'] = key, value
+    return value
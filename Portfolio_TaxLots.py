@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+# =========================================================
+# [1] 설정 및 상수 (해외주식 양도소득세, 국내/ISA 종목은 대상 아님)
+# =========================================================
+TAX_DEDUCTION_KRW = 2_500_000   # 연간 기본공제
+TAX_RATE = 0.22                 # 양도소득세 20% + 지방소득세 2%
+QTY_EPS = 1e-9
+
+# =========================================================
+# [2] FIFO 로트 매칭 (종목별 누적수량 축에서 매수 구간 x 매도 구간 겹침을 한 번에 계산)
+#     - 로트 = 매수 행 하나 (수량/단가/취득 환율), 매도는 앞선 로트부터 소진
+#     - 보유보다 많이 판 수량은 매칭하지 않음 (엔진과 달리 음수 보유를 만들지 않음)
+# =========================================================
+def _fifo_ticker(buy, qty):
+    # -> (로트 끝 누적수량, 매도 끝 누적소진량, 최종 소진량)
+    bought = np.cumsum(np.where(buy, qty, 0.0))
+    asked = np.cumsum(np.where(buy, 0.0, qty))
+    # 소진 누적 C_j = min(C_{j-1} + 요청_j, 그때까지 매수 누적) -> 부족분의 누적 최솟값으로 한 번에
+    short = np.minimum.accumulate(np.minimum(bought - asked, 0.0))
+    consumed = asked + short
+    return bought[buy], consumed[~buy], (consumed[-1] if len(consumed) else 0.0)
+
+def _segments(lot_end, sell_end, total):
+    # 누적수량 축의 구간 경계 -> (시작점, 길이, 로트 번호, 매도 번호)
+    cuts = np.unique(np.concatenate(([0.0], lot_end[lot_end < total], sell_end[sell_end < total], [total])))
+    start, length = cuts[:-1], np.diff(cuts)
+    keep = length > QTY_EPS
+    start, length = start[keep], length[keep]
+    return start, length, np.searchsorted(lot_end, start, side='right'), np.searchsorted(sell_end, start, side='right')
+
+def build_lots(state, fx=None):
+    # state: Portfolio_History.daily_state 결과, fx: 일별 환율 배열(매매일 시장환율 기준) / None 이면 엔진 환율(달러 매수평단)
+    tr, days, keys = state['trades'], state['days'], state['keys']
+    valid = tr['qty'] > 0
+    day, code, buy, qty = tr['day'][valid], tr['code'][valid], tr['buy'][valid], tr['qty'][valid]
+    price = tr['amount_usd'][valid] / qty
+    rate = fx[day] if fx is not None else tr['rate'][valid]
+
+    lots, disp, open_idx = [], [], {}
+    for c in np.unique(code):
+        rows = np.flatnonzero(code == c)
+        b = buy[rows]
+        lot_end, sell_end, total = _fifo_ticker(b, qty[rows])
+        lot_rows, sell_rows = rows[b], rows[~b]
+        lot_qty = qty[lot_rows]
+        lot_unit_krw = price[lot_rows] * rate[lot_rows]
+        remaining = np.clip(lot_end - np.maximum(lot_end - lot_qty, total), 0.0, lot_qty)
+        lots.append(pd.DataFrame({'ticker': keys[c], 'buy_day': day[lot_rows], 'qty': lot_qty, 'price_usd': price[lot_rows],
+                                  'rate': rate[lot_rows], 'cost_krw': lot_qty * lot_unit_krw, 'remaining': remaining}))
+
+        if total > QTY_EPS:
+            _, seg_qty, li, si = _segments(lot_end, sell_end, total)
+            lr, sr = lot_rows[li], sell_rows[si]
+            proceeds = seg_qty * price[sr] * rate[sr]
+            cost = seg_qty * lot_unit_krw[li]
+            disp.append(pd.DataFrame({'ticker': keys[c], 'buy_day': day[lr], 'sell_day': day[sr], 'qty': seg_qty,
+                                      'proceeds_krw': proceeds, 'cost_krw': cost, 'gain_krw': proceeds - cost}))
+
+        # 남은 로트의 누적수량/누적원가 (가상 매도 시 FIFO 원가를 이분 탐색으로)
+        held = remaining > QTY_EPS
+        open_idx[keys[c]] = (np.cumsum(remaining[held]), np.cumsum(remaining[held] * lot_unit_krw[held]), lot_unit_krw[held])
+
+    lots = pd.concat(lots, ignore_index=True) if lots else pd.DataFrame(columns=['ticker', 'buy_day', 'qty', 'price_usd', 'rate', 'cost_krw', 'remaining'])
+    disp = pd.concat(disp, ignore_index=True) if disp else pd.DataFrame(columns=['ticker', 'buy_day', 'sell_day', 'qty', 'proceeds_krw', 'cost_krw', 'gain_krw'])
+    for df in (lots, disp):
+        for col in ('buy_day', 'sell_day'):
+            if col in df.columns: df[col.replace('_day', '_date')] = days[df[col].to_numpy(dtype=int)]
+
+    # 연도 x 종목 실현손익 표 (연도별 조회는 이 표에서 바로)
+    if len(disp):
+        disp['year'] = disp['sell_date'].dt.year
+        by_year = disp.pivot_table(index='year', columns='ticker', values='gain_krw', aggfunc='sum', fill_value=0.0)
+    else:
+        by_year = pd.DataFrame(dtype=float)
+    year_total = {int(y): float(v) for y, v in by_year.sum(axis=1).items()} if len(by_year) else {}
+    return {'lots': lots, 'disposals': disp, 'by_year': by_year, 'year_total': year_total, 'open': open_idx}
+
+# =========================================================
+# [3] 조회 (미리 만든 연도별 표 / 남은 로트 누적합만 사용, 원장 재처리 없음)
+# =========================================================
+def realized_by_year(book, year):
+    by_year = book['by_year']
+    if year not in by_year.index: return pd.Series(dtype=float)
+    row = by_year.loc[year]
+    return row[row != 0]
+
+def estimate_tax(book, year, extra_gain=0.0):
+    gain = book['year_total'].get(year, 0.0) + extra_gain
+    taxable = max(gain - TAX_DEDUCTION_KRW, 0.0)
+    return {'gain': gain, 'deduction': float(min(max(gain, 0.0), TAX_DEDUCTION_KRW)), 'taxable': taxable, 'tax': taxable * TAX_RATE}
+
+def yearly_summary(book):
+    years = book['by_year'].index
+    return pd.DataFrame([estimate_tax(book, y) for y in years], index=years)
+
+def fifo_cost(book, ticker, qty):
+    # 지금 qty 주를 판다면 소진될 로트의 원화 취득원가 합 (보유 초과분은 제외)
+    if ticker not in book['open']: return 0.0, 0.0
+    cum_qty, cum_cost, unit = book['open'][ticker]
+    if not len(cum_qty): return 0.0, 0.0
+    qty = min(qty, float(cum_qty[-1]))
+    k = int(np.searchsorted(cum_qty, qty - QTY_EPS))
+    prev_qty, prev_cost = (cum_qty[k - 1], cum_cost[k - 1]) if k > 0 else (0.0, 0.0)
+    return qty, float(prev_cost + (qty - prev_qty) * unit[k]) if k < len(unit) else float(cum_cost[-1])
+
+def what_if_sell(book, ticker, qty, price_usd, fx_rate, year):
+    # 가상 매도 1건을 더했을 때 해당 연도 예상 세액 변화
+    sold, cost = fifo_cost(book, ticker, qty)
+    gain = sold * price_usd * fx_rate - cost
+    before, after = estimate_tax(book, year), estimate_tax(book, year, gain)
+    return {'qty': sold, 'cost_krw': cost, 'gain_krw': gain, 'tax_before': before['tax'], 'tax_after': after['tax'], 'tax_delta': after['tax'] - before['tax']}
@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from gspread.utils import numericise, rowcol_to_a1, absolute_range_name
+import Perf_Monitor as perf
+
+# =========================================================
+# [1] 설정 및 상수
+# =========================================================
+LOCAL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".local_cache")
+SNAPSHOT_DIR = os.path.join(LOCAL_CACHE_DIR, "sheet_snapshot")
+SNAPSHOT_META_PATH = os.path.join(SNAPSHOT_DIR, "meta.json")
+
+OVERLAP_ROWS = 3               # 증분 동기화 시 다시 받아서 비교하는 직전 행 수
+FULL_REFRESH_SEC = 6 * 3600    # 중간 행 수정 대비 주기적 전체 동기화 간격
+
+# =========================================================
+# [2] 로컬 스냅샷 (시트별 원본 문자열 값을 Parquet 으로 보관)
+# =========================================================
+def _snapshot_path(sheet_name):
+    return os.path.join(SNAPSHOT_DIR, f"{sheet_name}.parquet")
+
+def _load_meta():
+    try:
+        with open(SNAPSHOT_META_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except:
+        return {}
+
+def _save_meta(meta):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    tmp_path = SNAPSHOT_META_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, SNAPSHOT_META_PATH)
+
+def _read_rows(sheet_name, n_cols):
+    df = pd.read_parquet(_snapshot_path(sheet_name))
+    rows = df.to_numpy(dtype=object)
+    return rows if rows.shape[1] == n_cols else None
+
+def _write_rows(sheet_name, rows, n_cols):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    df = pd.DataFrame(rows, columns=[f"c{i}" for i in range(n_cols)]).astype(str)
+    tmp_path = _snapshot_path(sheet_name) + ".tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, _snapshot_path(sheet_name))
+
+def clear_snapshot():
+    shutil.rmtree(SNAPSHOT_DIR, ignore_errors=True)
+
+def _pad(rows, n_cols):
+    arr = np.full((len(rows), n_cols), "", dtype=object)
+    for i, r in enumerate(rows):
+        r = r[:n_cols]
+        arr[i, :len(r)] = r
+    return arr
+
+def _col_letter(n_cols):
+    return rowcol_to_a1(1, max(n_cols, 1)).rstrip("0123456789")
+
+# =========================================================
+# [3] 동기화: 리비전 동일 -> 디스크만 / 변경 -> 꼬리 행만 / 겹침 불일치 또는 새 행 없음 -> 전체
+#     - 리비전이 바뀌었는데 행이 늘지 않았으면 앞쪽 행 수정/삭제로 보고 전체 (꼬리 창 밖 변경을 놓치지 않도록)
+#     (필요한 범위는 values_batch_get 한 번으로 모아서 요청)
+# =========================================================
+def _full_range(sheet_name):
+    return absolute_range_name(sheet_name)
+
+def _tail_range(sheet_name, n_cached, n_cols):
+    # 캐시된 마지막 OVERLAP_ROWS 행부터 끝까지 (헤더 1행 + 1-based 보정)
+    start = max(n_cached - OVERLAP_ROWS, 0)
+    return start, absolute_range_name(sheet_name, f"A{start + 2}:{_col_letter(n_cols)}")
+
+def _batch_get(sh, ranges):
+    # 범위 여러 개를 한 번에. 실패하면(없는 시트 등) 범위별로 동시에 재요청 -> {range: values 또는 Exception}
+    if not ranges: return {}
+    perf.count("sheets.api_calls")
+    try:
+        with perf.timed("sheets.batch_get"):
+            res = sh.values_batch_get(ranges)
+        return {rng: vr.get('values', []) for rng, vr in zip(ranges, res.get('valueRanges', []))}
+    except Exception:
+        def _one(rng):
+            try: return sh.values_batch_get([rng]).get('valueRanges', [{}])[0].get('values', [])
+            except Exception as e: return e
+        with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+            return dict(zip(ranges, pool.map(_one, ranges)))
+
+def _plan_one(sheet_name, entry, revision, now):
+    # -> ("disk", cached, None) / ("delta", cached, (start, range)) / ("full", None, range)
+    cached = None
+    if entry:
+        try: cached = _read_rows(sheet_name, len(entry['header']))
+        except: cached = None
+
+    if cached is not None and now - entry.get('full_sync_ts', 0) < FULL_REFRESH_SEC:
+        if revision and entry.get('revision') == revision:
+            return "disk", cached, None
+        return "delta", cached, _tail_range(sheet_name, len(cached), len(entry['header']))
+    return "full", None, _full_range(sheet_name)
+
+def _apply_delta(sheet_name, entry, cached, start, values, revision):
+    n_cols = len(entry['header'])
+    tail = _pad(values, n_cols)
+    overlap = len(cached) - start
+    if len(tail) < overlap or not (tail[:overlap] == cached[start:]).all(): return None
+    new_rows = tail[overlap:]
+    # 리비전이 바뀌었는데 늘어난 행이 없음 -> 꼬리 창 밖의 수정/삭제일 수 있으므로 전체 (리비전을 모르면 기존대로 꼬리만)
+    if revision and not len(new_rows): return None
+    if len(new_rows):
+        cached = np.concatenate([cached, new_rows])
+        _write_rows(sheet_name, cached, n_cols)
+    return dict(entry, n_rows=len(cached), revision=revision), cached
+
+def _apply_full(sheet_name, values, revision, now):
+    if values:
+        header = [str(h) for h in values[0]]
+        rows = _pad(values[1:], len(header))
+    else:
+        header, rows = [], _pad([], 0)
+    _write_rows(sheet_name, rows, len(header))
+    return {'header': header, 'n_rows': len(rows), 'revision': revision, 'full_sync_ts': now}, rows
+
+def sync_snapshot(sh, sheet_names):
+    # -> {시트명: (header, rows) 또는 None(실패)}
+    meta = _load_meta()
+    perf.count("sheets.api_calls")
+    try: revision = sh.get_lastUpdateTime()
+    except: revision = None
+    now = time.time()
+
+    plans = {name: _plan_one(name, meta.get(name), revision, now) for name in sheet_names}
+    for mode, _, _ in plans.values(): perf.count(f"sheets.snapshot_{mode}")
+    fetched = _batch_get(sh, [p[2][1] if p[0] == "delta" else p[2] for p in plans.values() if p[0] != "disk"])
+
+    # 겹치는 행이 달라진 시트는 전체 범위로 한 번 더 (모아서 요청)
+    result, retry_full = {}, []
+    for name, (mode, cached, target) in plans.items():
+        try:
+            if mode == "disk":
+                result[name] = (meta[name]['header'], cached)
+                continue
+            values = fetched.get(target[1] if mode == "delta" else target)
+            if isinstance(values, Exception): raise values
+            if mode == "delta":
+                applied = _apply_delta(name, meta[name], cached, target[0], values, revision)
+                if applied is None:
+                    retry_full.append(name)
+                    continue
+                meta[name], rows = applied
+            else:
+                meta[name], rows = _apply_full(name, values, revision, now)
+            result[name] = (meta[name]['header'], rows)
+        except Exception as e:
+            print(f"Snapshot Sync Error ({name}): {e}")
+            result[name] = None
+
+    fetched = _batch_get(sh, [_full_range(name) for name in retry_full])
+    for name in retry_full:
+        try:
+            values = fetched.get(_full_range(name))
+            if isinstance(values, Exception): raise values
+            meta[name], rows = _apply_full(name, values, revision, now)
+            result[name] = (meta[name]['header'], rows)
+        except Exception as e:
+            print(f"Snapshot Sync Error ({name}): {e}")
+            result[name] = None
+
+    try: _save_meta(meta)
+    except Exception as e: print(f"Snapshot Meta Save Error: {e}")
+    return result
+
+def last_full_sync(sheet_names):
+    # 시트들 중 가장 최근 전체 동기화 시각 (앞쪽 행 수정/삭제가 반영됐을 수 있는 시각)
+    meta = _load_meta()
+    return max([meta.get(name, {}).get('full_sync_ts', 0) for name in sheet_names] + [0])
+
+# =========================================================
+# [4] 스냅샷 -> DataFrame (get_all_records 와 같은 숫자 변환)
+# =========================================================
+def _numericise_column(col):
+    # 고유값만 numericise 후 펼침
+    codes, uniques = pd.factorize(col)
+    conv = np.empty(len(uniques), dtype=object)
+    conv[:] = [numericise(u) for u in uniques]
+    return conv[codes] if len(codes) else conv[:0]
+
+def snapshot_frame(header, rows):
+    if not header or not len(rows): return None
+    if len(set(header)) != len(header):
+        raise ValueError(f"헤더 중복: {header}")
+    perf.count("rows.loaded", len(rows))
+    return pd.DataFrame({h: _numericise_column(rows[:, i]).tolist() for i, h in enumerate(header)})
+
+# =========================================================
+# [5] 로그 행 내용 해시 색인 (같은 내역 재저장 방지)
+#     - 시트 행을 정규화한 키 컬럼으로 해시 -> {해시: 건수}
+#     - 이미 색인한 앞부분이 그대로면 새로 늘어난 행만 해시 (원본 컬럼 지문으로 확인)
+# =========================================================
+HASH_INDEX_PATH = os.path.join(LOCAL_CACHE_DIR, "log_hash_index.json")
+HASH_INDEX_VERSION = 1
+_hash_index_lock = threading.Lock()
+
+# 시트명 -> [(컬럼명, 저장 행 위치, 종류)] (날짜는 일 단위, 문자열은 대문자, 숫자는 소수 4자리)
+LOG_KEY_FIELDS = {
+    "Trade_Log": [('Date', 0, 'date'), ('Ticker', 2, 'text'), ('Type', 4, 'text'), ('Qty', 5, 'num'), ('Price_USD', 6, 'num')],
+    "Money_Log": [('Date', 0, 'date'), ('Type', 2, 'text'), ('Ticker', 3, 'text'), ('KRW_Amount', 4, 'num'), ('USD_Amount', 5, 'num')],
+    "Domestic_Log": [('Date', 0, 'date'), ('Type', 1, 'text'), ('Ticker', 2, 'text'), ('Qty', 4, 'num'), ('Price_KRW', 5, 'num'), ('Amount_KRW', 6, 'num')],
+}
+
+def _content_hashes(sheet_name, columns):
+    # columns: LOG_KEY_FIELDS 순서의 원본 값 목록 -> uint64 해시 배열 (실행 간 동일)
+    key = {}
+    for (col, _, kind), values in zip(LOG_KEY_FIELDS[sheet_name], columns):
+        s = pd.Series(values, dtype=object).astype(str)
+        if kind == 'date':
+            key[col] = pd.to_datetime(s, errors='coerce', format='mixed').dt.strftime("%Y-%m-%d").fillna("").astype(object)
+        elif kind == 'text':
+            key[col] = s.str.strip().str.upper().astype(object)
+        else:
+            key[col] = pd.to_numeric(s.str.replace(',', ''), errors='coerce').fillna(0).round(4).astype(float) + 0.0
+    if not len(next(iter(key.values()))): return np.zeros(0, dtype=np.uint64)
+    return pd.util.hash_pandas_object(pd.DataFrame(key), index=False).to_numpy()
+
+def row_hashes(sheet_name, rows):
+    # 저장할 행 목록 -> 해시 배열
+    return _content_hashes(sheet_name, [[row[pos] for row in rows] for _, pos, _ in LOG_KEY_FIELDS[sheet_name]])
+
+def frame_hashes(df, sheet_name):
+    # 로드된 시트 DataFrame -> 해시 배열 (키 컬럼이 없으면 None)
+    cols = [col for col, _, _ in LOG_KEY_FIELDS[sheet_name]]
+    if any(col not in df.columns for col in cols): return None
+    return _content_hashes(sheet_name, [df[col].tolist() for col in cols])
+
+def _raw_fingerprint(df, sheet_name, n):
+    cols = [col for col, _, _ in LOG_KEY_FIELDS[sheet_name] if col in df.columns]
+    if not n or not cols: return ""
+    raw = pd.util.hash_pandas_object(df[cols].iloc[:n].astype(str), index=False).to_numpy()
+    return hashlib.sha1(raw.tobytes()).hexdigest()
+
+def _load_hash_index():
+    try:
+        with open(HASH_INDEX_PATH, encoding="utf-8") as f:
+            index = json.load(f)
+        return index if index.get('version') == HASH_INDEX_VERSION else {'version': HASH_INDEX_VERSION}
+    except:
+        return {'version': HASH_INDEX_VERSION}
+
+def _save_hash_index(index):
+    try:
+        os.makedirs(LOCAL_CACHE_DIR, exist_ok=True)
+        tmp_path = HASH_INDEX_PATH + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, HASH_INDEX_PATH)
+    except Exception as e:
+        print(f"Hash Index Save Error: {e}")
+
+def sync_hash_index(frames):
+    # {시트명: DataFrame} -> {시트명: {해시: 건수}}
+    # pending: 저장 직후 미리 넣어둔 해시 (다음 로드에서 같은 행이 보이면 이중 계산하지 않음)
+    with _hash_index_lock:
+        index = _load_hash_index()
+        result = {}
+        for sheet_name, df in frames.items():
+            entry = index.get(sheet_name) or {}
+            n = entry.get('n_rows', 0)
+            if not entry or n > len(df) or _raw_fingerprint(df, sheet_name, n) != entry.get('raw_fp'):
+                entry, n = {'counts': {}, 'pending': {}}, 0
+            counts, pending = entry['counts'], entry['pending']
+            new_hashes = frame_hashes(df.iloc[n:], sheet_name) if n < len(df) else np.zeros(0, dtype=np.uint64)
+            for h in map(str, new_hashes if new_hashes is not None else []):
+                if pending.get(h, 0) > 0:
+                    pending[h] -= 1
+                    if not pending[h]: del pending[h]
+                else:
+                    counts[h] = counts.get(h, 0) + 1
+            index[sheet_name] = {'n_rows': len(df), 'raw_fp': _raw_fingerprint(df, sheet_name, len(df)), 'counts': counts, 'pending': pending}
+            result[sheet_name] = dict(counts)
+        _save_hash_index(index)
+        return result
+
+def add_to_hash_index(sheet_name, rows):
+    # 시트에 추가한 행을 바로 색인에 반영 (캐시된 DataFrame 이 갱신되기 전 재저장 방지)
+    if sheet_name not in LOG_KEY_FIELDS or not rows: return
+    with _hash_index_lock:
+        index = _load_hash_index()
+        entry = index.get(sheet_name)
+        if not entry: return
+        for h in map(str, row_hashes(sheet_name, rows)):
+            entry['counts'][h] = entry['counts'].get(h, 0) + 1
+            entry['pending'][h] = entry['pending'].get(h, 0) + 1
+        _save_hash_index(index)
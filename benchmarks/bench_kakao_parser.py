@@ -0,0 +1,199 @@
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Kakao_Parser as kakao
+
+# =========================================================
+# [1] 합성 카톡 내보내기 (체결/국내체결/해외배당/국내배당/환전)
+# =========================================================
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "kakao_paste_anonymized.txt")
+OVS_TICKERS = ['O', 'JEPI', 'JEPQ', 'SCHD', 'GOOGL', 'NVDA', 'AMD', 'TSM', 'MSFT', 'PLD']
+
+def make_messages(n_messages, seed=0, notice=False):
+    rng = random.Random(seed)
+    out = []
+    if notice:
+        # 배당 입금이 아닌 '최원준님 MM/DD' 안내 (뒤에 세전배당입금이 없으면 기존 DOTALL 패턴이 끝까지 되짚음)
+        out.append("최원준님 03/02 해외주식 권리 안내\n*내용:주주총회 소집")
+    for _ in range(n_messages):
+        kind = rng.choices(["trade", "dom_trade", "div", "dom_div", "exchange"], [0.5, 0.1, 0 if notice else 0.2, 0.05, 0.15])[0]
+        hhmm = f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}"
+        if kind == "trade":
+            out.append(f"[한국투자증권 체결안내]{hhmm}\n*계좌번호:12345678-01\n*계좌명:최원준\n*매매구분:{rng.choice(['매수', '매도'])}\n"
+                       f"*종목명:{rng.choice(OVS_TICKERS)}/해외주식\n*체결수량:{rng.randint(1, 1500):,}\n*체결단가:USD {rng.uniform(5, 900):.2f}")
+        elif kind == "dom_trade":
+            out.append(f"[한국투자증권 체결안내]{hhmm}\n*계좌번호:12345678-01\n*매매구분:현금{rng.choice(['매수', '매도'])}체결\n"
+                       f"*종목명:TIGER 미국배당다우존스(458730)\n*체결수량:{rng.randint(1, 200)}\n*체결단가:{rng.randint(9000, 15000):,}원")
+        elif kind == "div":
+            out.append(f"최원준님 {rng.randint(1, 12):02d}/{rng.randint(1, 28):02d} 해외주식 배당금 입금안내\n"
+                       f"*종목:{rng.choice(OVS_TICKERS)}/배당주\n*입금액:USD {rng.uniform(0.1, 300):.2f} 세전배당입금")
+        elif kind == "dom_div":
+            out.append(f"[한국투자증권] ETF 결산분배금 입금 안내\n* 종목명 : TIGER 미국배당다우존스\n* 계좌번호 : 12345678-01\n* 입금액 : {rng.randint(100, 99999):,}원\n"
+                       f"* 입금일자 : 20{rng.randint(20, 26)}년 {rng.randint(1, 12):02d}월 {rng.randint(1, 28):02d}일")
+        else:
+            krw = rng.randint(100, 5000) * 1000
+            rate = rng.uniform(1100, 1450)
+            out.append(f"[한국투자증권] 외화매수환전 체결\n* 원화금액 : ￦{krw:,}\n* 환율 : @{rate:,.2f}\n* 외화금액 : USD {krw / rate:,.2f}")
+    return "\n\n".join(out)
+
+# =========================================================
+# [2] 기존 구현 (패턴 매 호출 컴파일 + 전체 텍스트 DOTALL 재스캔)
+# =========================================================
+def reference_parse_kakaotalk(text, base_date):
+    parsed_list = []
+    base_year = base_date.year
+    lines = text.split('\n')
+    full_text = "\n".join([l.strip() for l in lines if l.strip()])
+
+    blocks = re.split(r'\[한국투자증권 체결안내\]', full_text)
+    for block in blocks:
+        if not block: continue
+        try:
+            time_match = re.match(r'(\d{2}:\d{2})', block.strip())
+            time_str = time_match.group(1) if time_match else "00:00"
+            dom_buy = re.search(r'\*매매구분:현금(매수|매도)체결', block)
+            dom_name = re.search(r'\*종목명:.*?\(([\dA-Za-z]+)\)', block)
+            dom_qty = re.search(r'\*체결수량:([\d,]+)', block)
+            dom_price = re.search(r'\*체결단가:([\d,]+)원', block)
+            if dom_buy and dom_name and dom_qty and dom_price:
+                t_dt = datetime.combine(base_date, datetime.min.time()).replace(hour=int(time_str.split(':')[0]), minute=int(time_str.split(':')[1]))
+                t_type = "Buy" if dom_buy.group(1) == "매수" else "Sell"
+                parsed_list.append({
+                    "Category": "Domestic_Trade", "Date": t_dt.strftime("%Y-%m-%d %H:%M:%S"),
+                    "Ticker": dom_name.group(1), "Name": "-", "Type": t_type,
+                    "Qty": int(dom_qty.group(1).replace(',','')), "Price": float(dom_price.group(1).replace(',','')), "Amount": 0, "Memo": f"카톡파싱_{time_str}"
+                })
+                continue
+            type_m = re.search(r'\*매매구분:(매수|매도)', block)
+            name_m = re.search(r'\*종목명:([A-Za-z0-9 ]+)(?:/|$)', block)
+            qty_m = re.search(r'\*체결수량:([\d,]+)', block)
+            price_m = re.search(r'\*체결단가:USD\s*([\d.]+)', block)
+            if type_m and name_m and qty_m and price_m:
+                trade_dt = datetime.combine(base_date, datetime.min.time()) - timedelta(days=1)
+                final_dt = trade_dt.strftime("%Y-%m-%d 23:30:00")
+                parsed_list.append({
+                    "Category": "Trade", "Date": final_dt,
+                    "Ticker": name_m.group(1).strip(), "Type": "Buy" if type_m.group(1) == "매수" else "Sell",
+                    "Qty": int(qty_m.group(1).replace(',','')), "Price": float(price_m.group(1).replace(',','')), "Amount": 0, "Memo": f"카톡파싱_{time_str}"
+                })
+        except: continue
+
+    div_pattern = re.compile(r'최원준님\s*(\d{2}/\d{2}).*?([A-Z]+)/.*?USD\s*([\d.]+)\s*세전배당입금', re.DOTALL)
+    for match in div_pattern.finditer(full_text):
+        try:
+            date_part, ticker, amount = match.groups()
+            m, d = map(int, date_part.split('/'))
+            div_dt = datetime(base_year, m, d, 15, 0, 0)
+            parsed_list.append({
+                "Category": "Dividend", "Date": div_dt.strftime("%Y-%m-%d %H:%M:%S"),
+                "Ticker": ticker.strip(), "Type": "Dividend",
+                "Qty": 0, "Price": float(amount), "Amount": 0, "Memo": "카톡파싱_배당"
+            })
+        except: continue
+
+    dom_div_pattern = re.compile(
+        r'ETF 결산분배금 입금 안내.*?'
+        r'\*\s*종목명\s*:\s*(.*?)\s*\*'
+        r'.*?'
+        r'\*\s*입금액\s*:\s*([\d,]+)원.*?'
+        r'\*\s*입금일자\s*:\s*(\d{4})년\s*(\d{2})월\s*(\d{2})일',
+        re.DOTALL
+    )
+    K_ETF_NAME_TO_CODE = {"TIGER 미국배당다우존스": "458730"}
+    for match in dom_div_pattern.finditer(full_text):
+        try:
+            name, amount_str, year, month, day = match.groups()
+            name = name.strip()
+            amount = float(amount_str.replace(',', ''))
+            div_dt = datetime(int(year), int(month), int(day), 15, 0, 0)
+            ticker = K_ETF_NAME_TO_CODE.get(name, name)
+            parsed_list.append({
+                "Category": "Domestic_Dividend", "Date": div_dt.strftime("%Y-%m-%d %H:%M:%S"),
+                "Ticker": ticker, "Type": "Dividend", "Qty": 0, "Price": 0, "Amount": amount, "Memo": "카톡파싱_국내배당"
+            })
+        except: continue
+
+    exch_pattern = re.compile(r'외화매수환전.*?￦([0-9,]+).*?@([0-9,.]+).*?USD\s*([0-9,.]+)', re.DOTALL)
+    for match in exch_pattern.finditer(full_text):
+        try:
+            krw_str, rate_str, usd_str = match.groups()
+            exch_dt = datetime.combine(base_date, datetime.min.time()).replace(hour=14, minute=0)
+            parsed_list.append({
+                "Category": "Exchange", "Date": exch_dt.strftime("%Y-%m-%d %H:%M:%S"),
+                "Ticker": "-", "Type": "KRW_to_USD",
+                "Qty": 0, "Price": float(usd_str.replace(',', '')),
+                "Amount": float(krw_str.replace(',', '')), "Memo": "카톡파싱_환전"
+            })
+        except: continue
+    return parsed_list
+
+# =========================================================
+# [3] 실행
+# =========================================================
+def _timed(fn, repeat):
+    best, out = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, out
+
+def main():
+    parser = argparse.ArgumentParser(description="카톡 파서: 기존 전체 텍스트 재스캔 vs 블록 단위 1회 스캔")
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--notice-messages", type=int, default=500)
+    args = parser.parse_args()
+    base_date = datetime(2026, 2, 4)
+
+    # 실제 내보내기(익명화) 붙여넣기: 안내 메시지 / 여러 줄 종목명 / 종목명이 마지막 줄인 체결
+    with open(FIXTURE_PATH, encoding="utf-8") as f:
+        fixture = f.read()
+    ref = reference_parse_kakaotalk(fixture, base_date)
+    assert ref == kakao.parse_kakaotalk(fixture, base_date), "parsed items mismatch (fixture)"
+    streamed = kakao.iter_parse_kakaotalk(fixture.splitlines(keepends=True), base_date)
+    assert ref == sorted(streamed, key=lambda item: kakao.CATEGORY_ORDER[item["Category"]]), "parsed items mismatch (fixture, stream)"
+    print(f"fixture {os.path.basename(FIXTURE_PATH)}: items={len(ref)} (identical)")
+
+    text = make_messages(args.messages)
+    t_ref, ref = _timed(lambda: reference_parse_kakaotalk(text, base_date), args.repeat)
+    t_new, new = _timed(lambda: kakao.parse_kakaotalk(text, base_date), args.repeat)
+    assert ref == new, "parsed items mismatch"
+    print(f"messages={args.messages:,} ({len(text.encode()) / 1e6:.1f} MB)  reference={t_ref*1000:,.1f} ms  "
+          f"single-pass={t_new*1000:,.1f} ms  speedup={t_ref/t_new:,.1f}x  items={len(new):,} (identical)")
+
+    # 배당 입금 없는 내보내기 앞에 안내 1건: 기존 패턴은 'XXX/' 후보마다 텍스트 끝까지 재스캔 (메시지 수의 제곱)
+    for n in (args.notice_messages, args.notice_messages * 2):
+        noisy = make_messages(n, notice=True)
+        t_ref, ref = _timed(lambda: reference_parse_kakaotalk(noisy, base_date), 1)
+        t_new, new = _timed(lambda: kakao.parse_kakaotalk(noisy, base_date), args.repeat)
+        assert ref == new, "parsed items mismatch (notice)"
+        print(f"messages={n:,} + 1 notice  reference={t_ref*1000:,.1f} ms  single-pass={t_new*1000:,.1f} ms  speedup={t_ref/t_new:,.0f}x  (identical)")
+
+    # 파일 스트리밍: 메시지 수를 늘려도 메모리 상한은 블록 하나 크기
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in (args.messages, args.messages * 10):
+            path = os.path.join(tmp, f"export_{n}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(make_messages(n, seed=1))
+            def _stream():
+                with open(path, encoding="utf-8") as f:
+                    return sum(1 for _ in kakao.iter_parse_kakaotalk(f, base_date))
+            dt, count = _timed(_stream, 1)
+            tracemalloc.start()
+            _stream()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"stream {os.path.getsize(path) / 1e6:,.1f} MB file: {dt*1000:,.1f} ms  items={count:,}  peak={peak / 1024:,.0f} KiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import KIS_API_Manager as kis
+import KIS_Stream_Manager as kis_stream
+import Market_Data_Manager as market
+from kis_ws_standin import StandInServer
+
+# =========================================================
+# KIS 실시간 시세 구독: 로컬 대역 서버로 지연/처리량/재접속/REST 절감 확인
+#   - 각 확인은 assert (회귀 시 예외로 종료 코드 1)
+# =========================================================
+def _wait(cond, timeout, what):
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < timeout:
+        if cond(): return time.perf_counter() - t0
+        time.sleep(0.002)
+    raise AssertionError(f"timeout: {what}")
+
+def main():
+    parser = argparse.ArgumentParser(description="KIS 웹소켓 시세 구독 (로컬 대역 서버)")
+    parser.add_argument("--tickers", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--tick-interval", type=float, default=0.001)
+    args = parser.parse_args()
+
+    server = StandInServer(tick_interval=args.tick_interval)
+    kis_stream.WS_URL = server.url
+    kis_stream.get_approval_key = lambda: "standin-approval-key"
+    kis.get_exchange_code = lambda tk: None if tk == "NOEXCD" else "NAS"
+    tickers = [f"T{i:03d}" for i in range(args.tickers)]
+
+    # 거래소를 모르는 종목은 구독하지 않음 (추측한 NAS 키로 등록하지 않음)
+    kis_stream.ensure_subscribed(tickers + ["NOEXCD"])
+    t_first = _wait(lambda: len(kis_stream.get_live_quotes(tickers)) == len(tickers), 10, "first quotes")
+    assert server.subscribed == {f"DNAS{tk}" for tk in tickers}, sorted(server.subscribed)
+    print(f"subscribe {len(tickers)} tickers -> all quoted in {t_first*1000:,.0f} ms (unknown exchange skipped)")
+
+    # 처리량: 대역 서버가 보낸 마지막 가격과 테이블 값이 일치하는지
+    sent0 = server.sent_ticks
+    time.sleep(args.seconds)
+    server.paused = True
+    time.sleep(0.2)
+    rate = (server.sent_ticks - sent0) / args.seconds
+    assert rate > 0, "no ticks"
+    live = kis_stream.get_live_quotes(tickers)
+    assert set(live) == set(tickers), sorted(set(tickers) - set(live))
+    mismatch = [tk for tk in tickers if abs(live[tk]['price'] - server.last_price[f"DNAS{tk}"]) > 1e-9]
+    assert not mismatch, mismatch
+    print(f"throughput {rate:,.0f} ticks/s applied, table matches last sent price for all tickers")
+
+    # PINGPONG 응답
+    assert server.pongs > 0, "no pong"
+    print(f"pingpong echoed {server.pongs} times")
+
+    # 보유 종목 변경 -> 해제/등록만 전송
+    n_log = len(server.sub_log)
+    kis_stream.ensure_subscribed(tickers[1:] + ["NEW"])
+    _wait(lambda: "DNASNEW" in server.subscribed and f"DNAS{tickers[0]}" not in server.subscribed, 5, "resubscribe")
+    diff = server.sub_log[n_log:]
+    assert diff == [("2", f"DNAS{tickers[0]}"), ("1", "DNASNEW")], diff
+    print(f"resubscribe diff: {diff}")
+
+    # 끊김 -> 재접속 후 다시 흐르는지
+    server.paused = False
+    conns = server.connections
+    server.drop_after = server.sent_ticks + 50
+    t_re = _wait(lambda: server.connections > conns and len(server.subscribed) == len(tickers), 15, "reconnect")
+    assert server.subscribed == {f"DNAS{tk}" for tk in tickers[1:] + ["NEW"]}, sorted(server.subscribed)
+    before = server.sent_ticks
+    _wait(lambda: server.sent_ticks > before + 10, 5, "ticks after reconnect")
+    _wait(lambda: kis_stream.is_connected(), 5, "client connected")
+    print(f"reconnected and resubscribed in {t_re*1000:,.0f} ms")
+
+    # 시세 캐시: 실시간 값이 살아 있는 종목은 REST 호출 없음
+    rest_calls = []
+    market.fetch_overseas_prices = lambda tks: (rest_calls.append(list(tks)), {tk: 1.0 for tk in tks})[1]
+    market.fetch_domestic_prices = lambda raws: {}
+    specs = {tk: (tk, False) for tk in tickers[1:] + ["NEW", "OFFLINE"]}
+    # 실제 .local_cache 의 시세 캐시를 읽거나 덮어쓰지 않도록 임시 경로
+    market.PRICE_CACHE_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_kis_stream_"), "price_cache.json")
+    market._price_cache.entries.clear()
+    market.get_prices(specs)
+    assert rest_calls == [["OFFLINE"]], rest_calls
+    print(f"price cache cold fill: REST called only for {rest_calls[0]} ({len(specs) - 1} served from stream)")
+    server.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Portfolio_Engine as engine
+
+# =========================================================
+# [1] 합성 원장 생성 (Trade_Log / Money_Log / Domestic_Log)
+# =========================================================
+TICKERS = ['O', 'JEPI', 'JEPQ', 'SCHD', 'GOOGL', 'NVDA', 'AMD', 'TSM', 'MSFT', 'PLD']
+DOMESTIC_TICKER_MAP = {'458730': 'SCHD(ISA)'}
+
+def make_ledger(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    n_money = n_rows // 3
+    n_trade = n_rows - n_money
+    n_dom = max(n_rows // 10, 1)
+    start = np.datetime64('2015-01-01T09:00')
+
+    m_dates = np.sort(start + rng.integers(0, 10 * 365 * 24 * 60, n_money).astype('timedelta64[m]'))
+    m_kind = rng.choice(['KRW_to_USD', 'Dividend', 'Withdraw'], n_money, p=[0.6, 0.35, 0.05])
+    m_usd = np.round(rng.uniform(10, 2000, n_money), 2)
+    m_rate = np.round(rng.uniform(1100, 1450, n_money), 2)
+    df_money = pd.DataFrame({
+        'Date': pd.to_datetime(m_dates).strftime('%Y-%m-%d %H:%M:%S'),
+        'Order_ID': np.arange(n_money) * 2,
+        'Type': m_kind,
+        'Ticker': np.where(m_kind == 'Dividend', rng.choice(TICKERS, n_money), '-'),
+        'KRW_Amount': np.where(m_kind == 'KRW_to_USD', np.round(m_usd * m_rate), 0),
+        'USD_Amount': np.where(m_kind == 'Withdraw', -m_usd / 10, m_usd),
+        'Ex_Rate': m_rate, 'Avg_Rate': 0.0, 'Balance': 0.0, 'Note': '', 'Source': '',
+    })
+
+    t_dates = np.sort(start + rng.integers(0, 10 * 365 * 24 * 60, n_trade).astype('timedelta64[m]'))
+    t_tk = rng.choice(TICKERS, n_trade)
+    df_trade = pd.DataFrame({
+        'Date': pd.to_datetime(t_dates).strftime('%Y-%m-%d %H:%M:%S'),
+        'Order_ID': np.arange(n_trade) * 2 + 1,
+        'Ticker': t_tk, 'Name': t_tk,
+        'Type': rng.choice(['Buy', 'Sell', '매수'], n_trade, p=[0.6, 0.3, 0.1]),
+        'Qty': rng.integers(1, 20, n_trade).astype(float),
+        'Price_USD': np.round(rng.uniform(20, 500, n_trade), 2),
+        'Ex_Avg_Rate': np.where(rng.random(n_trade) < 0.2, np.round(rng.uniform(1100, 1450, n_trade), 2), 0.0),
+        'Note': '', 'Source': '',
+    })
+
+    d_dates = np.sort(start + rng.integers(0, 10 * 365 * 24 * 60, n_dom).astype('timedelta64[m]'))
+    d_kind = rng.choice(['Deposit', 'Buy', 'Sell', 'Dividend', 'Withdraw'], n_dom, p=[0.3, 0.35, 0.15, 0.15, 0.05])
+    d_qty = rng.integers(1, 50, n_dom).astype(float)
+    d_price = np.round(rng.uniform(9000, 13000, n_dom))
+    df_domestic = pd.DataFrame({
+        'Date': pd.to_datetime(d_dates).strftime('%Y-%m-%d %H:%M:%S'),
+        'Type': d_kind,
+        'Ticker': np.where(d_kind == 'Deposit', '-', rng.choice(['458730', '069500'], n_dom)),
+        'Name': '-',
+        'Qty': np.where(np.isin(d_kind, ['Buy', 'Sell']), d_qty, 0),
+        'Price_KRW': d_price,
+        'Amount_KRW': np.where(np.isin(d_kind, ['Buy', 'Sell']), d_qty * d_price, np.round(rng.uniform(1e4, 1e6, n_dom))),
+        'Note': '',
+    })
+    return df_trade, df_money, df_domestic
+
+# =========================================================
+# [2] 기준 구현 (기존 iterrows 엔진, 결과 비교용)
+# =========================================================
+def safe_float(val):
+    if pd.isna(val) or val == '' or val == '-': return 0.0
+    try: return float(str(val).replace(',', '').strip())
+    except: return 0.0
+
+def reference_process_timeline(df_trade, df_money, df_domestic):
+    df_money['Source'] = 'Money'
+    df_trade['Source'] = 'Trade'
+    try:
+        df_money['Date_Obj'] = pd.to_datetime(df_money['Date'].astype(str))
+        df_trade['Date_Obj'] = pd.to_datetime(df_trade['Date'].astype(str))
+    except: pass
+
+    timeline = pd.concat([df_money, df_trade], ignore_index=True)
+    if 'Order_ID' not in timeline.columns: timeline['Order_ID'] = 0
+    timeline['Order_ID'] = pd.to_numeric(timeline['Order_ID'], errors='coerce').fillna(999999)
+    timeline = timeline.sort_values(by=['Date_Obj', 'Order_ID'])
+
+    current_balance = 0.0
+    current_avg_rate = 0.0
+    pure_exch_krw_sum = 0.0
+    pure_exch_usd_sum = 0.0
+    portfolio = {}
+
+    for idx, row in timeline.iterrows():
+        source = row['Source']
+        t_type = str(row.get('Type', '')).lower()
+        if source == 'Money':
+            usd_amt = safe_float(row.get('USD_Amount'))
+            krw_amt = safe_float(row.get('KRW_Amount'))
+            ticker = str(row.get('Ticker', '')).strip()
+            if ticker == '' or ticker == '-' or ticker == 'nan': ticker = 'Cash'
+            if 'dividend' in t_type or '배당' in t_type:
+                if ticker != 'Cash':
+                    if ticker not in portfolio: portfolio[ticker] = {'qty':0, 'invested_krw':0, 'invested_usd':0, 'realized_krw':0, 'accum_div_usd':0, 'accum_div_krw':0, 'is_domestic':False, 'raw_ticker':ticker}
+                    portfolio[ticker]['accum_div_usd'] += usd_amt
+                if current_balance + usd_amt > 0: current_avg_rate = (current_balance * current_avg_rate) / (current_balance + usd_amt)
+            else:
+                if current_balance + usd_amt > 0: current_avg_rate = ((current_balance * current_avg_rate) + krw_amt) / (current_balance + usd_amt)
+                if 'krw_to_usd' in t_type or '환전' in t_type:
+                    pure_exch_krw_sum += krw_amt; pure_exch_usd_sum += usd_amt
+            current_balance += usd_amt
+        elif source == 'Trade':
+            qty = safe_float(row.get('Qty'))
+            price = safe_float(row.get('Price_USD'))
+            amount = qty * price
+            ticker = str(row.get('Ticker', '')).strip()
+            if ticker not in portfolio: portfolio[ticker] = {'qty':0, 'invested_krw':0, 'invested_usd':0, 'realized_krw':0, 'accum_div_usd':0, 'accum_div_krw':0, 'is_domestic':False, 'raw_ticker':ticker}
+            if 'buy' in t_type or '매수' in t_type:
+                current_balance -= amount
+                ex_rate_db = safe_float(row.get('Ex_Avg_Rate'))
+                rate_to_use = ex_rate_db if ex_rate_db > 0 else current_avg_rate
+                portfolio[ticker]['qty'] += qty
+                portfolio[ticker]['invested_krw'] += (amount * rate_to_use)
+                portfolio[ticker]['invested_usd'] += amount
+            elif 'sell' in t_type or '매도' in t_type:
+                current_balance += amount
+                if portfolio[ticker]['qty'] > 0:
+                    unit_krw = portfolio[ticker]['invested_krw'] / portfolio[ticker]['qty']
+                    unit_usd = portfolio[ticker]['invested_usd'] / portfolio[ticker]['qty']
+                    portfolio[ticker]['realized_krw'] += (amount * current_avg_rate) - (qty * unit_krw)
+                    portfolio[ticker]['qty'] -= qty
+                    portfolio[ticker]['invested_krw'] -= (qty * unit_krw)
+                    portfolio[ticker]['invested_usd'] -= (qty * unit_usd)
+
+    domestic_cash = 0.0
+    for idx, row in df_domestic.iterrows():
+        t_type = str(row.get('Type', '')).lower()
+        raw_ticker = str(row.get('Ticker', '')).strip()
+        ticker = DOMESTIC_TICKER_MAP.get(raw_ticker, raw_ticker)
+        qty = safe_float(row.get('Qty'))
+        amount_krw = safe_float(row.get('Amount_KRW'))
+        if ticker not in portfolio and raw_ticker and raw_ticker != '-':
+            portfolio[ticker] = {'qty':0, 'invested_krw':0, 'invested_usd':0, 'realized_krw':0, 'accum_div_usd':0, 'accum_div_krw':0, 'is_domestic':True, 'raw_ticker':raw_ticker}
+        if 'buy' in t_type or '매수' in t_type:
+            portfolio[ticker]['qty'] += qty
+            portfolio[ticker]['invested_krw'] += amount_krw
+            domestic_cash -= amount_krw
+        elif 'sell' in t_type or '매도' in t_type:
+            if portfolio[ticker]['qty'] > 0:
+                unit_krw = portfolio[ticker]['invested_krw'] / portfolio[ticker]['qty']
+                portfolio[ticker]['realized_krw'] += amount_krw - (qty * unit_krw)
+                portfolio[ticker]['qty'] -= qty
+                portfolio[ticker]['invested_krw'] -= (qty * unit_krw)
+            domestic_cash += amount_krw
+        elif 'dividend' in t_type or '배당' in t_type:
+            if ticker in portfolio:
+                portfolio[ticker]['accum_div_krw'] += amount_krw
+            domestic_cash += amount_krw
+        elif 'deposit' in t_type or '입금' in t_type:
+            domestic_cash += amount_krw
+        elif 'withdraw' in t_type or '출금' in t_type:
+            domestic_cash -= amount_krw
+
+    pure_exch_rate = pure_exch_krw_sum / pure_exch_usd_sum if pure_exch_usd_sum > 0 else 0
+    return df_trade, df_money, current_balance, domestic_cash, current_avg_rate, pure_exch_rate, portfolio
+
+# =========================================================
+# [3] 실행
+# =========================================================
+def _timed(fn, ledger, repeat):
+    best, out = None, None
+    for _ in range(repeat):
+        frames = [df.copy() for df in ledger]
+        t0 = time.perf_counter()
+        out = fn(*frames)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, out
+
+def main():
+    parser = argparse.ArgumentParser(description="process_timeline: 기존 iterrows 엔진 vs 컬럼 엔진")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ledger = make_ledger(args.rows)
+    t_ref, ref = _timed(reference_process_timeline, ledger, 1)
+    t_new, new = _timed(lambda t, m, d: engine.process_timeline(t, m, d, DOMESTIC_TICKER_MAP), ledger, args.repeat)
+
+    assert ref[2:6] == new[2:6], (ref[2:6], new[2:6])
+    assert ref[6] == new[6], "portfolio mismatch"
+    assert list(ref[6]) == list(new[6]), "portfolio key order mismatch"
+
+    print(f"rows={args.rows:,}  reference={t_ref*1000:,.1f} ms  columnar={t_new*1000:,.1f} ms  speedup={t_ref/t_new:,.1f}x  (outputs identical)")
+
+    # 체크포인트 증분: 마지막 하루치만 새로 추가된 상황 (끝 행 확인 / 앞부분 전체 지문 대조)
+    cut = max(df['Date'].max() for df in ledger)[:10]
+    head = [df[df['Date'] < cut] for df in ledger]
+    n_new = sum(map(len, ledger)) - sum(map(len, head))
+    for verify in (False, True):
+        ck_path = os.path.join(tempfile.mkdtemp(), "timeline_checkpoint.json")
+        engine.process_timeline(*[df.copy() for df in head], DOMESTIC_TICKER_MAP, checkpoint_path=ck_path)
+        since = time.time() if verify else None
+        t_inc, inc = _timed(lambda t, m, d: engine.process_timeline(t, m, d, DOMESTIC_TICKER_MAP, checkpoint_path=ck_path, verify_since=since), ledger, 1)
+        assert inc[2:7] == new[2:7], "checkpoint mismatch"
+        assert engine.load_checkpoint(ck_path)['frames']['trade']['n'] == len(ledger[0]), "checkpoint not advanced"
+        print(f"incremental (checkpoint + {n_new:,} new rows, {'full prefix check' if verify else 'tail check'}) = {t_inc*1000:,.1f} ms")
+
+    # 앞쪽 행 수정: 전체 동기화 이후 첫 계산은 앞부분 전체 대조 -> 전체 재계산으로 기존 엔진과 같은 결과. 새 행이 기존 행 사이에 정렬되면 역시 전체 재계산
+    edited = [df.copy() for df in ledger]
+    edited[0].loc[edited[0].index[len(edited[0]) // 2], 'Qty'] += 1
+    _, ref_edit = _timed(reference_process_timeline, edited, 1)
+    since = time.time()
+    _, inc = _timed(lambda t, m, d: engine.process_timeline(t, m, d, DOMESTIC_TICKER_MAP, checkpoint_path=ck_path, verify_since=since), edited, 1)
+    assert inc[2:7] == ref_edit[2:7], "checkpoint used after an earlier row changed"
+    back = [df.copy() for df in ledger]
+    back[1] = pd.concat([back[1], back[1].iloc[[0]].assign(Order_ID=-1)], ignore_index=True)
+    _, ref_back = _timed(reference_process_timeline, back, 1)
+    _, inc = _timed(lambda t, m, d: engine.process_timeline(t, m, d, DOMESTIC_TICKER_MAP, checkpoint_path=ck_path), back, 1)
+    assert inc[2:7] == ref_back[2:7], "back-dated row applied out of order"
+    print("earlier-row edit / back-dated append -> full replay (outputs identical)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import zlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# KIS 설정은 import 전에 환경변수로 (대역 서버 주소는 아래에서 덮어씀)
+for _k, _v in {"URL_BASE": "http://127.0.0.1:9", "APP_KEY": "bench", "APP_SECRET": "bench", "CANO": "00000000", "ACNT_PRDT_CD": "01"}.items():
+    os.environ.setdefault(f"KIS_{_k}", _v)
+
+import Dashboard as dash
+import KIS_API_Manager as kis
+import Sheet_DB_Manager as db
+import Portfolio_Engine as engine
+import Portfolio_Metrics as metrics_engine
+import Portfolio_History as history_engine
+import Portfolio_Returns as returns_engine
+import Portfolio_TaxLots as tax_engine
+import Market_Data_Manager as market
+from bench_process_timeline import make_ledger
+from bench_kakao_parser import make_messages
+from kis_http_standin import KisHttpStandIn
+from fake_gspread import FakeSpreadsheet
+
+# =========================================================
+# [1] 오프라인 환경 (캐시 경로 -> 임시 폴더, 시트/KIS -> 로컬 대역)
+# =========================================================
+SIZES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+
+def _redirect_cache(tmp):
+    db.SNAPSHOT_DIR = os.path.join(tmp, "sheet_snapshot")
+    db.SNAPSHOT_META_PATH = os.path.join(db.SNAPSHOT_DIR, "meta.json")
+    db.HASH_INDEX_PATH = os.path.join(tmp, "log_hash_index.json")
+    engine.CHECKPOINT_PATH = os.path.join(tmp, "timeline_checkpoint.json")
+    market.PRICE_CACHE_PATH = os.path.join(tmp, "price_cache.json")
+    market.PRICE_HISTORY_PATH = os.path.join(tmp, "price_history.parquet")
+    market.PRICE_HISTORY_META_PATH = os.path.join(tmp, "price_history.json")
+    market.FX_HISTORY_PATH = os.path.join(tmp, "fx_history_KRWX.parquet")
+    market.FX_HISTORY_META_PATH = os.path.join(tmp, "fx_history_KRWX.json")
+    kis.LOCAL_CACHE_DIR = tmp
+    kis.EXCHANGE_MAP_PATH = os.path.join(tmp, "kis_exchange_map.json")
+
+def _sheet_values(n_rows, seed=0):
+    # 합성 원장 -> 시트 API 가 돌려주는 문자열 값 (헤더 포함)
+    frames = make_ledger(n_rows, seed)
+    return {name: [list(dash.LOG_COLUMNS[name])] + df[dash.LOG_COLUMNS[name]].astype(str).values.tolist()
+            for name, df in zip(dash.LOG_COLUMNS, frames)}
+
+def _synthetic_ohlc(symbols, start, end):
+    days = pd.bdate_range(start, end - pd.Timedelta(days=1))
+    parts = []
+    for sym in symbols:
+        rng = np.random.default_rng(zlib.crc32(sym.encode()))
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(days))))
+        parts.append(pd.DataFrame({"Date": days, "Symbol": sym, "Open": close, "High": close, "Low": close, "Close": close}))
+    return pd.concat(parts, ignore_index=True) if parts else market._empty_ohlc()
+
+class Env:
+    def __init__(self, n_rows, sheets_latency, kis_latency, quote_latency):
+        self.tmp = tempfile.mkdtemp(prefix="bench_suite_")
+        _redirect_cache(self.tmp)
+        dash.reset_ledger()   # 이전 크기의 원장이 남지 않도록
+        self.values = _sheet_values(n_rows)
+        self.sheet = FakeSpreadsheet({name: [row[:] for row in rows] for name, rows in self.values.items()}, latency=sheets_latency)
+        self.sheet.add_worksheet("Token_Storage", [])
+        self.kis = KisHttpStandIn(latency=kis_latency)
+
+        kis.URL_BASE, kis.KIS_CONFIGURED = self.kis.url, True
+        kis._token_manager.__init__()
+        kis._token_manager.ws = self.sheet.worksheet("Token_Storage")
+        dash.get_spreadsheet = lambda: self.sheet
+        # 국내 시세(yfinance)는 네트워크 대신 고정 지연
+        market.fetch_domestic_prices = lambda raws: (time.sleep(quote_latency), {rt: 10_000.0 for rt in raws})[1]
+        # 과거 시세/환율(yf.download) 도 같은 지연의 합성 랜덤워크 (요청 1회 = 지연 1회)
+        market._download_ohlc = lambda symbols, start, end: (time.sleep(quote_latency), _synthetic_ohlc(symbols, start, end))[1]
+        market._download_fx = lambda start, end: (time.sleep(quote_latency), _synthetic_ohlc(["KRW=X"], start, end).set_index("Date")["Close"] * 13)[1]
+
+    def close(self):
+        self.kis.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+# =========================================================
+# [2] 시나리오 (setup 은 측정 밖, run 만 측정)
+# =========================================================
+def _render_inputs():
+    # main 의 계산 구간: 원장 -> timeline -> 시세 -> 종목 지표 -> KPI
+    df_trade, df_money, df_domestic = dash.load_data()
+    _, _, cur_bal, dom_cash, cur_rate, _, portfolio = dash.ledger_cached("timeline", lambda: dash.compute_timeline(df_trade, df_money, df_domestic))
+    prices = market.get_prices({tk: (d['raw_ticker'], d['is_domestic']) for tk, d in portfolio.items()})
+    m = metrics_engine.get_metrics(dash._ledger()['version'], portfolio, prices, 1400.0)
+    return metrics_engine.summarize(m, cur_bal, cur_rate, dom_cash, 1400.0, 1e8, 1e7)
+
+def _reset_process():
+    # 새 프로세스와 같은 상태 (디스크 캐시는 유지)
+    dash.reset_ledger()
+    metrics_engine._memo.clear()
+
+def scenario_cold_load(env, i):
+    def setup():
+        _reset_process()
+        shutil.rmtree(db.SNAPSHOT_DIR, ignore_errors=True)
+    return setup, dash.load_data
+
+def scenario_warm_start(env, i):
+    # 디스크 스냅샷 + timeline 체크포인트가 있는 상태에서 첫 화면 계산
+    return _reset_process, _render_inputs
+
+def scenario_warm_rerun(env, i):
+    return None, _render_inputs
+
+def scenario_save_rerun(env, i):
+    # 수기 입력 1건 저장 후 다시 그릴 때까지 (시트 재다운로드 없이)
+    def run():
+        df_trade, df_money, _ = dash.load_data()
+        row = [datetime.now().strftime("%Y-%m-%d"), dash.next_order_id(df_trade, df_money), "Dividend", "O", 0, 1.0 + i / 100, 0, "", "", "bench"]
+        dash.write_sheet_rows(env.sheet, {"Money_Log": [row]})
+        return _render_inputs()
+    return None, run
+
+def scenario_sheet_edit(env, i):
+    # 시트에서 꼬리 창보다 앞쪽 행을 직접 수정/삭제한 뒤 새 프로세스로 다시 읽기: 바뀐 값이 바로 보여야 함
+    # timeline 도 체크포인트를 그대로 쓰지 않고 바뀐 원장 기준으로 (체크포인트 없이 계산한 결과와 같아야 함)
+    ws = env.sheet.worksheet("Trade_Log")
+    qty = str(1000 + i)
+    def setup():
+        _render_inputs()
+        if i % 2: del ws.values[10]
+        else: ws.values[10][dash.LOG_COLUMNS["Trade_Log"].index("Qty")] = qty
+        env.sheet._touch()
+        _reset_process()
+    def run():
+        frames = dash.load_data()
+        assert len(frames[0]) == len(ws.values) - 1, (len(frames[0]), len(ws.values) - 1)
+        if not i % 2: assert float(frames[0]["Qty"].iloc[9]) == float(qty), frames[0]["Qty"].iloc[9]
+        out = dash.compute_timeline(*frames)
+        assert out[2:7] == engine.process_timeline(*frames, dash.DOMESTIC_TICKER_MAP)[2:7], "stale timeline checkpoint"
+        return out
+    return setup, run
+
+def scenario_import(env, i, n_messages=2_000):
+    text = make_messages(n_messages, seed=100 + i)
+    def run():
+        items = dash.parse_kakaotalk_final(text, datetime(2026, 2, 4))
+        df_trade, df_money, df_domestic = dash.load_data()
+        rows = dash.build_sheet_rows(items, dash.next_order_id(df_trade, df_money), dash.log_indexes(df_trade, df_money, df_domestic))
+        return dash.write_sheet_rows(env.sheet, rows)
+    return None, run
+
+def scenario_refresh(env, i):
+    # 새로고침 버튼의 시세 부분: 무효화 + 백그라운드 갱신 깨우기 -> 보유 종목 전체가 다시 받아질 때까지 (해외 KIS 병렬 + 국내 일괄)
+    def run():
+        asked = time.time()
+        market.expire_prices()
+        cache = market._price_cache
+        while any(e['seen'] and e['price'] and e['ts'] < asked for e in list(cache.entries.values())):
+            assert time.time() - asked < 30, "price refresher did not wake"
+            time.sleep(0.01)
+    return None, run
+
+def scenario_kis_sync(env, i):
+    # KIS 체결내역 동기화 (첫 회는 확정 구간 전체 조회, 이후는 날짜 캐시 + 미결제 꼬리만) -> 기존 기록 대조 -> 새 체결 자동 추가 + 확인 필요분 추가
+    def run():
+        df_trade, df_money, df_domestic = dash.load_data()
+        dash.start_kis_fetch(env.sheet, df_trade, force=True, wait=True)
+        df_trade, df_money, df_domestic = dash.load_data()
+        _, rows = dash.kis_pending_rows(df_trade, df_money, df_domestic)
+        return dash.write_sheet_rows(env.sheet, rows)
+    return None, run
+
+def scenario_kis_history(env, i):
+    # 확정 구간을 두 번에 나눠 조회 (앞 구간 캐시 후 뒤 구간만 조회): 구간 끝 매매일의 체결(결제일은 구간 뒤)이 빠지지 않아야 함
+    end = datetime.now() - pd.Timedelta(days=kis.SETTLED_AFTER_DAYS + 1)
+    start, mid = end - pd.Timedelta(days=60 + i), end - pd.Timedelta(days=20 + i)
+    start, mid, end = start.strftime("%Y%m%d"), mid.strftime("%Y%m%d"), end.strftime("%Y%m%d")
+    def _trades(s, e):
+        return sorted(json.dumps(item, sort_keys=True) for item in kis.iter_trade_history(s, e, include_present=False))
+    def setup():
+        if os.path.exists(kis._trade_day_cache_path()): os.remove(kis._trade_day_cache_path())
+    def run():
+        first = _trades(start, mid)
+        split = _trades(start, end)
+        os.remove(kis._trade_day_cache_path())
+        whole = _trades(start, end)
+        assert split == whole and set(first) <= set(whole), (len(split), len(whole))
+        assert all(start <= json.loads(t)['trad_dt'] <= mid for t in first), "trades outside the queried run"
+    return setup, run
+
+def _nav_history():
+    # 자산 추이 탭: 일별 상태(원장 버전 기준) + 로컬 과거 시세 + 벡터 평가
+    df_trade, df_money, df_domestic = dash.load_data()
+    today = datetime.now().strftime("%Y-%m-%d")
+    state = dash.ledger_cached(("nav_state", today), lambda: history_engine.daily_state(df_trade, df_money, df_domestic, dash.DOMESTIC_TICKER_MAP))
+    return history_engine.get_nav_history((dash._ledger()['version'], today), state, {}, 1400.0)
+
+def scenario_nav_cold(env, i):
+    # 과거 시세 보관분 없음 + 원장 파생값 없음 (첫 실행)
+    def setup():
+        _reset_process()
+        history_engine._memo.clear()
+        dash.load_data()
+        for path in (market.PRICE_HISTORY_PATH, market.PRICE_HISTORY_META_PATH, market.FX_HISTORY_PATH, market.FX_HISTORY_META_PATH):
+            if os.path.exists(path): os.remove(path)
+    return setup, _nav_history
+
+def scenario_nav_state(env, i):
+    # 원장만 바뀜 (저장 직후): 일별 상태 재계산 + 로컬 시세 재사용
+    def setup():
+        _reset_process()
+        history_engine._memo.clear()
+        dash.load_data()
+    return setup, _nav_history
+
+def scenario_nav_warm(env, i):
+    return None, _nav_history
+
+def scenario_nav_future(env, i):
+    # 미래 날짜로 미리 적은 행(국내 입금 + 배당)이 있는 원장: 날짜 축이 그날까지 늘어나고 자산 추이/양도세가 그대로 동작
+    future = (datetime.now() + pd.Timedelta(days=30 + i)).strftime("%Y-%m-%d")
+    def setup():
+        df_trade, df_money, _ = dash.load_data()
+        dash.write_sheet_rows(env.sheet, {
+            "Domestic_Log": [[future, "Deposit", "-", "-", 0, 0, 1_000_000.0, "bench"]],
+            "Money_Log": [[future, dash.next_order_id(df_trade, df_money), "Dividend", "O", 0, 1.0, 0, "", "", "bench"]]})
+    def run():
+        nav = _nav_history()
+        state = _nav_state()
+        assert state['days'][-1] >= pd.Timestamp(future) and nav.index[-1] == state['days'][-1], (state['days'][-1], future)
+        return tax_engine.build_lots(state, history_engine.daily_fx(state))
+    return setup, run
+
+def scenario_nav_engine(env, i):
+    # 국내 원장 행이 날짜순이 아니고(같은 날 매도가 매수보다 먼저, 과거 날짜 행이 끝에) 날짜 없는 행도 있을 때:
+    # 일별 상태의 마지막 날 = 엔진 결과 (엔진과 같은 처리 순서/행)
+    day = (datetime.now() - pd.Timedelta(days=3 + i)).strftime("%Y-%m-%d")
+    def setup():
+        dash.write_sheet_rows(env.sheet, {"Domestic_Log": [
+            [day, "Sell", "458730", "-", 5, 12_000, 60_000.0, "bench"],
+            [day, "Buy", "458730", "-", 10, 11_000, 110_000.0, "bench"],
+            ["2016-01-04", "Dividend", "458730", "-", 0, 0, 1_234.0, "bench"],
+            ["", "Deposit", "-", "-", 0, 0, 50_000.0, "bench"]]})
+    def run():
+        df_trade, df_money, df_domestic = dash.load_data()
+        state = _nav_state()
+        _, _, cur_bal, dom_cash, cur_rate, _, portfolio = engine.process_timeline(df_trade, df_money, df_domestic, dash.DOMESTIC_TICKER_MAP)
+        assert (state['usd_cash'][-1], state['krw_cash'][-1], state['avg_rate'][-1]) == (cur_bal, dom_cash, cur_rate), "cash mismatch"
+        for c, tk in enumerate(state['keys']):
+            got = (state['qty'][-1, c], state['invested_krw'][-1, c], state['invested_usd'][-1, c])
+            assert got == tuple(portfolio[tk][f] for f in ('qty', 'invested_krw', 'invested_usd')), (tk, got)
+        return state
+    return setup, run
+
+def scenario_returns(env, i):
+    # XIRR(포트폴리오 + 종목별 한 번에) + TWR, 메모 없이 (원장이 바뀐 직후와 같음)
+    def setup():
+        returns_engine._memo.clear()
+        _nav_history()
+    def run():
+        nav = _nav_history()
+        state = dash.ledger_cached(("nav_state", datetime.now().strftime("%Y-%m-%d")), lambda: None)
+        return returns_engine.get_returns(dash._ledger()['version'], state, nav, {tk: 1e6 for tk in state['keys']})
+    return setup, run
+
+def _nav_state():
+    df_trade, df_money, df_domestic = dash.load_data()
+    today = datetime.now().strftime("%Y-%m-%d")
+    return dash.ledger_cached(("nav_state", today), lambda: history_engine.daily_state(df_trade, df_money, df_domestic, dash.DOMESTIC_TICKER_MAP))
+
+def scenario_tax_lots(env, i):
+    # FIFO 로트 + 연도별 표 전체 생성 (원장이 바뀐 직후, 매매일 환율 기준)
+    state = _nav_state()
+    fx = history_engine.daily_fx(state)
+    return None, lambda: tax_engine.build_lots(state, fx)
+
+def scenario_tax_query(env, i, n_queries=1_000):
+    # 연도별 세액 + 가상 매도 조회 (미리 만든 표만 사용)
+    book = tax_engine.build_lots(_nav_state())
+    tickers = [tk for tk, (cum_qty, _, _) in book['open'].items() if len(cum_qty)] or ['O']
+    def run():
+        for k in range(n_queries):
+            tax_engine.what_if_sell(book, tickers[k % len(tickers)], 10 + k % 50, 100.0, 1400.0, 2020 + k % 6)
+    return None, run
+
+SCENARIOS = {
+    "cold_load": scenario_cold_load,
+    "warm_start": scenario_warm_start,
+    "warm_rerun": scenario_warm_rerun,
+    "save_rerun": scenario_save_rerun,
+    "sheet_edit": scenario_sheet_edit,
+    "import": scenario_import,
+    "refresh": scenario_refresh,
+    "kis_sync": scenario_kis_sync,
+    "kis_history": scenario_kis_history,
+    "nav_cold": scenario_nav_cold,
+    "nav_state": scenario_nav_state,
+    "nav_warm": scenario_nav_warm,
+    "nav_future": scenario_nav_future,
+    "nav_engine": scenario_nav_engine,
+    "returns": scenario_returns,
+    "tax_lots": scenario_tax_lots,
+    "tax_query": scenario_tax_query,
+}
+
+# =========================================================
+# [3] 실행 / 백분위 리포트 / 기준치 비교
+# =========================================================
+def _percentiles(samples):
+    arr = np.array(samples) * 1000
+    return {"n": len(arr), "p50": float(np.percentile(arr, 50)), "p90": float(np.percentile(arr, 90)),
+            "p99": float(np.percentile(arr, 99)), "max": float(arr.max())}
+
+def run_scenario(env, name, repeat):
+    samples = []
+    for i in range(repeat):
+        setup, run = SCENARIOS[name](env, i)
+        if setup: setup()
+        t0 = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - t0)
+    return _percentiles(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description="오프라인 벤치마크: 합성 원장 + 로컬 시트/KIS 대역")
+    parser.add_argument("--sizes", default="1k,100k", help="쉼표 구분 (1k,100k,1M)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--sheets-latency-ms", type=float, default=150)
+    parser.add_argument("--kis-latency-ms", type=float, default=40)
+    parser.add_argument("--quote-latency-ms", type=float, default=300, help="국내 시세(yfinance) 대역 지연")
+    parser.add_argument("--json", help="결과 저장 경로")
+    parser.add_argument("--baseline", help="이전 --json 결과. p50 이 tolerance 이상 느려지면 실패")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'scenario':<12}{'size':>6}{'n':>4}{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}{'max ms':>11}")
+    for size in args.sizes.split(","):
+        n_rows = SIZES[size]
+        # 1M 은 반복 횟수를 줄임
+        repeat = args.repeat if n_rows <= 100_000 else max(2, args.repeat // 3)
+        env = Env(n_rows, args.sheets_latency_ms / 1000, args.kis_latency_ms / 1000, args.quote_latency_ms / 1000)
+        try:
+            for name in args.scenarios.split(","):
+                r = run_scenario(env, name, repeat)
+                results[f"{name}/{size}"] = r
+                print(f"{name:<12}{size:>6}{r['n']:>4}{r['p50']:>11,.1f}{r['p90']:>11,.1f}{r['p99']:>11,.1f}{r['max']:>11,.1f}")
+            print(f"{'':<12}{size:>6}  sheets calls {dict(env.sheet.calls)}  kis calls {dict(env.kis.calls)}")
+        finally:
+            env.close()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = [(k, baseline[k]['p50'], r['p50']) for k, r in results.items()
+                       if k in baseline and r['p50'] > baseline[k]['p50'] * (1 + args.tolerance)]
+        for k, old, new in regressions:
+            print(f"REGRESSION {k}: p50 {old:,.1f} -> {new:,.1f} ms")
+        if regressions: sys.exit(1)
+
+if __name__ == "__main__":
+    main()
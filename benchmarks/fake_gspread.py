@@ -0,0 +1,83 @@
+import re
+import time
+import threading
+from collections import Counter
+
+# =========================================================
+# gspread 대역 (Dashboard / Sheet_DB_Manager / KIS 토큰 저장소가 쓰는 메서드만)
+#   - 값은 시트 API 처럼 문자열, 행 끝의 빈 칸은 잘라서 반환
+#   - API 호출마다 latency 초 지연, 메서드별 호출 수 집계
+# =========================================================
+_RANGE = re.compile(r"^'?(?P<name>[^'!]+)'?(?:!(?P<col>[A-Z]+)(?P<row>\d+)(?::[A-Z]+\d*)?)?$")
+
+def _cell(v):
+    return "" if v is None else str(v)
+
+def _trim(row):
+    row = list(row)
+    while row and row[-1] == "": row.pop()
+    return row
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, values=None):
+        self.spreadsheet, self.title = spreadsheet, title
+        self.values = [[_cell(v) for v in row] for row in (values or [])]
+
+    def append_rows(self, rows, value_input_option="RAW", **kwargs):
+        self.spreadsheet._call("append_rows")
+        self.values.extend([_cell(v) for v in row] for row in rows)
+        self.spreadsheet._touch()
+        return {"updates": {"updatedRows": len(rows)}}
+
+    def get(self, range_name=None, **kwargs):
+        # 토큰 저장소(A1:B1) 용
+        self.spreadsheet._call("get")
+        return [_trim(self.values[0][:2])] if self.values else []
+
+    def update(self, range_name=None, values=None, **kwargs):
+        self.spreadsheet._call("update")
+        if not self.values: self.values.append([])
+        self.values[0] = [_cell(v) for v in values[0]] + self.values[0][len(values[0]):]
+        self.spreadsheet._touch()
+
+class FakeSpreadsheet:
+    def __init__(self, sheets=None, latency=0.0):
+        # sheets: {시트명: [header, row, ...]}
+        self.latency = latency
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.revision = 0
+        self._sheets = {name: FakeWorksheet(self, name, values) for name, values in (sheets or {}).items()}
+
+    def _call(self, name):
+        with self.lock: self.calls[name] += 1
+        if self.latency: time.sleep(self.latency)
+
+    def _touch(self):
+        with self.lock: self.revision += 1
+
+    def add_worksheet(self, title, values=None):
+        self._sheets[title] = FakeWorksheet(self, title, values)
+        return self._sheets[title]
+
+    def worksheets(self):
+        self._call("worksheets")
+        return list(self._sheets.values())
+
+    def worksheet(self, title):
+        self._call("worksheet")
+        return self._sheets[title]
+
+    def get_lastUpdateTime(self):
+        self._call("get_lastUpdateTime")
+        return f"rev-{self.revision}"
+
+    def values_batch_get(self, ranges, **kwargs):
+        self._call("values_batch_get")
+        out = []
+        for rng in ranges:
+            m = _RANGE.match(rng)
+            ws = self._sheets[m.group("name")]
+            start = int(m.group("row")) - 1 if m.group("row") else 0
+            out.append({"range": rng, "values": [_trim(r) for r in ws.values[start:]]})
+        return {"valueRanges": out}
@@ -0,0 +1,108 @@
+import json
+import time
+import zlib
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# =========================================================
+# 로컬 KIS REST 서버 대역 (토큰 / 해외 현재가 / 기간별 체결 / 체결기준잔고)
+#   - 호출마다 latency 초 지연, 경로별 호출 수 집계
+# =========================================================
+TICKERS = ['O', 'JEPI', 'JEPQ', 'SCHD', 'GOOGL', 'NVDA', 'AMD', 'TSM', 'MSFT', 'PLD']
+
+def _stable(s, lo, hi):
+    return lo + (zlib.crc32(s.encode()) % 10_000) / 10_000 * (hi - lo)
+
+def _weekdays_after(day, n):
+    # 매매일 trad_dt -> 결제일 dt (주말 제외 n 일 뒤, 실제 API 처럼 ORD_DT_E 를 넘을 수 있음)
+    while n:
+        day += timedelta(days=1)
+        if day.weekday() < 5: n -= 1
+    return day
+
+class KisHttpStandIn:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, page_size=100, trades_per_day=3, exchanges=None):
+        self.latency, self.page_size, self.trades_per_day = latency, page_size, trades_per_day
+        self.exchanges = exchanges or {}   # {ticker: EXCD}, 없으면 NAS
+        self.calls = Counter()
+        self.tokens_issued = 0
+        self.lock = threading.Lock()
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            def log_message(self, *args): pass
+            def do_GET(self): standin._dispatch(self, "GET")
+            def do_POST(self): standin._dispatch(self, "POST")
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _dispatch(self, req, method):
+        url = urlparse(req.path)
+        query = {k: v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        if method == "POST":
+            req.rfile.read(int(req.headers.get("Content-Length", 0) or 0))
+        with self.lock: self.calls[url.path] += 1
+        if self.latency: time.sleep(self.latency)
+
+        headers = {}
+        if url.path == "/oauth2/tokenP":
+            with self.lock:
+                self.tokens_issued += 1
+                body = {"access_token": f"standin-token-{self.tokens_issued}", "token_type": "Bearer", "expires_in": 86400}
+        elif url.path == "/oauth2/Approval":
+            body = {"approval_key": "standin-approval-key"}
+        elif url.path.endswith("/quotations/price"):
+            body = self._price(query)
+        elif url.path.endswith("/inquire-period-trans"):
+            body, headers["tr_cont"] = self._period_trans(query)
+        elif url.path.endswith("/inquire-present-balance"):
+            body = {"rt_cd": "0", "output1": [{"pdno": tk, "prdt_name": tk, "thdt_buy_ccld_qty1": "0", "pchs_avg_pric": "100"} for tk in TICKERS]}
+        else:
+            req.send_response(404)
+            req.send_header("Content-Length", "0")
+            req.end_headers()
+            return
+
+        data = json.dumps(body).encode()
+        req.send_response(200)
+        req.send_header("Content-Type", "application/json")
+        req.send_header("Content-Length", str(len(data)))
+        for k, v in headers.items(): req.send_header(k, v)
+        req.end_headers()
+        req.wfile.write(data)
+
+    def _price(self, q):
+        symb, excd = q.get("SYMB", ""), q.get("EXCD", "")
+        if excd != self.exchanges.get(symb, "NAS"):
+            return {"rt_cd": "1", "msg_cd": "APBK0000", "msg1": "종목 없음", "output": {"last": ""}}
+        return {"rt_cd": "0", "msg_cd": "MCA00000", "msg1": "정상처리", "output": {"last": f"{_stable(symb, 20, 900):.4f}"}}
+
+    def _period_trans(self, q):
+        start, end = datetime.strptime(q["ORD_DT_S"], "%Y%m%d"), datetime.strptime(q["ORD_DT_E"], "%Y%m%d")
+        items, day = [], start
+        while day <= end:
+            # ORD_DT_S/E 는 매매일로 거름, dt 는 결제일
+            if day.weekday() < 5:
+                trad_dt = day.strftime("%Y%m%d")
+                for i in range(self.trades_per_day):
+                    tk = TICKERS[zlib.crc32(f"{trad_dt}{i}".encode()) % len(TICKERS)]
+                    items.append({"dt": _weekdays_after(day, 2).strftime("%Y%m%d"), "trad_dt": trad_dt, "pdno": tk, "ovrs_item_name": tk, "sll_buy_dvsn_cd": "02" if i % 3 else "01",
+                                  "ccld_qty": str(1 + i), "ovrs_stck_ccld_unpr": f"{_stable(trad_dt + tk, 20, 900):.2f}"})
+            day += timedelta(days=1)
+        offset = int(q.get("CTX_AREA_NK100") or 0)
+        page = items[offset:offset + self.page_size]
+        more = offset + self.page_size < len(items)
+        body = {"rt_cd": "0", "msg_cd": "KIOK0000", "msg1": "조회완료", "output1": page,
+                "ctx_area_fk100": "", "ctx_area_nk100": str(offset + self.page_size) if more else ""}
+        return body, "M" if more else "D"
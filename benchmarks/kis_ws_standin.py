@@ -0,0 +1,93 @@
+import json
+import time
+import random
+import threading
+from websockets.sync.server import serve
+
+# =========================================================
+# 로컬 KIS 실시간 시세 서버 대역 (HDFSCNT0 형식 + PINGPONG + 구독 응답)
+# =========================================================
+FIELD_COUNT = 26
+
+def tick_record(tr_key, price, base):
+    # RSYM^SYMB^ZDIV^TYMD^XYMD^XHMS^KYMD^KHMS^OPEN^HIGH^LOWE^LAST^SIGN^DIFF^RATE^... (26개)
+    diff = price - base
+    rec = [tr_key, tr_key[4:], "4", "20260203", "20260203", "093000", "20260203", "233000",
+           f"{base:.4f}", f"{max(price, base):.4f}", f"{min(price, base):.4f}", f"{price:.4f}",
+           "2" if diff >= 0 else "5", f"{abs(diff):.4f}", f"{diff / base * 100:.2f}"]
+    return rec + ["0"] * (FIELD_COUNT - len(rec))
+
+class StandInServer:
+    def __init__(self, host="127.0.0.1", port=0, tick_interval=0.01, ping_interval=0.5, batch=3, seed=0):
+        self.tick_interval, self.ping_interval, self.batch = tick_interval, ping_interval, batch
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.last_price = {}       # {tr_key: 마지막으로 보낸 가격}
+        self.base = {}
+        self.subscribed = set()
+        self.sub_log = []          # [(tr_type, tr_key)]
+        self.pongs = 0
+        self.sent_ticks = 0
+        self.connections = 0
+        self.drop_after = None     # 이만큼 보내면 연결 끊기 (재접속 확인용)
+        self.paused = False
+        self.server = serve(self._handler, host, port)
+        self.port = self.server.socket.getsockname()[1]
+        self.url = f"ws://{host}:{self.port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+    def _handler(self, ws):
+        with self.lock:
+            self.connections += 1
+            self.subscribed = set()
+        stop = threading.Event()
+        threading.Thread(target=self._pusher, args=(ws, stop), daemon=True).start()
+        try:
+            for msg in ws:
+                data = json.loads(msg)
+                header = data["header"]
+                if header.get("tr_id") == "PINGPONG":
+                    with self.lock: self.pongs += 1
+                    continue
+                tr_key = data["body"]["input"]["tr_key"]
+                with self.lock:
+                    self.sub_log.append((header["tr_type"], tr_key))
+                    if header["tr_type"] == "1": self.subscribed.add(tr_key)
+                    else: self.subscribed.discard(tr_key)
+                    self.base.setdefault(tr_key, self.rng.uniform(20, 800))
+                ws.send(json.dumps({"header": {"tr_id": data["body"]["input"]["tr_id"], "tr_key": tr_key, "encrypt": "N"},
+                                    "body": {"rt_cd": "0", "msg_cd": "OPSP0000", "msg1": "SUBSCRIBE SUCCESS" if header["tr_type"] == "1" else "UNSUBSCRIBE SUCCESS"}}))
+        except Exception:
+            pass
+        finally:
+            stop.set()
+
+    def _pusher(self, ws, stop):
+        last_ping = time.monotonic()
+        try:
+            while not stop.is_set():
+                time.sleep(self.tick_interval)
+                if time.monotonic() - last_ping >= self.ping_interval:
+                    ws.send(json.dumps({"header": {"tr_id": "PINGPONG", "datetime": time.strftime("%Y%m%d%H%M%S")}}))
+                    last_ping = time.monotonic()
+                with self.lock:
+                    keys = sorted(self.subscribed)
+                    if not keys or self.paused: continue
+                    picked = [self.rng.choice(keys) for _ in range(self.rng.randint(1, self.batch))]
+                    fields = []
+                    for tr_key in picked:
+                        price = round(self.base[tr_key] * (1 + self.rng.uniform(-0.02, 0.02)), 4)
+                        self.last_price[tr_key] = price
+                        fields += tick_record(tr_key, price, self.base[tr_key])
+                    self.sent_ticks += len(picked)
+                    drop = self.drop_after is not None and self.sent_ticks >= self.drop_after
+                    if drop: self.drop_after = None
+                ws.send(f"0|HDFSCNT0|{len(picked):03d}|" + "^".join(fields))
+                if drop:
+                    ws.close()
+                    return
+        except Exception:
+            pass